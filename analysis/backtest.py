@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+SIGNAL_RULES = ('zscore', 'tp_sl', 'hold')
+TRADING_DAYS = 252
+
+
+def _forward_fill(values: np.ndarray) -> np.ndarray:
+    """ Forward fills NaNs along axis 0, leading NaNs become 0. """
+    positions = np.arange(values.shape[0]).reshape((-1,) + (1,) * (values.ndim - 1))
+    last_valid = np.where(np.isnan(values), 0, positions)
+    last_valid = np.maximum.accumulate(last_valid, axis=0)
+    filled = np.take_along_axis(values, last_valid, axis=0)
+    return np.nan_to_num(filled, nan=0.0)
+
+
+def zscore_signal(z_score, entry: float = 1.0) -> np.ndarray:
+    """ Long (1) below -entry, short (-1) above entry, flat (0) in between, decided bar by bar. """
+    z_score = np.asarray(z_score, dtype=float)
+    return np.select([z_score < -entry, z_score > entry], [1, -1], 0)
+
+
+def tp_sl_signal(combined_return, z_score, tp: float, sl: float, entry: float = 1.0) -> np.ndarray:
+    """ Long when the combined return is above tp or the z-score below -entry, short when the combined return is
+    below sl or the z-score above entry, flat otherwise. The long test wins when both hold. """
+    combined_return = np.asarray(combined_return, dtype=float)
+    z_score = np.asarray(z_score, dtype=float)
+    return np.select([(combined_return > tp) | (z_score < -entry), (combined_return < sl) | (z_score > entry)],
+                     [1, -1], 0)
+
+
+def hold_until_reversion_signal(z_score, entry: float = 1.0, exit: float = 0.0) -> np.ndarray:
+    """
+    Enters long when the z-score drops below -entry and holds until it recovers to -exit, enters short above entry
+    and holds until it falls back to exit. The state is carried by forward filling entry and exit events rather
+    than a per-bar loop. Any entry also closes the opposite side, so long and short never overlap.
+    """
+    z_score = np.asarray(z_score, dtype=float)
+    long_events = np.where(z_score < -entry, 1.0, np.where(z_score >= -exit, 0.0, np.nan))
+    short_events = np.where(z_score > entry, 1.0, np.where(z_score <= exit, 0.0, np.nan))
+    return (_forward_fill(long_events) - _forward_fill(short_events)).astype(int)
+
+
+def strategy_returns(signal, stock_1_forward_return, stock_2_forward_return, hedge_ratio) -> np.ndarray:
+    """ Next bar return of holding signal units of stock_1 against hedge_ratio units of stock_2. """
+    signal = np.asarray(signal, dtype=float)
+    return signal * (np.asarray(stock_1_forward_return, dtype=float) -
+                     np.asarray(stock_2_forward_return, dtype=float) * np.asarray(hedge_ratio, dtype=float))
+
+
+def cumulative_returns(returns) -> np.ndarray:
+    """ Compounded equity curve starting from 1. """
+    return np.exp(np.log1p(np.asarray(returns, dtype=float)).cumsum(axis=0))
+
+
+def performance_metrics(returns, signal, periods_per_year: int = TRADING_DAYS) -> dict:
+    """
+    Summarises a strategy return series along axis 0. For 2-D input every column is a separate strategy and each
+    metric is an array with one value per column.
+
+    Returns:
+    dict: total_return, sharpe (annualised), max_drawdown (negative fraction of peak equity),
+    turnover (mean absolute change in position per bar) and trades (number of position changes).
+    """
+    returns = np.asarray(returns, dtype=float)
+    signal = np.asarray(signal, dtype=float)
+    equity = cumulative_returns(returns)
+    volatility = returns.std(axis=0, ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(volatility > 0, returns.mean(axis=0) / volatility * np.sqrt(periods_per_year), 0.0)
+    position_changes = np.abs(np.diff(signal, axis=0, prepend=0))
+    return {
+        'total_return': equity[-1] - 1,
+        'sharpe': sharpe,
+        'max_drawdown': (equity / np.maximum.accumulate(equity, axis=0) - 1).min(axis=0),
+        'turnover': position_changes.mean(axis=0),
+        'trades': (position_changes > 0).sum(axis=0),
+    }
+
+
+def run_backtest(metrics_df: pd.DataFrame, rule: str = 'zscore', tp: float = None, sl: float = None,
+                 entry: float = 1.0, exit: float = 0.0,
+                 periods_per_year: int = TRADING_DAYS) -> (pd.DataFrame, dict):
+    """
+    Backtests a pair on the output of collect_metrics_for_pair using array operations only.
+
+    Args:
+    metrics_df (pd.DataFrame): Output of collect_metrics_for_pair.
+    rule (str): 'zscore' for the +-entry z-score rule, 'tp_sl' to also act on the combined return crossing tp/sl,
+        'hold' to hold each position until the z-score reverts to +-exit.
+    tp (float): Take profit threshold on the combined return, used by the 'tp_sl' rule.
+    sl (float): Stop loss threshold on the combined return, used by the 'tp_sl' rule.
+    entry (float): Absolute z-score that opens a position.
+    exit (float): Absolute z-score that closes a position under the 'hold' rule.
+    periods_per_year (int): Bars per year used to annualise the Sharpe ratio.
+
+    Returns:
+    (pd.DataFrame, dict): The bars with signal, strategy_return and cumulative_return columns added, and the
+    performance_metrics of the strategy.
+    """
+    if rule not in SIGNAL_RULES:
+        raise ValueError(f"rule must be one of {SIGNAL_RULES}, got {rule!r}")
+    stock_1, stock_2 = metrics_df.columns[0], metrics_df.columns[1]
+    backtest_df = metrics_df.dropna().copy()
+    z_score = backtest_df['z_score'].to_numpy()
+
+    if rule == 'tp_sl':
+        backtest_df['combined_return'] = (backtest_df[f'{stock_1}_return'] +
+                                          backtest_df[f'{stock_2}_return'] * backtest_df['hedge_ratio'])
+        backtest_df['signal'] = tp_sl_signal(backtest_df['combined_return'], z_score, tp, sl, entry=entry)
+    elif rule == 'hold':
+        backtest_df['signal'] = hold_until_reversion_signal(z_score, entry=entry, exit=exit)
+    else:
+        backtest_df['signal'] = zscore_signal(z_score, entry=entry)
+
+    backtest_df['strategy_return'] = strategy_returns(backtest_df['signal'],
+                                                      backtest_df[f'{stock_1}_forward_return'],
+                                                      backtest_df[f'{stock_2}_forward_return'],
+                                                      backtest_df['hedge_ratio'])
+    backtest_df['cumulative_return'] = cumulative_returns(backtest_df['strategy_return'])
+    metrics = {name: float(value) for name, value in
+               performance_metrics(backtest_df['strategy_return'], backtest_df['signal'], periods_per_year).items()}
+    return backtest_df, metrics
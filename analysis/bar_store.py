@@ -0,0 +1,249 @@
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Directory Path Setup
+""" Set up the directory path for the script and adjust sys.path for module imports. """
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+DEFAULT_BAR_STORE_DIR = os.environ.get('PAIRS_BAR_STORE_DIR', os.path.join(root_dir, '.bar_store'))
+# How each field is aggregated when bars are resampled to a coarser interval
+FIELD_AGGREGATIONS = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Adj Close': 'last',
+                      'Volume': 'sum'}
+# Rows resampled at a time, about 50 MB with all six fields
+DEFAULT_CHUNK_ROWS = 1_000_000
+
+
+class BarStore:
+    """
+    A columnar store of bars of any interval, down to minute bars, on memory-mapped files. Every ticker has a
+    directory holding its timestamps, 'index.i8' as int64 nanoseconds in ascending order, and one 'float64' file
+    per field, '<field>.f8', all the same length. Reads map the files and slice them by searching the timestamps,
+    so a time range slice is a view of the file and nothing is loaded until it is used. Bars appended after the
+    last stored timestamp are written to the end of the files without rewriting them.
+    """
+
+    def __init__(self, root: str = DEFAULT_BAR_STORE_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+        self.meta_path = os.path.join(self.root, 'meta.json')
+        self.meta = self._load_meta()
+        self._maps = {}
+
+    def _load_meta(self) -> dict:
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r') as file:
+                return json.load(file)
+        return {}
+
+    def _save_meta(self):
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self.meta, file)
+        os.replace(tmp_path, self.meta_path)
+
+    def _dir(self, ticker: str) -> str:
+        return os.path.join(self.root, ticker)
+
+    def _path(self, ticker: str, column: str) -> str:
+        if column == 'index':
+            return os.path.join(self._dir(ticker), 'index.i8')
+        return os.path.join(self._dir(ticker), f'{column.replace(" ", "_")}.f8')
+
+    def _map(self, ticker: str, column: str) -> np.ndarray:
+        """ The read-only memory map of one column, mapped once per length of the ticker. """
+        length = self.meta[ticker]['length']
+        key = (ticker, column)
+        mapped = self._maps.get(key)
+        if mapped is None or len(mapped) != length:
+            dtype = np.int64 if column == 'index' else np.float64
+            if length == 0:
+                # An empty file cannot be mapped
+                return np.empty(0, dtype=dtype)
+            mapped = np.memmap(self._path(ticker, column), dtype=dtype, mode='r', shape=(length,))
+            self._maps[key] = mapped
+        return mapped
+
+    @property
+    def tickers(self) -> list:
+        return sorted(self.meta)
+
+    def fields(self, ticker: str) -> list:
+        return list(self.meta[ticker]['fields'])
+
+    def __contains__(self, ticker: str) -> bool:
+        return ticker in self.meta
+
+    def __len__(self) -> int:
+        return len(self.meta)
+
+    def write(self, ticker: str, bars: pd.DataFrame):
+        """
+        Stores bars indexed by timestamp with one column per field. Bars that all come after the last stored
+        timestamp, with the same fields, are appended to the files; anything else is merged with the stored bars,
+        the new bar winning on equal timestamps, and the ticker's files are rewritten.
+        """
+        bars = bars[~bars.index.duplicated(keep='last')].sort_index()
+        index = pd.DatetimeIndex(bars.index).as_unit('ns')
+        bars.index = index.tz_convert(None) if index.tz is not None else index
+        fields = list(bars.columns)
+        entry = self.meta.get(ticker)
+        if entry is None or entry['length'] == 0:
+            self._rewrite(ticker, bars)
+        elif (fields == entry['fields'] and len(bars)
+              and bars.index[0].value > int(self._map(ticker, 'index')[-1])):
+            self._append(ticker, bars)
+        else:
+            stored = self.read(ticker, fields=entry['fields'])
+            merged = pd.concat([stored, bars])
+            self._rewrite(ticker, merged[~merged.index.duplicated(keep='last')].sort_index())
+        self._save_meta()
+
+    def write_panel(self, bars: pd.DataFrame):
+        """ Stores every ticker of a panel with (field, ticker) MultiIndex columns, the layout of
+        download_prices, dropping the timestamps where a ticker has no bar at all. """
+        for ticker in bars.columns.get_level_values(1).unique():
+            self.write(ticker, bars.xs(ticker, axis=1, level=1).dropna(how='all'))
+
+    def _rewrite(self, ticker: str, bars: pd.DataFrame):
+        # Written next to the old files and swapped in, readers holding the old maps keep a consistent view
+        tmp_dir = self._dir(ticker) + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        bars.index.asi8.tofile(os.path.join(tmp_dir, 'index.i8'))
+        for field in bars.columns:
+            bars[field].to_numpy(dtype=np.float64).tofile(os.path.join(tmp_dir, f'{field.replace(" ", "_")}.f8'))
+        shutil.rmtree(self._dir(ticker), ignore_errors=True)
+        os.replace(tmp_dir, self._dir(ticker))
+        self._maps = {key: mapped for key, mapped in self._maps.items() if key[0] != ticker}
+        self.meta[ticker] = {'length': len(bars), 'fields': list(bars.columns)}
+
+    def _append(self, ticker: str, bars: pd.DataFrame):
+        # Fields first and the index last, a reader going by the old length never sees a partial bar
+        for field in bars.columns:
+            with open(self._path(ticker, field), 'ab') as file:
+                file.write(bars[field].to_numpy(dtype=np.float64).tobytes())
+        with open(self._path(ticker, 'index'), 'ab') as file:
+            file.write(bars.index.asi8.tobytes())
+        self.meta[ticker]['length'] += len(bars)
+
+    def delete(self, ticker: str):
+        shutil.rmtree(self._dir(ticker), ignore_errors=True)
+        self._maps = {key: mapped for key, mapped in self._maps.items() if key[0] != ticker}
+        self.meta.pop(ticker, None)
+        self._save_meta()
+
+    def _bounds(self, ticker: str, start=None, end=None) -> (int, int):
+        """ The row range of the bars at or after start and before end. """
+        index = self._map(ticker, 'index')
+        first = 0 if start is None else int(np.searchsorted(index, pd.Timestamp(start).value, side='left'))
+        last = len(index) if end is None else int(np.searchsorted(index, pd.Timestamp(end).value, side='left'))
+        return first, max(first, last)
+
+    def timestamps(self, ticker: str, start=None, end=None) -> pd.DatetimeIndex:
+        first, last = self._bounds(ticker, start, end)
+        return pd.DatetimeIndex(self._map(ticker, 'index')[first:last].view('datetime64[ns]'), name='Date')
+
+    def slice(self, ticker: str, field: str, start=None, end=None) -> np.ndarray:
+        """ The field's values between start (inclusive) and end (exclusive) as a read-only view of its file. """
+        first, last = self._bounds(ticker, start, end)
+        return self._map(ticker, field)[first:last]
+
+    def series(self, ticker: str, field: str, start=None, end=None) -> pd.Series:
+        """ Like slice, as a Series indexed by timestamp whose values are still a view of the file. A field the
+        ticker does not have is all NaN. """
+        first, last = self._bounds(ticker, start, end)
+        index = pd.DatetimeIndex(self._map(ticker, 'index')[first:last].view('datetime64[ns]'), name='Date')
+        if field not in self.meta[ticker]['fields']:
+            return pd.Series(np.nan, index=index, name=ticker)
+        return pd.Series(self._map(ticker, field)[first:last], index=index, name=ticker, copy=False)
+
+    def read(self, ticker: str, fields=None, start=None, end=None) -> pd.DataFrame:
+        """ The ticker's bars between start and end with one column per field, each a view of its file. """
+        fields = self.fields(ticker) if fields is None else list(fields)
+        return pd.concat({field: self.series(ticker, field, start, end) for field in fields}, axis=1)
+
+    def panel(self, tickers, start=None, end=None, fields=('Adj Close',), rule: str = None,
+              chunk_rows: int = DEFAULT_CHUNK_ROWS) -> pd.DataFrame:
+        """
+        Returns the requested fields of the tickers between start (inclusive) and end (exclusive), resampled to
+        rule (e.g. '1h' or '1D') if given, see resample.
+
+        When every ticker has every field and bars at the same timestamps, as minute bars of one exchange usually
+        do, the raw columns are views of the files and nothing is copied, which relies on the copy-on-write of
+        pandas 3. Otherwise the tickers are aligned on the
+        union of their timestamps, with NaN where a ticker has no bar or no such field, which copies them.
+
+        Returns:
+        pandas.DataFrame: Bars indexed by date with (field, ticker) MultiIndex columns, like download_prices.
+            Tickers that are not in the store are left out.
+        """
+        tickers = [ticker for ticker in dict.fromkeys(tickers) if ticker in self.meta]
+        fields = list(fields)
+        columns = pd.MultiIndex.from_product([fields, tickers])
+        if not tickers:
+            return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name='Date'), dtype=float)
+        if rule is not None:
+            frames = {ticker: self.resample(ticker, rule, fields=fields, start=start, end=end, chunk_rows=chunk_rows)
+                      for ticker in tickers}
+            prices_df = pd.concat(frames, axis=1).swaplevel(axis=1)
+            prices_df.index.name = 'Date'
+            return prices_df.reindex(columns=columns)
+
+        bounds = {ticker: self._bounds(ticker, start, end) for ticker in tickers}
+        indexes = {ticker: self._map(ticker, 'index')[first:last] for ticker, (first, last) in bounds.items()}
+        reference = indexes[tickers[0]]
+        has_fields = all(set(fields) <= set(self.meta[ticker]['fields']) for ticker in tickers)
+        if has_fields and all(len(index) == len(reference) and np.array_equal(index, reference)
+                              for index in indexes.values()):
+            shared_index = pd.DatetimeIndex(reference.view('datetime64[ns]'), name='Date')
+            series = [pd.Series(self._map(ticker, field)[slice(*bounds[ticker])], index=shared_index, copy=False)
+                      for field in fields for ticker in tickers]
+            return pd.concat(series, axis=1, keys=columns)
+        prices_df = pd.concat([self.series(ticker, field, start, end) for field in fields for ticker in tickers],
+                              axis=1, keys=columns)
+        prices_df.index.name = 'Date'
+        return prices_df
+
+    def resample(self, ticker: str, rule: str, fields=None, start=None, end=None,
+                 chunk_rows: int = DEFAULT_CHUNK_ROWS) -> pd.DataFrame:
+        """
+        Resamples the ticker's bars between start and end to a coarser interval, e.g. minute bars to '1h' or '1D'
+        bars, aggregating each field as in FIELD_AGGREGATIONS (the last value for fields not listed there).
+
+        The bars are read chunk_rows at a time, so only one chunk is in memory besides the result. Bins are
+        aligned to the epoch or the calendar, so a bin split across two chunks is aggregated from both, and
+        intervals without any bar (nights, weekends) are left out.
+        """
+        fields = self.fields(ticker) if fields is None else list(fields)
+        aggregations = {field: FIELD_AGGREGATIONS.get(field, 'last') for field in fields}
+        first, last = self._bounds(ticker, start, end)
+        index = self._map(ticker, 'index')
+        # A field the ticker does not have is all NaN, as in series
+        columns = {field: self._map(ticker, field) if field in self.meta[ticker]['fields'] else None
+                   for field in fields}
+        # Calendar rules ('1D', 'W') already bin the same way in every chunk, fixed ones need a common origin
+        origin = 'epoch' if isinstance(pd.tseries.frequencies.to_offset(rule), pd.offsets.Tick) else 'start_day'
+        chunks = []
+        for chunk_start in range(first, last, chunk_rows):
+            chunk_end = min(chunk_start + chunk_rows, last)
+            chunk = pd.DataFrame({field: np.nan if values is None else values[chunk_start:chunk_end]
+                                  for field, values in columns.items()},
+                                 index=pd.DatetimeIndex(index[chunk_start:chunk_end].view('datetime64[ns]')))
+            bins = chunk.resample(rule, origin=origin)
+            # An empty bin has no bars, unlike a bin whose bars are all NaN
+            chunks.append(bins.agg(aggregations)[bins.size() > 0])
+        if not chunks:
+            return pd.DataFrame(columns=fields, index=pd.DatetimeIndex([], name='Date'), dtype=float)
+        resampled = pd.concat(chunks)
+        if resampled.index.has_duplicates:
+            resampled = resampled.groupby(level=0).agg(aggregations)
+        resampled.index.name = 'Date'
+        return resampled
+
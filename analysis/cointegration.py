@@ -0,0 +1,268 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+from statsmodels.tsa.adfvalues import _tau_maxs, _tau_mins, _tau_stars, _tau_smallps, _tau_largeps
+from statsmodels.tsa.stattools import coint
+
+# Directory Path Setup
+""" Set up the directory path for the script and adjust sys.path for module imports. """
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+# Custom Module Imports
+from utils.ProgressBar import print_progress_bar
+
+COINT_ENGINES = ('serial', 'parallel', 'batch', 'sharded')
+
+# Same collinearity cut off statsmodels.coint applies to the cointegrating regression
+SQRTEPS = np.sqrt(np.finfo(np.double).eps)
+
+# Prices shared with each worker process once by the pool initializer, rather than pickled with every chunk
+_worker_prices = None
+
+
+def all_pairs(n: int) -> list:
+    """ Returns every (i, j) column index pair with i < j, in the order the serial double loop visits them. """
+    return [(i, j) for i in range(n) for j in range(i + 1, n)]
+
+
+def cointegrated_pairs_frame(columns, pairs, p_values, p_value_thresh: float) -> pd.DataFrame:
+    """ The 'Cointegration' p-value of every (i, j) column pair at or below p_value_thresh, indexed by the
+    'Stock_1 - Stock_2' lookup of the pair, as StockData.find_cointegrated_pairs returns it. """
+    cointegrated_pairs_dict = {}
+    for (i, j), p_value in zip(pairs, p_values):
+        if p_value <= p_value_thresh:
+            cointegrated_pairs_dict[f"{columns[i]} - {columns[j]}"] = p_value
+    return pd.DataFrame.from_dict(cointegrated_pairs_dict, orient='index', columns=['Cointegration'])
+
+
+def coint_pvalue(S1, S2) -> float:
+    """ Engle-Granger p-value of S1 on S2, rounded to 5 decimal places as StockData reports it. """
+    result = coint(S1, S2, trend="c", autolag="BIC")
+    return round(result[1], 5)
+
+
+def _init_worker(prices: np.ndarray):
+    global _worker_prices
+    _worker_prices = prices
+
+
+def _coint_chunk(chunk: list) -> list:
+    return [coint_pvalue(_worker_prices[:, i], _worker_prices[:, j]) for i, j in chunk]
+
+
+def serial_coint_pvalues(df: pd.DataFrame, pairs: list) -> list:
+    """ Returns the cointegration p-value of each (i, j) column pair, computed one pair at a time. """
+    return [coint_pvalue(df.iloc[:, i], df.iloc[:, j]) for i, j in pairs]
+
+
+def parallel_coint_pvalues(df: pd.DataFrame, pairs: list, n_workers: int = None, chunk_size: int = 500,
+                           show_progress: bool = True) -> list:
+    """
+    Returns the cointegration p-value of each (i, j) column pair, computed across a process pool.
+    Pairs are sent to the workers in chunks of chunk_size and the p-values come back in the order of pairs, so
+    the result is identical to serial_coint_pvalues.
+
+    Args:
+    df (pd.DataFrame): Prices with one column per ticker.
+    pairs (list): (i, j) column index pairs to test.
+    n_workers (int): Number of worker processes, defaults to the number of CPUs.
+    chunk_size (int): Number of pairs per task sent to a worker.
+    show_progress (bool): Print a progress bar that advances as each chunk completes.
+    """
+    if not pairs:
+        return []
+    chunks = [pairs[n:n + chunk_size] for n in range(0, len(pairs), chunk_size)]
+    prices = np.ascontiguousarray(df.to_numpy(dtype=float))
+
+    p_values = []
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(prices,)) as executor:
+        for completed, chunk_p_values in enumerate(executor.map(_coint_chunk, chunks), start=1):
+            p_values.extend(chunk_p_values)
+            if show_progress:
+                print_progress_bar(completed, len(chunks), length=50)
+    return p_values
+
+
+def mackinnon_pvalues(test_stats, regression: str = 'c', N: int = 1) -> np.ndarray:
+    """ Vectorised statsmodels mackinnonp, MacKinnon's (1994) approximate p-values for an array of ADF t-stats. """
+    test_stats = np.asarray(test_stats, dtype=float)
+    small_ps = norm.cdf(np.polyval(_tau_smallps[regression][N - 1][::-1], test_stats))
+    large_ps = norm.cdf(np.polyval(_tau_largeps[regression][N - 1][::-1], test_stats))
+    p_values = np.where(test_stats <= _tau_stars[regression][N - 1], small_ps, large_ps)
+    p_values = np.where(test_stats > _tau_maxs[regression][N - 1], 1.0, p_values)
+    return np.where(test_stats < _tau_mins[regression][N - 1], 0.0, p_values)
+
+
+def _adf_design(x: np.ndarray, xdiff: np.ndarray, lag: int, ntrend: int) -> (np.ndarray, np.ndarray):
+    """ Builds the stacked (series, nobs, regressors) ADF design for every column of x, laid out like adfuller's
+    [constant, lagged level, lagged differences], and the matching differenced response. """
+    T, m = x.shape
+    nobs = T - 1 - lag
+    columns = [np.ones((nobs, m))] if ntrend else []
+    columns.append(x[lag:T - 1])
+    columns.extend(xdiff[lag - k:T - 1 - k] for k in range(1, lag + 1))
+    design = np.stack(columns, axis=-1).transpose(1, 0, 2)
+    return design, xdiff[lag:].T
+
+
+def _gram(design: np.ndarray, response: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray):
+    """ Returns X'X, X'y and y'y for each stacked regression. """
+    design_t = design.transpose(0, 2, 1)
+    return design_t @ design, (design_t @ response[..., None])[..., 0], np.einsum('mn,mn->m', response, response)
+
+
+def batch_adf_stats(x: np.ndarray, maxlag: int = None, autolag: str = 'BIC',
+                    regression: str = 'n') -> (np.ndarray, np.ndarray):
+    """
+    Runs the Augmented Dickey-Fuller regression on every column of x at once.
+    Follows statsmodels adfuller: the lag length is chosen by information criterion on a common sample and the
+    chosen model is refitted on all the observations that lag allows. With autolag=None every column uses maxlag.
+    Each candidate lag reuses the Gram matrix of the largest design, so the search costs one batched solve per lag.
+
+    Args:
+    x (np.ndarray): (observations, series) array without NaNs.
+    maxlag (int): Largest lag considered, defaults to adfuller's 12 * (nobs / 100) ** (1 / 4) rule.
+    autolag (str): 'BIC', 'AIC' or None.
+    regression (str): 'n' for no constant (the Engle-Granger residual test) or 'c' for a constant.
+
+    Returns:
+    (np.ndarray, np.ndarray): ADF t-statistics and the lag used for each column.
+    """
+    x = np.asarray(x, dtype=float)
+    T, m = x.shape
+    ntrend = 1 if regression == 'c' else 0
+    if maxlag is None:
+        maxlag = int(np.ceil(12.0 * np.power(T / 100.0, 1 / 4.0)))
+        maxlag = min(T // 2 - ntrend - 1, maxlag)
+    xdiff = np.diff(x, axis=0)
+
+    if autolag:
+        penalty_per_param = {'aic': lambda nobs: 2.0, 'bic': np.log}[autolag.lower()]
+        design, response = _adf_design(x, xdiff, maxlag, ntrend)
+        gram, moment, response_ss = _gram(design, response)
+        nobs = design.shape[1]
+        criteria = np.empty((maxlag + 1, m))
+        for lag in range(maxlag + 1):
+            k = ntrend + 1 + lag
+            beta = np.linalg.solve(gram[:, :k, :k], moment[:, :k, None])[..., 0]
+            ssr = response_ss - np.einsum('mk,mk->m', moment[:, :k], beta)
+            llf = -nobs / 2.0 * (np.log(2 * np.pi) + np.log(ssr / nobs) + 1)
+            criteria[lag] = -2 * llf + penalty_per_param(nobs) * k
+        used_lags = np.argmin(criteria, axis=0)
+    else:
+        used_lags = np.full(m, maxlag)
+
+    test_stats = np.empty(m)
+    for lag in np.unique(used_lags):
+        columns = np.flatnonzero(used_lags == lag)
+        design, response = _adf_design(x[:, columns], xdiff[:, columns], lag, ntrend)
+        gram, moment, response_ss = _gram(design, response)
+        k = design.shape[2]
+        beta = np.linalg.solve(gram, moment[..., None])[..., 0]
+        ssr = response_ss - np.einsum('mk,mk->m', moment, beta)
+        sigma2 = ssr / (design.shape[1] - k)
+        level_variance = sigma2 * np.linalg.inv(gram)[:, ntrend, ntrend]
+        test_stats[columns] = beta[:, ntrend] / np.sqrt(level_variance)
+    return test_stats, used_lags
+
+
+def batch_adf_pvalues(x, regression: str = 'c', autolag: str = 'AIC', maxlag: int = None) -> (np.ndarray, dict):
+    """
+    Augmented Dickey-Fuller p-values of every column of x, as statsmodels adfuller gives them on each column with
+    its NaNs dropped. Columns with the same number of observations are tested together with batch_adf_stats, so
+    columns of different lengths or NaN masks can share the array.
+
+    Args:
+    x (np.ndarray): (observations, series) array, NaN where a series has no value.
+    regression (str): 'c' for a constant or 'n' for none.
+    autolag (str): 'AIC', 'BIC' or None for a fixed maxlag.
+    maxlag (int): Largest lag considered, defaults to adfuller's rule for each column's length.
+
+    Returns:
+    (np.ndarray, dict): The p-values, NaN for a column that could not be tested, and column -> error message of
+        those columns.
+    """
+    x = np.asarray(x, dtype=float)
+    if x.ndim == 1:
+        x = x[:, None]
+    p_values = np.full(x.shape[1], np.nan)
+    errors = {}
+    valid = ~np.isnan(x)
+    lengths = valid.sum(axis=0)
+    ntrend = 1 if regression == 'c' else 0
+    for length in np.unique(lengths):
+        columns = np.flatnonzero(lengths == length)
+        if length // 2 - ntrend - 1 < 0 or (maxlag is not None and length - 1 - maxlag <= ntrend + 1 + maxlag):
+            for column in columns:
+                errors[int(column)] = f"Sample size {length} is too short for the ADF test"
+            continue
+        series = np.column_stack([x[valid[:, column], column] for column in columns])
+        constant = series.max(axis=0) == series.min(axis=0)
+        for column in columns[constant]:
+            errors[int(column)] = "Invalid input, x is constant"
+        # One bad column fails its whole batch, so a failed batch is split until the bad column is found
+        batches = [columns[~constant]] if (~constant).any() else []
+        while batches:
+            batch = batches.pop()
+            try:
+                test_stats = batch_adf_stats(series[:, np.searchsorted(columns, batch)], maxlag=maxlag,
+                                             autolag=autolag, regression=regression)[0]
+                p_values[batch] = mackinnon_pvalues(test_stats, regression=regression, N=1)
+            except (np.linalg.LinAlgError, ValueError) as e:
+                if len(batch) == 1:
+                    errors[int(batch[0])] = str(e)
+                else:
+                    batches.extend(np.array_split(batch, 2))
+    for column in np.flatnonzero(np.isnan(p_values)):
+        errors.setdefault(int(column), "The ADF statistic is not finite")
+    return p_values, errors
+
+
+def batch_coint_pvalues(df: pd.DataFrame, pairs: list, maxlag: int = None, autolag: str = 'BIC',
+                        max_batch: int = 1024) -> list:
+    """
+    Returns the Engle-Granger cointegration p-value of each (i, j) column pair, vectorised with NumPy.
+    Pairs are grouped by their first column i, which is regressed (with a constant) on all of its partner columns
+    at once. The residual matrix of each group then goes through batch_adf_stats and the MacKinnon p-values for two
+    variables. The p-values agree with statsmodels.coint(trend="c", autolag="BIC") to within floating point and
+    are rounded to 5 decimal places like the other engines.
+
+    Args:
+    df (pd.DataFrame): Prices with one column per ticker, without NaNs.
+    pairs (list): (i, j) column index pairs to test.
+    maxlag (int): Largest ADF lag, defaults to the adfuller rule.
+    autolag (str): 'BIC', 'AIC' or None for a fixed maxlag.
+    max_batch (int): Largest number of pairs regressed together, bounds the memory used per batch.
+    """
+    prices = df.to_numpy(dtype=float)
+    p_values = np.empty(len(pairs))
+    partners = {}
+    for position, (i, j) in enumerate(pairs):
+        partners.setdefault(i, []).append((j, position))
+
+    for i, group in partners.items():
+        for start in range(0, len(group), max_batch):
+            batch = group[start:start + max_batch]
+            js = [j for j, _ in batch]
+            positions = [position for _, position in batch]
+
+            y = prices[:, i] - prices[:, i].mean()
+            X = prices[:, js] - prices[:, js].mean(axis=0)
+            beta = (X * y[:, None]).sum(axis=0) / (X * X).sum(axis=0)
+            residuals = y[:, None] - X * beta
+            r_squared = 1 - (residuals * residuals).sum(axis=0) / (y * y).sum()
+
+            test_stats = np.full(len(js), -np.inf)
+            testable = r_squared < 1 - 100 * SQRTEPS
+            if testable.any():
+                test_stats[testable] = batch_adf_stats(residuals[:, testable], maxlag=maxlag, autolag=autolag,
+                                                       regression='n')[0]
+            p_values[positions] = mackinnon_pvalues(test_stats, regression='c', N=2)
+
+    return [round(float(p_value), 5) for p_value in p_values]
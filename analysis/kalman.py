@@ -0,0 +1,97 @@
+import numpy as np
+
+HEDGE_METHODS = ('rolling_ols', 'kalman')
+
+
+class KalmanHedge:
+    """
+    Online Kalman filter estimate of the hedge ratio and intercept of many pairs at once. Each pair's price_1 is
+    modelled as hedge_ratio * price_2 + intercept + noise, with the (hedge_ratio, intercept) state following a
+    random walk, so the estimate keeps adapting to regime changes instead of lagging a fixed window. The state is
+    held as NumPy arrays, (pairs, 2) for the state and (pairs, 2, 2) for its covariance, and every bar updates all
+    pairs with a handful of vectorised operations.
+
+    Each bar reports the estimate from the bars before it, so nothing looks ahead: the spread is the prediction
+    error price_1 - hedge_ratio * price_2 - intercept, and spread_std its standard deviation under the model.
+    A pair with a missing price on a bar keeps its state, only its uncertainty grows.
+    """
+
+    def __init__(self, n_pairs: int, delta: float = 1e-4, obs_var: float = 1e-3, initial_cov: float = 1e4):
+        """
+        Args:
+        n_pairs (int): Pairs filtered side by side.
+        delta (float): How fast the state may drift, the state noise covariance is delta / (1 - delta) * I.
+        obs_var (float): Variance of the observation noise around the fitted line.
+        initial_cov (float): Variance of the initial zero state, diffuse so the first bars set the estimate.
+        """
+        self.n_pairs = n_pairs
+        self.state_var = delta / (1 - delta)
+        self.obs_var = obs_var
+        self.state = np.zeros((n_pairs, 2))
+        self.cov = np.zeros((n_pairs, 2, 2))
+        self.cov[:, 0, 0] = self.cov[:, 1, 1] = initial_cov
+        self.bars = 0
+
+    @property
+    def hedge_ratio(self) -> np.ndarray:
+        return self.state[:, 0]
+
+    @property
+    def intercept(self) -> np.ndarray:
+        return self.state[:, 1]
+
+    def step(self, price_1, price_2) -> dict:
+        """
+        Adds one bar of prices of every pair, arrays of n_pairs, and returns the arrays of hedge_ratio, intercept,
+        spread and spread_std estimated before the bar.
+        """
+        y = np.asarray(price_1, dtype=float)
+        x = np.asarray(price_2, dtype=float)
+        self.bars += 1
+        beta, alpha = self.state[:, 0].copy(), self.state[:, 1].copy()
+
+        # Predict: the state stays put and its covariance grows by the state noise
+        r00 = self.cov[:, 0, 0] + self.state_var
+        r01 = self.cov[:, 0, 1]
+        r11 = self.cov[:, 1, 1] + self.state_var
+
+        # The observation row is (x, 1): the prediction error and its variance
+        spread = y - beta * x - alpha
+        r_h0 = r00 * x + r01
+        r_h1 = r01 * x + r11
+        spread_var = x * r_h0 + r_h1 + self.obs_var
+
+        # Update every pair with both prices, the others only carry the grown covariance forward
+        observed = np.isfinite(spread)
+        with np.errstate(invalid='ignore'):
+            gain_0 = np.where(observed, r_h0 / spread_var, 0.0)
+            gain_1 = np.where(observed, r_h1 / spread_var, 0.0)
+        innovation = np.where(observed, spread, 0.0)
+        self.state[:, 0] = beta + gain_0 * innovation
+        self.state[:, 1] = alpha + gain_1 * innovation
+        self.cov[:, 0, 0] = r00 - gain_0 * r_h0
+        self.cov[:, 0, 1] = self.cov[:, 1, 0] = r01 - gain_0 * r_h1
+        self.cov[:, 1, 1] = r11 - gain_1 * r_h1
+
+        return {'hedge_ratio': beta, 'intercept': alpha, 'spread': spread, 'spread_std': np.sqrt(spread_var)}
+
+    def filter(self, prices_1, prices_2) -> dict:
+        """
+        Runs the filter over a history of (bars, pairs) prices, a 1-D history for a single pair, continuing from
+        the current state, so a filter seeded on history can step on new bars afterwards.
+
+        Returns:
+        dict: (bars, pairs) arrays, 1-D for a 1-D history, of what step returns for every bar.
+        """
+        prices_1 = np.asarray(prices_1, dtype=float)
+        prices_2 = np.asarray(prices_2, dtype=float)
+        single = prices_1.ndim == 1
+        if single:
+            prices_1, prices_2 = prices_1[:, None], prices_2[:, None]
+        results = {name: np.empty(prices_1.shape) for name in ('hedge_ratio', 'intercept', 'spread', 'spread_std')}
+        for bar in range(len(prices_1)):
+            for name, values in self.step(prices_1[bar], prices_2[bar]).items():
+                results[name][bar] = values
+        if single:
+            return {name: values[:, 0] for name, values in results.items()}
+        return results
@@ -0,0 +1,162 @@
+import itertools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Directory Path Setup
+""" Set up the directory path for the script and adjust sys.path for module imports. """
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+# Custom Module Imports
+from utils.my_timer import timeit
+from analysis.DATES import Dates
+from analysis.price_cache import download_prices
+from analysis.statistical_methods import rolling_beta, slice_pair_prices, pair_returns
+from analysis.backtest import (zscore_signal, tp_sl_signal, hold_until_reversion_signal, strategy_returns,
+                               performance_metrics, TRADING_DAYS)
+
+# The parameters of the live strategy, a sweep varies any of them
+STRATEGY_PARAMETERS = {
+    'hedge_window': [60],
+    'z_window': [50],
+    'corr_window': [180],
+    # None trades whatever the rolling correlation, like the live strategy
+    'min_corr': [None],
+    'rule': ['zscore'],
+    'entry': [1.0],
+    'exit': [0.0],
+    'tp': [0.05],
+    'sl': [-0.05],
+}
+# Parameters that change the spread and z-score, combinations sharing them are evaluated together
+SPREAD_PARAMETERS = ['hedge_window', 'z_window']
+
+# Pair inputs shared with each worker process once by the pool initializer
+_worker_pair_inputs = None
+
+
+def parameter_grid(grid: dict) -> pd.DataFrame:
+    """ Every combination of the given parameter values, parameters left out keep the live strategy's value. """
+    grid = {**STRATEGY_PARAMETERS, **grid}
+    return pd.DataFrame(list(itertools.product(*grid.values())), columns=list(grid))
+
+
+def random_parameters(space: dict, n: int, seed: int = None) -> pd.DataFrame:
+    """ n combinations drawn uniformly at random, each parameter from its list of values in space. """
+    space = {**STRATEGY_PARAMETERS, **space}
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({name: np.asarray(values, dtype=object)[rng.integers(0, len(values), n)]
+                         for name, values in space.items()}).infer_objects()
+
+
+def load_pair_inputs(stock_1, stock_2, price_panel: pd.DataFrame = None) -> pd.DataFrame:
+    """ The prices, returns and forward returns of a pair, sliced from price_panel or downloaded. """
+    if price_panel is None:
+        price_panel = download_prices([stock_1, stock_2], start=Dates.START_DATE.value, end=Dates.END_DATE.value,
+                                      fields=('Adj Close', 'Open'))
+    adj_close, open_prices = slice_pair_prices(price_panel, stock_1, stock_2)
+    return pair_returns(stock_1, stock_2, adj_close, open_prices)
+
+
+def _warmup(combinations: pd.DataFrame) -> int:
+    """ First bar on which every combination has a z-score and a rolling correlation, so all are ranked on the
+    same sample. """
+    z_score_warmup = (combinations['hedge_window'] + combinations['z_window'] - 2).max()
+    return int(max(z_score_warmup, combinations['corr_window'].max() - 1))
+
+
+def _evaluate_group(pair_key, hedge_window, z_window, combinations: pd.DataFrame, start: int,
+                    periods_per_year: int) -> pd.DataFrame:
+    """ Evaluates every combination sharing a pair, hedge window and z-score window in one vectorised pass. """
+    inputs = _worker_pair_inputs[pair_key]
+    p1, p2, fwd1, fwd2, r1, r2 = (inputs[:, n] for n in range(6))
+
+    hedge_ratio = rolling_beta(r2, r1, hedge_window)
+    spread = pd.Series(p1 - p2 * hedge_ratio)
+    z_score = ((spread - spread.rolling(z_window).mean()) / spread.rolling(z_window).std()).to_numpy()
+    combined_return = r1 + r2 * hedge_ratio
+
+    # The last bar has no forward return
+    window = slice(start, len(p1) - 1)
+    hedge_ratio, z_score = hedge_ratio[window, None], z_score[window, None]
+    combined_return, fwd1, fwd2 = combined_return[window, None], fwd1[window, None], fwd2[window, None]
+
+    signal = np.zeros((len(z_score), len(combinations)))
+    for rule, rows in combinations.groupby('rule').indices.items():
+        params = combinations.iloc[rows]
+        entry, exit = params['entry'].to_numpy()[None, :], params['exit'].to_numpy()[None, :]
+        if rule == 'tp_sl':
+            signal[:, rows] = tp_sl_signal(combined_return, z_score, params['tp'].to_numpy()[None, :],
+                                           params['sl'].to_numpy()[None, :], entry=entry)
+        elif rule == 'hold':
+            signal[:, rows] = hold_until_reversion_signal(z_score, entry=entry, exit=exit)
+        else:
+            signal[:, rows] = zscore_signal(z_score, entry=entry)
+
+    # Combinations with a min_corr only trade while the pair's rolling correlation is at least min_corr
+    min_corr = pd.to_numeric(combinations['min_corr']).to_numpy(dtype=float)
+    for corr_window, rows in combinations.groupby('corr_window').indices.items():
+        rows = rows[~np.isnan(min_corr[rows])]
+        if len(rows) == 0:
+            continue
+        roll_corr = pd.Series(p1).rolling(corr_window).corr(pd.Series(p2)).to_numpy()[window, None]
+        signal[:, rows] *= roll_corr >= min_corr[None, rows]
+
+    returns = strategy_returns(signal, fwd1, fwd2, hedge_ratio)
+    results = combinations.copy()
+    for name, values in performance_metrics(returns, signal, periods_per_year).items():
+        results[name] = values
+    results.insert(0, 'pair', f'{pair_key[0]} - {pair_key[1]}')
+    return results
+
+
+def _init_worker(pair_inputs: dict):
+    global _worker_pair_inputs
+    _worker_pair_inputs = pair_inputs
+
+
+def _evaluate_task(task) -> pd.DataFrame:
+    return _evaluate_group(*task)
+
+
+@timeit
+def run_parameter_sweep(pair_inputs: dict, combinations: pd.DataFrame, n_workers: int = None,
+                        rank_by: str = 'sharpe', periods_per_year: int = TRADING_DAYS) -> pd.DataFrame:
+    """
+    Backtests every parameter combination on every pair and returns the results ranked best first.
+    Combinations sharing a pair, hedge window and z-score window are one task: the hedge ratio, spread and z-score
+    are computed once for the task and all its entry/exit/tp/sl/rule/correlation variants are evaluated together
+    as columns of one signal matrix. Tasks are spread across a process pool, each worker receives the pair
+    inputs once. Every combination is scored on the same bars, from the longest warm up in the sweep onwards.
+
+    Args:
+    pair_inputs (dict): (stock_1, stock_2) -> load_pair_inputs frame.
+    combinations (pd.DataFrame): From parameter_grid or random_parameters.
+    n_workers (int): Worker processes, 1 runs in this process, None uses every CPU.
+    rank_by (str): Metric the table is sorted on, highest first.
+    periods_per_year (int): Bars per year used to annualise the Sharpe ratio.
+
+    Returns:
+    pd.DataFrame: One row per pair and combination with its parameters and performance metrics.
+    """
+    combinations = combinations.reset_index(drop=True)
+    start = _warmup(combinations)
+    arrays = {pair_key: inputs.to_numpy(dtype=float)[:, :6] for pair_key, inputs in pair_inputs.items()}
+    tasks = [(pair_key, hedge_window, z_window, group, start, periods_per_year)
+             for pair_key in arrays
+             for (hedge_window, z_window), group in combinations.groupby(SPREAD_PARAMETERS)]
+
+    if n_workers == 1:
+        _init_worker(arrays)
+        results = [_evaluate_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(arrays,)) as executor:
+            results = list(executor.map(_evaluate_task, tasks))
+
+    ranked = pd.concat(results, ignore_index=True)
+    return ranked.sort_values(rank_by, ascending=False, kind='stable').reset_index(drop=True)
@@ -0,0 +1,257 @@
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Directory Path Setup
+""" Set up the directory path for the script and adjust sys.path for module imports. """
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+DEFAULT_CACHE_DIR = os.environ.get('PAIRS_PRICE_CACHE_DIR', os.path.join(root_dir, '.price_cache'))
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+PRICE_FIELDS = ('Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume')
+# Days after which the provider is assumed to have published every bar
+SETTLED_DAYS = 7
+# Fields that move with splits and dividends, compared on an overlapping bar to detect a new adjustment basis
+ADJUSTED_FIELDS = ('Open', 'High', 'Low', 'Close', 'Adj Close')
+
+
+class PriceProvider:
+    """ Base class for a source of daily bars that can sit behind the PriceCache. """
+
+    def fetch(self, tickers: list, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        """
+        Returns the bars for the given tickers in [start, end) as a DataFrame indexed by date with
+        (field, ticker) MultiIndex columns, the same layout yf.download uses.
+        """
+        raise NotImplementedError
+
+
+class YFinanceProvider(PriceProvider):
+    """ Downloads bars from Yahoo Finance. """
+
+    def fetch(self, tickers, start, end):
+        # Imported on the first download, a run served entirely from the cache never pays for yfinance
+        import yfinance as yf
+        bars = yf.download(tickers=list(tickers), start=start, end=end, auto_adjust=False, progress=False)
+        if not isinstance(bars.columns, pd.MultiIndex):
+            bars.columns = pd.MultiIndex.from_product([bars.columns, list(tickers)])
+        return bars
+
+
+class FileProvider(PriceProvider):
+    """
+    Serves bars from '<root>/<ticker>.csv' files holding a 'Date' column and one column per field.
+    Works fully offline, which makes it the provider to use in tests.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def fetch(self, tickers, start, end):
+        frames = {}
+        for ticker in tickers:
+            path = os.path.join(self.root, f'{ticker}.csv')
+            if not os.path.exists(path):
+                continue
+            bars = pd.read_csv(path, index_col='Date', parse_dates=True)
+            frames[ticker] = bars[(bars.index >= start) & (bars.index < end)]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, axis=1).swaplevel(axis=1).sort_index(axis=1)
+
+
+class PriceCache:
+    """
+    A local Parquet cache of daily bars, one file per ticker holding every field.
+    Each ticker remembers the date range it covers, so a request only fetches the bars that are missing at the
+    head or tail of that range. Files are evicted least recently used first once the cache grows past max_bytes.
+
+    Every fetch also asks for the cached bar next to the missing range. Yahoo adjusts the whole history after a
+    split or dividend, so when that bar comes back with different prices the cached bars are on an old basis and
+    the ticker's full history is downloaded again rather than mixing the two.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, provider: PriceProvider = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.provider = provider if provider is not None else YFinanceProvider()
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.index_path = os.path.join(self.cache_dir, 'index.json')
+        self.index = self._load_index()
+
+    def _load_index(self) -> dict:
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as file:
+                return json.load(file)
+        return {}
+
+    def _save_index(self):
+        # One tmp file per process, processes sharing the directory must not interleave their writes
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self.index, file)
+        os.replace(tmp_path, self.index_path)
+
+    def _path(self, ticker: str) -> str:
+        return os.path.join(self.cache_dir, f'{ticker}.parquet')
+
+    def _read(self, ticker: str, columns=None) -> pd.DataFrame:
+        return pd.read_parquet(self._path(ticker), columns=columns)
+
+    def _write(self, ticker: str, bars: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp):
+        bars = bars[~bars.index.duplicated(keep='last')].sort_index()
+        bars.to_parquet(self._path(ticker))
+        self.index[ticker] = {'start': start.isoformat(), 'end': end.isoformat(),
+                              'first_bar': bars.index.min().isoformat(), 'last_bar': bars.index.max().isoformat(),
+                              'fields': list(bars.columns), 'bytes': os.path.getsize(self._path(ticker)),
+                              'last_access': time.time()}
+
+    def _missing_ranges(self, ticker, start, end, fields) -> list:
+        """ Returns the [start, end) ranges that must be fetched for the ticker to cover the request. """
+        entry = self.index.get(ticker)
+        if entry is None or not os.path.exists(self._path(ticker)) or not set(fields) <= set(entry['fields']):
+            return [(start, end)]
+        cached_start, cached_end = pd.Timestamp(entry['start']), pd.Timestamp(entry['end'])
+        ranges = []
+        # Each range takes in the cached bar next to it, to check the adjustment basis has not changed
+        if start < cached_start:
+            first_bar = pd.Timestamp(entry.get('first_bar', cached_start))
+            ranges.append((start, first_bar + pd.Timedelta(days=1)))
+        if end > cached_end:
+            ranges.append((pd.Timestamp(entry.get('last_bar', cached_end)), end))
+        return ranges
+
+    @staticmethod
+    def _covered_end(new_bars: pd.DataFrame, fetch_end: pd.Timestamp) -> pd.Timestamp:
+        """
+        End of the range a fetch covers. Recent bars the provider has yet to publish must be fetched again, so a fetch
+        ending in the last SETTLED_DAYS only covers up to the last bar that came back.
+        """
+        if fetch_end < pd.Timestamp.now().normalize() - pd.Timedelta(days=SETTLED_DAYS):
+            return fetch_end
+        return min(new_bars.index.max() + pd.Timedelta(days=1), fetch_end)
+
+    @staticmethod
+    def _same_basis(cached: pd.DataFrame, new_bars: pd.DataFrame) -> bool:
+        """ Whether the bars both frames hold agree, i.e. they were adjusted for the same splits and dividends. """
+        dates = cached.index.intersection(new_bars.index)
+        columns = [field for field in ADJUSTED_FIELDS if field in cached.columns and field in new_bars.columns]
+        if dates.empty or not columns:
+            return True
+        return np.allclose(cached.loc[dates, columns].to_numpy(dtype=float),
+                           new_bars.loc[dates, columns].to_numpy(dtype=float), rtol=1e-6, equal_nan=True)
+
+    def _refresh(self, tickers, start, end, fields):
+        """ Fetches every missing range, batching tickers that are missing the same range into one call. """
+        batches = {}
+        for ticker in tickers:
+            for missing in self._missing_ranges(ticker, start, end, fields):
+                batches.setdefault(missing, []).append(ticker)
+
+        rebased = {}
+        for (fetch_start, fetch_end), batch in batches.items():
+            fetched = self.provider.fetch(batch, fetch_start, fetch_end)
+            for ticker in batch:
+                if fetched.empty or ticker not in fetched.columns.get_level_values(1):
+                    continue
+                new_bars = fetched.xs(ticker, axis=1, level=1).dropna(how='all')
+                if new_bars.empty:
+                    # Nothing came back (weekend, holiday or a provider error), leave the coverage untouched
+                    continue
+                bars_end = self._covered_end(new_bars, fetch_end)
+                entry = self.index.get(ticker)
+                if entry is not None and set(fields) <= set(entry['fields']) and os.path.exists(self._path(ticker)):
+                    cached = self._read(ticker)
+                    covered_start = min(pd.Timestamp(entry['start']), fetch_start)
+                    covered_end = max(pd.Timestamp(entry['end']), bars_end)
+                    if not self._same_basis(cached, new_bars):
+                        rebased.setdefault((covered_start, max(covered_end, fetch_end)), []).append(ticker)
+                        continue
+                    bars = pd.concat([cached, new_bars])
+                else:
+                    bars, covered_start, covered_end = new_bars, fetch_start, bars_end
+                self._write(ticker, bars, covered_start, covered_end)
+
+        # The cached history of these tickers is on an old adjustment basis, replace all of it
+        for (fetch_start, fetch_end), batch in rebased.items():
+            fetched = self.provider.fetch(batch, fetch_start, fetch_end)
+            for ticker in batch:
+                if fetched.empty or ticker not in fetched.columns.get_level_values(1):
+                    continue
+                bars = fetched.xs(ticker, axis=1, level=1).dropna(how='all')
+                if not bars.empty:
+                    self._write(ticker, bars, fetch_start, self._covered_end(bars, fetch_end))
+
+    def evict(self, keep=()):
+        """ Removes the least recently used tickers until the cache fits in max_bytes. """
+        total = sum(entry['bytes'] for entry in self.index.values())
+        for ticker in sorted(self.index, key=lambda t: self.index[t]['last_access']):
+            if total <= self.max_bytes:
+                break
+            if ticker in keep:
+                continue
+            total -= self.index[ticker]['bytes']
+            if os.path.exists(self._path(ticker)):
+                os.remove(self._path(ticker))
+            del self.index[ticker]
+
+    def get(self, tickers, start, end, fields=('Adj Close',)) -> pd.DataFrame:
+        """
+        Returns the requested fields for the tickers between start (inclusive) and end (exclusive), fetching only
+        the bars that are not already on disk. Dates are truncated to midnight, so the still-open session is
+        never cached.
+
+        Returns:
+        pandas.DataFrame: Bars indexed by date with (field, ticker) MultiIndex columns, like yf.download.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        fields = list(fields)
+        start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+
+        self._refresh(tickers, start, end, fields)
+
+        frames = {}
+        for ticker in tickers:
+            if ticker not in self.index:
+                frames[ticker] = pd.DataFrame(columns=fields, dtype=float)
+                continue
+            bars = self._read(ticker, columns=fields)
+            frames[ticker] = bars[(bars.index >= start) & (bars.index < end)]
+            self.index[ticker]['last_access'] = time.time()
+
+        self.evict(keep=set(tickers))
+        self._save_index()
+
+        prices_df = pd.concat(frames, axis=1).swaplevel(axis=1)
+        prices_df = prices_df.reindex(columns=pd.MultiIndex.from_product([fields, tickers]))
+        prices_df.index.name = 'Date'
+        return prices_df.sort_index()
+
+
+_default_cache = None
+
+
+def get_default_cache() -> PriceCache:
+    """ Returns the process wide PriceCache, created on first use with the default provider. """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PriceCache()
+    return _default_cache
+
+
+def set_default_cache(cache: PriceCache):
+    """ Replaces the process wide PriceCache, e.g. with one backed by a FileProvider. """
+    global _default_cache
+    _default_cache = cache
+
+
+def download_prices(tickers, start, end, fields=('Adj Close',)) -> pd.DataFrame:
+    """ Cached drop-in for yf.download(tickers, start, end)[fields]. """
+    return get_default_cache().get(tickers, start, end, fields=fields)
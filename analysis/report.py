@@ -0,0 +1,240 @@
+import base64
+import html
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Directory Path Setup
+""" Set up the directory path for the script and adjust sys.path for module imports. """
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+# Custom Module Imports
+from analysis.DATES import Dates
+from analysis.backtest import run_backtest
+from analysis.price_cache import download_prices
+from analysis.statistical_methods import collect_metrics_for_pair, slice_pair_prices
+
+DEFAULT_REPORT_DIR = os.path.join(root_dir, 'reports')
+REPORT_FORMATS = ('png', 'html')
+
+# Points drawn per line, enough for a chart a few thousand pixels wide
+DEFAULT_MAX_POINTS = 2000
+
+
+def get_tickers_from_collected_data_df(df) -> (str, str):
+    tickers = []
+    for column in df.columns:
+        if column.endswith('_forward_return'):
+            tickers.append(column.split('_')[0])
+    return tickers[0], tickers[1]
+
+
+def lttb(x, y, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling. Keeps the first and last points and, from each of n_out - 2 equal
+    buckets in between, the point forming the largest triangle with the point kept before it and the mean of the
+    next bucket, so peaks, troughs and the overall shape survive.
+
+    Returns:
+    np.ndarray: Positions of the kept points, all of them if there are no more than n_out.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    edges = np.append((np.floor(np.arange(n_out - 1) * (n - 2) / (n_out - 2)) + 1).astype(int), n)
+    edges[-2] = n - 1
+    kept = np.empty(n_out, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_x = x[stop:edges[bucket + 2]].mean()
+        next_y = y[stop:edges[bucket + 2]].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                       - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def downsample(series: pd.Series, max_points: int = DEFAULT_MAX_POINTS) -> pd.Series:
+    """ The series without NaNs, cut to max_points by lttb over its index, dates or positions. """
+    series = series.dropna()
+    if isinstance(series.index, pd.DatetimeIndex):
+        x = series.index.as_unit('ns').asi8
+    else:
+        x = np.arange(len(series))
+    return series.iloc[lttb(x, series.to_numpy(dtype=float), max_points)]
+
+
+def draw_spread(ax, df: pd.DataFrame, max_points: int = DEFAULT_MAX_POINTS):
+    """ Draws the spread of the output of collect_metrics_for_pair on a matplotlib Axes. """
+    stock_1, stock_2 = get_tickers_from_collected_data_df(df)
+    hedge_ratio = round(df['hedge_ratio'].iloc[-1], 2)
+    spread = downsample(df['spread'], max_points)
+    ax.plot(spread.index, spread.to_numpy(), color='red')
+    ax.set_title(f'{stock_1}-{hedge_ratio}*{stock_2}')
+
+
+def draw_zscore(ax, df: pd.DataFrame, max_points: int = DEFAULT_MAX_POINTS):
+    """ Draws the z-scored spread with the +-1 entry levels. """
+    z_score = downsample(df['z_score'], max_points)
+    ax.plot(z_score.index, z_score.to_numpy(), color='orange')
+    ax.axhline(1, color='k')
+    ax.axhline(-1, color='k')
+    ax.set_title('Z-scored Spread')
+
+
+def draw_returns(ax, backtest_df: pd.DataFrame, max_points: int = DEFAULT_MAX_POINTS):
+    """ Draws the cumulative returns of the output of run_backtest. """
+    cumulative_return = downsample(backtest_df['cumulative_return'], max_points)
+    ax.plot(cumulative_return.index, cumulative_return.to_numpy(), color='red')
+    ax.set_title('Strategy Cumulative Returns')
+    ax.set_ylabel('Return')
+
+
+def _init_worker():
+    # Workers never open a window, whatever backend the parent process picked
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def render_pair_report(stock_1, stock_2, out_dir: str = DEFAULT_REPORT_DIR, price_panel: pd.DataFrame = None,
+                       fmt: str = 'png', rule: str = 'zscore', tp: float = None, sl: float = None,
+                       max_points: int = DEFAULT_MAX_POINTS, dpi: int = 100) -> dict:
+    """
+    Renders the spread, z-score and cumulative return charts of one pair into a file of out_dir, without pyplot so
+    nothing is shown or kept open: a PNG, or an HTML page with the PNG inlined above the backtest metrics.
+
+    Returns:
+    dict: The pair, the path written, the backtest metrics and the seconds spent.
+    """
+    from matplotlib.figure import Figure
+
+    start_time = time.perf_counter()
+    metrics_df = collect_metrics_for_pair(stock_1, stock_2, price_panel=price_panel)
+    backtest_df, metrics = run_backtest(metrics_df, rule=rule, tp=tp, sl=sl)
+    metrics = {name: float(value) for name, value in metrics.items()}
+
+    figure = Figure(figsize=(16, 14))
+    axes = figure.subplots(3, 1)
+    draw_spread(axes[0], metrics_df, max_points)
+    draw_zscore(axes[1], metrics_df, max_points)
+    draw_returns(axes[2], backtest_df, max_points)
+    figure.tight_layout()
+
+    name = f'{stock_1}-{stock_2}'
+    path = os.path.join(out_dir, f'{name}.{fmt}')
+    if fmt == 'png':
+        figure.savefig(path, dpi=dpi)
+    else:
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format='png', dpi=dpi)
+        rows = ''.join(f'<tr><th>{html.escape(key)}</th><td>{value:.4f}</td></tr>' for key, value in metrics.items())
+        image = base64.b64encode(buffer.getvalue()).decode()
+        with open(path, 'w') as file:
+            file.write(f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{html.escape(name)}</title></head>'
+                       f'<body><h1>{html.escape(name)}</h1><table>{rows}</table>'
+                       f'<img src="data:image/png;base64,{image}"></body></html>')
+    return {'Stock_1': stock_1, 'Stock_2': stock_2, 'path': path, **metrics,
+            'seconds': time.perf_counter() - start_time}
+
+
+def _render_task(task: tuple) -> dict:
+    stock_1, stock_2, prices, options = task
+    try:
+        return render_pair_report(stock_1, stock_2, price_panel=prices, **options)
+    except Exception as e:
+        return {'Stock_1': stock_1, 'Stock_2': stock_2, 'path': None, 'error': str(e)}
+
+
+def write_index(results: pd.DataFrame, out_dir: str) -> str:
+    """ Writes index.html to out_dir, a table of every rendered pair and its metrics linking to its report. """
+    rows = []
+    for result in results.to_dict('records'):
+        name = html.escape(f"{result['Stock_1']}-{result['Stock_2']}")
+        if pd.isna(result.get('path')):
+            rows.append(f"<tr><td>{name}</td><td colspan=\"4\">{html.escape(str(result.get('error')))}</td></tr>")
+            continue
+        link = html.escape(os.path.basename(result['path']))
+        rows.append(f'<tr><td><a href="{link}">{name}</a></td><td>{result["sharpe"]:.2f}</td>'
+                    f'<td>{result["total_return"]:.2%}</td><td>{result["max_drawdown"]:.2%}</td>'
+                    f'<td>{result["trades"]:.0f}</td></tr>')
+    path = os.path.join(out_dir, 'index.html')
+    with open(path, 'w') as file:
+        file.write('<!DOCTYPE html><html><head><meta charset="utf-8"><title>Pair reports</title></head><body>'
+                   '<table><tr><th>Pair</th><th>Sharpe</th><th>Total Return</th><th>Max Drawdown</th>'
+                   f'<th>Trades</th></tr>{"".join(rows)}</table></body></html>')
+    return path
+
+
+def pair_panel(price_panel: pd.DataFrame, stock_1, stock_2) -> pd.DataFrame:
+    """ The columns of a price panel that collect_metrics_for_pair reads for one pair, without the dates neither
+    stock has a price on. """
+    adj_close, open_prices = slice_pair_prices(price_panel, stock_1, stock_2)
+    if open_prices is None:
+        return adj_close.dropna(how='all')
+    return pd.concat({'Adj Close': adj_close, 'Open': open_prices}, axis=1).dropna(how='all')
+
+
+def render_reports(pairs: list, out_dir: str = DEFAULT_REPORT_DIR, price_panel: pd.DataFrame = None,
+                   fmt: str = 'html', n_workers: int = None, rule: str = 'zscore', tp: float = None,
+                   sl: float = None, max_points: int = DEFAULT_MAX_POINTS, dpi: int = 100) -> pd.DataFrame:
+    """
+    Renders the report of every pair across a process pool with the non-interactive Agg backend and writes an
+    index.html of them all, so many pairs can be reviewed without a window per chart. Each line is cut to
+    max_points with lttb, so rendering time does not grow with the number of bars.
+
+    Args:
+    pairs (list): (stock_1, stock_2) pairs, e.g. StockData.find_suitable_pairs().
+    out_dir (str): Directory the files are written to.
+    price_panel (pd.DataFrame): Prices to slice the pairs from, see collect_metrics_for_pair. If None the prices
+        of every pair are downloaded here, once, as workers sharing the price cache would overwrite its index.
+    fmt (str): 'png' for bare charts or 'html' for pages with the backtest metrics.
+    n_workers (int): Number of worker processes, defaults to the number of CPUs.
+    rule, tp, sl: Signal rule of the backtest, see analysis.backtest.run_backtest.
+    max_points (int): Points drawn per line.
+    dpi (int): Resolution of the charts.
+
+    Returns:
+    pd.DataFrame: One row per pair with the path written, its backtest metrics and render seconds, or the error
+        that stopped it.
+    """
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"fmt must be one of {REPORT_FORMATS}, got {fmt!r}")
+    os.makedirs(out_dir, exist_ok=True)
+    options = {'out_dir': out_dir, 'fmt': fmt, 'rule': rule, 'tp': tp, 'sl': sl, 'max_points': max_points,
+               'dpi': dpi}
+    if price_panel is None:
+        tickers = list(dict.fromkeys(stock for pair in pairs for stock in pair))
+        price_panel = download_prices(tickers, start=Dates.START_DATE.value, end=Dates.END_DATE.value,
+                                      fields=('Adj Close', 'Open'))
+    # Each worker only receives the prices of its own pair
+    results, tasks = [None] * len(pairs), {}
+    for position, (stock_1, stock_2) in enumerate(pairs):
+        try:
+            prices = pair_panel(price_panel, stock_1, stock_2)
+            missing = [stock for stock in (stock_1, stock_2)
+                       if slice_pair_prices(prices, stock_1, stock_2)[0][stock].isna().all()]
+            if missing:
+                raise KeyError(f"No prices for {', '.join(missing)}")
+        except KeyError as e:
+            results[position] = {'Stock_1': stock_1, 'Stock_2': stock_2, 'path': None, 'error': str(e)}
+            continue
+        tasks[position] = (stock_1, stock_2, prices, options)
+    if tasks:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker) as executor:
+            for position, result in zip(tasks, executor.map(_render_task, tasks.values())):
+                results[position] = result
+    results = pd.DataFrame(results)
+    write_index(results, out_dir)
+    return results
@@ -0,0 +1,196 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# Directory Path Setup
+""" Set up the directory path for the script and adjust sys.path for module imports. """
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+DEFAULT_RESULT_STORE_PATH = os.environ.get('PAIRS_RESULT_STORE', os.path.join(root_dir, '.result_store.sqlite'))
+
+# Bump a test's version whenever its algorithm or output changes, every stored result of an older version is then
+# ignored by lookups and removed by purge_stale
+RESULT_VERSIONS = {'coint': 1, 'adf': 1, 'pair_metrics': 1}
+
+
+def series_hashes(price_panel: pd.DataFrame) -> dict:
+    """
+    Hashes each ticker's prices: its dates and every field the panel holds for it, so a result keyed by these
+    hashes is only reused on exactly the same input. Takes an Adj Close frame with one column per ticker or a
+    (field, ticker) panel like StockData.price_panel.
+
+    Returns:
+    dict: Ticker -> hex digest.
+    """
+    index_bytes = pd.DatetimeIndex(price_panel.index).as_unit('ns').asi8.tobytes()
+    if isinstance(price_panel.columns, pd.MultiIndex):
+        fields = sorted(price_panel.columns.get_level_values(0).unique())
+        columns = {ticker: [price_panel[field][ticker] for field in fields]
+                   for ticker in price_panel.columns.get_level_values(1).unique()}
+    else:
+        fields = ['Adj Close']
+        columns = {ticker: [price_panel[ticker]] for ticker in price_panel.columns}
+    hashes = {}
+    for ticker, series in columns.items():
+        digest = hashlib.blake2b(index_bytes, digest_size=16)
+        for field, values in zip(fields, series):
+            digest.update(field.encode())
+            digest.update(np.ascontiguousarray(values.to_numpy(dtype=np.float64)).tobytes())
+        hashes[ticker] = digest.hexdigest()
+    return hashes
+
+
+def pair_hash(hash_1: str, hash_2: str) -> str:
+    """ The input hash of an ordered pair from its two tickers' series_hashes. """
+    return hashlib.blake2b(f'{hash_1}:{hash_2}'.encode(), digest_size=16).hexdigest()
+
+
+def _encode(value) -> (str, bytes):
+    if isinstance(value, pd.DataFrame):
+        buffer = io.BytesIO()
+        value.to_parquet(buffer)
+        return 'parquet', buffer.getvalue()
+    return 'json', json.dumps(value).encode()
+
+
+def _decode(kind: str, blob: bytes):
+    if kind == 'parquet':
+        return pd.read_parquet(io.BytesIO(blob))
+    return json.loads(blob)
+
+
+class ResultStore:
+    """
+    Memoises pair test outcomes in a local SQLite database. An entry is keyed by the test, the ordered pair, the
+    test's parameters and a hash of the input prices (see series_hashes), and records the version of the test that
+    produced it, so it is only ever returned for exactly the same input, parameters and algorithm. Values are
+    floats, bools and the like as JSON or DataFrames as Parquet. Hits and misses are counted per test.
+    """
+
+    def __init__(self, path: str = DEFAULT_RESULT_STORE_PATH, versions: dict = None):
+        self.path = path
+        self.versions = dict(RESULT_VERSIONS, **(versions or {}))
+        self.hits = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+        if os.path.dirname(os.path.abspath(path)):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # Readers do not block the writer, so several screens can share one store
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS results (
+            test TEXT NOT NULL, stock_1 TEXT NOT NULL, stock_2 TEXT NOT NULL, params TEXT NOT NULL,
+            input_hash TEXT NOT NULL, version INTEGER NOT NULL, kind TEXT NOT NULL, value BLOB NOT NULL,
+            created REAL NOT NULL, PRIMARY KEY (test, stock_1, stock_2, params, input_hash))""")
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @staticmethod
+    def _params(params: dict) -> str:
+        return json.dumps(params or {}, sort_keys=True)
+
+    def get_many(self, test: str, keys: list, params: dict = None) -> dict:
+        """
+        Looks up a whole candidate list in one query.
+
+        Args:
+        test (str): Test name, one of RESULT_VERSIONS.
+        keys (list): (stock_1, stock_2, input_hash) tuples.
+        params (dict): The test's parameters, part of the key.
+
+        Returns:
+        dict: (stock_1, stock_2, input_hash) -> value of every key stored for the current version of the test.
+        """
+        if not keys:
+            return {}
+        with self._lock:
+            cursor = self.connection.cursor()
+            cursor.execute('CREATE TEMP TABLE IF NOT EXISTS lookup (stock_1 TEXT, stock_2 TEXT, input_hash TEXT)')
+            cursor.execute('DELETE FROM lookup')
+            cursor.executemany('INSERT INTO lookup VALUES (?, ?, ?)', keys)
+            rows = cursor.execute("""SELECT r.stock_1, r.stock_2, r.input_hash, r.kind, r.value FROM results r
+                JOIN lookup l ON r.stock_1 = l.stock_1 AND r.stock_2 = l.stock_2 AND r.input_hash = l.input_hash
+                WHERE r.test = ? AND r.params = ? AND r.version = ?""",
+                                  (test, self._params(params), self.versions[test])).fetchall()
+            self.connection.commit()
+            found = {(stock_1, stock_2, input_hash): _decode(kind, value)
+                     for stock_1, stock_2, input_hash, kind, value in rows}
+            self.hits[test] = self.hits.get(test, 0) + len(found)
+            self.misses[test] = self.misses.get(test, 0) + len(set(keys)) - len(found)
+        return found
+
+    def get(self, test: str, stock_1: str, stock_2: str, input_hash: str, params: dict = None):
+        """ The stored value of one key, or None. """
+        return self.get_many(test, [(stock_1, stock_2, input_hash)], params).get((stock_1, stock_2, input_hash))
+
+    def put_many(self, test: str, items: list, params: dict = None):
+        """ Stores (stock_1, stock_2, input_hash, value) tuples for the current version of the test. """
+        created = time.time()
+        rows = [(test, stock_1, stock_2, self._params(params), input_hash, self.versions[test],
+                 *_encode(value), created) for stock_1, stock_2, input_hash, value in items]
+        with self._lock:
+            self.connection.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.connection.commit()
+
+    def put(self, test: str, stock_1: str, stock_2: str, input_hash: str, value, params: dict = None):
+        self.put_many(test, [(stock_1, stock_2, input_hash, value)], params)
+
+    def purge_stale(self) -> int:
+        """ Deletes every entry written by an older version of its test and returns how many were removed. """
+        with self._lock:
+            removed = 0
+            for test, version in self.versions.items():
+                removed += self.connection.execute('DELETE FROM results WHERE test = ? AND version != ?',
+                                                   (test, version)).rowcount
+            self.connection.commit()
+        return removed
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def hit_rate(self, test: str = None) -> float:
+        """ Share of lookups answered from the store, of one test or of all of them, NaN before any lookup. """
+        tests = [test] if test is not None else set(self.hits) | set(self.misses)
+        hits = sum(self.hits.get(name, 0) for name in tests)
+        lookups = hits + sum(self.misses.get(name, 0) for name in tests)
+        return hits / lookups if lookups else float('nan')
+
+    def summary(self) -> str:
+        parts = [f"{test} {self.hits.get(test, 0)}/{self.hits.get(test, 0) + self.misses.get(test, 0)}"
+                 for test in sorted(set(self.hits) | set(self.misses))]
+        return f"hit rate {self.hit_rate():.1%} ({', '.join(parts)})"
+
+
+_default_store = None
+
+
+def get_default_result_store() -> ResultStore:
+    """ Returns the process wide ResultStore, opened on first use at DEFAULT_RESULT_STORE_PATH. """
+    global _default_store
+    if _default_store is None:
+        _default_store = ResultStore()
+    return _default_store
+
+
+def set_default_result_store(store: ResultStore):
+    global _default_store
+    _default_store = store
@@ -0,0 +1,56 @@
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+from utils.profiling import span
+
+
+class ScreeningReport:
+    """
+    Records each stage of a pair screen: how many candidates went in, how many survived and how long it took.
+    Stages run in order on the survivors of the stage before them. While tracemalloc is tracing, the peak memory
+    allocated during each stage is recorded too.
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name: str, candidates: int):
+        """
+        Times the body of a with block as one stage. The block sets stage['survivors'] before it exits.
+
+        Usage:
+            with report.stage('correlation', candidates=n_pairs) as stage:
+                survivors = ...
+                stage['survivors'] = len(survivors)
+        """
+        stage = {'stage': name, 'candidates': candidates, 'survivors': None}
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            start_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start_time = time.perf_counter()
+        try:
+            with span(f'screen.{name}'):
+                yield stage
+        finally:
+            stage['seconds'] = time.perf_counter() - start_time
+            if tracing:
+                stage['peak_mb'] = (tracemalloc.get_traced_memory()[1] - start_memory) / 2 ** 20
+            self.stages.append(stage)
+
+    def to_df(self) -> pd.DataFrame:
+        """ Returns one row per stage with the candidates, survivors, share pruned, seconds taken and, if it was
+        traced, the peak memory in MB above what was allocated when the stage started. """
+        columns = ['stage', 'candidates', 'survivors', 'seconds']
+        if any('peak_mb' in stage for stage in self.stages):
+            columns.append('peak_mb')
+        report_df = pd.DataFrame(self.stages, columns=columns)
+        report_df['pruned_pc'] = (100 * (1 - report_df['survivors'] / report_df['candidates'])).round(2)
+        return report_df
+
+    def __str__(self):
+        return self.to_df().to_string(index=False)
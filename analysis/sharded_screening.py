@@ -0,0 +1,298 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Directory Path Setup
+""" Set up the directory path for the script and adjust sys.path for module imports. """
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+# Custom Module Imports
+from analysis.cointegration import batch_coint_pvalues, serial_coint_pvalues, cointegrated_pairs_frame
+
+SHARD_ENGINES = ('serial', 'batch')
+
+
+def default_worker_id() -> str:
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def _save_atomic(path: str, values: np.ndarray, worker_id: str):
+    """ Writes an array so that readers only ever see the old or the complete new file. """
+    tmp_path = f'{path}.{worker_id}.tmp.npy'
+    np.save(tmp_path, values)
+    os.replace(tmp_path, path)
+
+
+class ShardQueue:
+    """
+    A cointegration screen split into shards and queued in a directory, so independent worker processes on this
+    or other machines sharing the directory can work through it together.
+
+    The pairs are cut in order into shards of shard_size, so the shards of a job are the same whoever creates it.
+    A worker claims a shard by creating its lock file, which fails when another worker holds it, and tests the
+    shard in chunks of checkpoint_every pairs, saving the p-values so far and refreshing the lock after each
+    chunk. A lock not refreshed for lease_seconds belongs to a worker that died: the next worker breaks it and
+    resumes the shard from its checkpoint. Every worker computes the same p-values for a shard, so a shard tested
+    twice after a lease expired too early is only wasted work. The reducer merges the finished shards into the
+    DataFrame StockData.find_cointegrated_pairs returns.
+
+    Layout of the queue directory: job.json, prices.npy and pairs.npy describe the job, locks/ holds the claims,
+    checkpoints/ the p-values of shards in progress and done/ those of finished shards.
+    """
+
+    def __init__(self, queue_dir: str):
+        """ Opens the job queued in queue_dir, see create to queue one. """
+        self.queue_dir = queue_dir
+        with open(self._path('job.json'), 'r') as file:
+            self.job = json.load(file)
+        self.prices = np.load(self._path('prices.npy'), mmap_mode='r')
+        self.pairs = np.load(self._path('pairs.npy'), mmap_mode='r')
+
+    @classmethod
+    def create(cls, queue_dir: str, df: pd.DataFrame, pairs: list = None, shard_size: int = 50_000,
+               checkpoint_every: int = 5_000, engine: str = 'batch') -> 'ShardQueue':
+        """
+        Queues the cointegration tests of the (i, j) column pairs of df, every pair if pairs is None. Queueing the
+        same job again leaves its progress in place, so a screen that was interrupted resumes where it stopped,
+        while a different job replaces the one in queue_dir.
+
+        Args:
+        queue_dir (str): Directory shared by the workers.
+        df (pd.DataFrame): Prices with one column per ticker, without NaNs.
+        pairs (list): (i, j) column index pairs to test.
+        shard_size (int): Pairs per shard, the unit of work a worker claims.
+        checkpoint_every (int): Pairs tested between checkpoints of a shard.
+        engine (str): 'batch' or 'serial', see analysis.cointegration.
+        """
+        if engine not in SHARD_ENGINES:
+            raise ValueError(f"engine must be one of {SHARD_ENGINES}, got {engine!r}")
+        prices = np.ascontiguousarray(df.to_numpy(dtype=float))
+        if pairs is None:
+            n = prices.shape[1]
+            rows, cols = np.triu_indices(n, k=1)
+            pairs = np.column_stack([rows, cols])
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (prices.tobytes(), pairs.tobytes(), json.dumps([list(map(str, df.columns)), shard_size,
+                                                                    checkpoint_every, engine]).encode()):
+            digest.update(part)
+        job = {'job_id': digest.hexdigest(), 'columns': list(map(str, df.columns)), 'n_pairs': len(pairs),
+               'shard_size': shard_size, 'n_shards': -(-len(pairs) // shard_size),
+               'checkpoint_every': checkpoint_every, 'engine': engine, 'created': time.time()}
+
+        job_path = os.path.join(queue_dir, 'job.json')
+        if os.path.exists(job_path):
+            with open(job_path, 'r') as file:
+                if json.load(file)['job_id'] == job['job_id']:
+                    return cls(queue_dir)
+            for name in ('job.json', 'prices.npy', 'pairs.npy'):
+                os.remove(os.path.join(queue_dir, name))
+            for name in ('locks', 'checkpoints', 'done'):
+                shutil.rmtree(os.path.join(queue_dir, name), ignore_errors=True)
+        for name in ('locks', 'checkpoints', 'done'):
+            os.makedirs(os.path.join(queue_dir, name), exist_ok=True)
+        np.save(os.path.join(queue_dir, 'prices.npy'), prices)
+        np.save(os.path.join(queue_dir, 'pairs.npy'), pairs)
+        # The job description goes last, workers only pick up a job once it is complete
+        with open(job_path + '.tmp', 'w') as file:
+            json.dump(job, file)
+        os.replace(job_path + '.tmp', job_path)
+        return cls(queue_dir)
+
+    def _path(self, *parts) -> str:
+        return os.path.join(self.queue_dir, *parts)
+
+    def _shard_path(self, folder: str, shard: int) -> str:
+        return self._path(folder, f'{shard:06d}.lock' if folder == 'locks' else f'{shard:06d}.npy')
+
+    def shard_pairs(self, shard: int) -> np.ndarray:
+        size = self.job['shard_size']
+        return self.pairs[shard * size:(shard + 1) * size]
+
+    def is_done(self, shard: int) -> bool:
+        return os.path.exists(self._shard_path('done', shard))
+
+    def status(self) -> dict:
+        """ Counts the shards that are done, claimed by a worker and still pending. """
+        done = sum(self.is_done(shard) for shard in range(self.job['n_shards']))
+        claimed = sum(not self.is_done(shard) and os.path.exists(self._shard_path('locks', shard))
+                      for shard in range(self.job['n_shards']))
+        return {'shards': self.job['n_shards'], 'done': done, 'claimed': claimed,
+                'pending': self.job['n_shards'] - done - claimed}
+
+    def claim(self, shard: int, worker_id: str, lease_seconds: float) -> bool:
+        """ Takes the lock of a shard, breaking it if its lease expired. Returns whether the shard is now held. """
+        lock_path = self._shard_path('locks', shard)
+        try:
+            descriptor = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) < lease_seconds:
+                    return False
+                # Only one of the workers racing to break an expired lease succeeds in moving it away
+                stale_path = f'{lock_path}.{worker_id}.stale'
+                os.rename(lock_path, stale_path)
+            except FileNotFoundError:
+                return False
+            if time.time() - os.path.getmtime(stale_path) < lease_seconds:
+                # Another worker broke the lease and claimed the shard in between, hand its lock back
+                try:
+                    os.link(stale_path, lock_path)
+                except FileExistsError:
+                    pass
+                os.remove(stale_path)
+                return False
+            os.remove(stale_path)
+            return self.claim(shard, worker_id, lease_seconds)
+        with os.fdopen(descriptor, 'w') as file:
+            json.dump({'worker': worker_id, 'claimed': time.time()}, file)
+        return True
+
+    def release(self, shard: int):
+        try:
+            os.remove(self._shard_path('locks', shard))
+        except FileNotFoundError:
+            pass
+
+    def run_shard(self, shard: int, worker_id: str) -> int:
+        """
+        Tests a claimed shard from its checkpoint on, checkpointing after every chunk, and marks it done.
+
+        Returns:
+        int: Pairs of the shard taken from the checkpoint rather than tested.
+        """
+        pairs = self.shard_pairs(shard)
+        checkpoint_path = self._shard_path('checkpoints', shard)
+        p_values = np.load(checkpoint_path) if os.path.exists(checkpoint_path) else np.empty(0)
+        resumed = len(p_values)
+        engine = batch_coint_pvalues if self.job['engine'] == 'batch' else serial_coint_pvalues
+        df = pd.DataFrame(self.prices)
+        step = self.job['checkpoint_every']
+        for start in range(resumed, len(pairs), step):
+            chunk = [(int(i), int(j)) for i, j in pairs[start:start + step]]
+            p_values = np.concatenate([p_values, engine(df, chunk)])
+            _save_atomic(checkpoint_path, p_values, worker_id)
+            # Refreshing the lock renews the lease
+            if os.path.exists(self._shard_path('locks', shard)):
+                os.utime(self._shard_path('locks', shard))
+        _save_atomic(self._shard_path('done', shard), p_values, worker_id)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.release(shard)
+        return resumed
+
+    def work(self, worker_id: str = None, lease_seconds: float = 600, poll_seconds: float = 5,
+             max_shards: int = None) -> dict:
+        """
+        Claims and runs shards until every shard is done. While the only shards left are held by other workers
+        it waits, polling every poll_seconds, so it can take over a shard whose worker dies.
+
+        Args:
+        worker_id (str): Name recorded in the locks, defaults to host and process id.
+        lease_seconds (float): Age after which the lock of a shard is taken to belong to a dead worker. Keep it
+            well above the time a checkpoint_every chunk takes.
+        poll_seconds (float): Wait between passes over the queue.
+        max_shards (int): Stop after running this many shards.
+
+        Returns:
+        dict: The shards this worker ran and the pairs it resumed from checkpoints.
+        """
+        worker_id = worker_id or default_worker_id()
+        ran, resumed = [], 0
+        while max_shards is None or len(ran) < max_shards:
+            pending = [shard for shard in range(self.job['n_shards']) if not self.is_done(shard)]
+            if not pending:
+                break
+            for shard in pending:
+                if self.claim(shard, worker_id, lease_seconds):
+                    if self.is_done(shard):
+                        self.release(shard)
+                        continue
+                    resumed += self.run_shard(shard, worker_id)
+                    ran.append(shard)
+                    break
+            else:
+                time.sleep(poll_seconds)
+        return {'worker': worker_id, 'shards': ran, 'resumed_pairs': resumed}
+
+    def p_values(self) -> list:
+        """ Merges the p-values of every shard in the order of the pairs, raises RuntimeError if any is missing. """
+        missing = [shard for shard in range(self.job['n_shards']) if not self.is_done(shard)]
+        if missing:
+            raise RuntimeError(f"{len(missing)} of {self.job['n_shards']} shards are not done, e.g. {missing[:5]}")
+        shards = [np.load(self._shard_path('done', shard)) for shard in range(self.job['n_shards'])]
+        return np.concatenate(shards).tolist() if shards else []
+
+    def reduce(self, p_value_thresh: float) -> pd.DataFrame:
+        """ The cointegrated pairs of the finished job, the DataFrame of StockData.find_cointegrated_pairs. """
+        return cointegrated_pairs_frame(self.job['columns'], self.pairs.tolist(), self.p_values(), p_value_thresh)
+
+
+def run_worker(queue_dir: str, worker_id: str = None, lease_seconds: float = 600, poll_seconds: float = 5,
+               max_shards: int = None) -> dict:
+    """ Works through the job queued in queue_dir, see ShardQueue.work. """
+    return ShardQueue(queue_dir).work(worker_id=worker_id, lease_seconds=lease_seconds, poll_seconds=poll_seconds,
+                                      max_shards=max_shards)
+
+
+def sharded_coint_pvalues(df: pd.DataFrame, pairs: list, queue_dir: str = None, n_workers: int = None,
+                          shard_size: int = 50_000, checkpoint_every: int = 5_000, engine: str = 'batch',
+                          lease_seconds: float = 600) -> list:
+    """
+    Returns the cointegration p-value of each (i, j) column pair, tested shard by shard by n_workers local worker
+    processes, defaulting to the number of CPUs. Workers started on other machines with
+    `python analysis/sharded_screening.py worker <queue_dir>` join in when queue_dir is on a shared filesystem.
+    Without a queue_dir the queue lives in a temporary directory removed afterwards; with one, an interrupted
+    screen resumes from the shards and checkpoints already there.
+    """
+    if not len(pairs):
+        return []
+    temporary = queue_dir is None
+    queue_dir = tempfile.mkdtemp() if temporary else queue_dir
+    os.makedirs(queue_dir, exist_ok=True)
+    try:
+        queue = ShardQueue.create(queue_dir, df, pairs, shard_size=shard_size, checkpoint_every=checkpoint_every,
+                                  engine=engine)
+        n_workers = min(n_workers or os.cpu_count() or 1, queue.job['n_shards'])
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(run_worker, queue_dir, f'{default_worker_id()}-{n}', lease_seconds, 0.5)
+                       for n in range(n_workers)]
+            for future in futures:
+                future.result()
+        return queue.p_values()
+    finally:
+        if temporary:
+            shutil.rmtree(queue_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Works on or reports a sharded cointegration screen.")
+    parser.add_argument('command', choices=('worker', 'status'))
+    parser.add_argument('queue_dir', help="Queue directory of the screen, shared between the machines.")
+    parser.add_argument('--worker-id', default=None, help="Name recorded in the shard locks.")
+    parser.add_argument('--lease', type=float, default=600, help="Seconds before an unrefreshed lock is broken.")
+    parser.add_argument('--poll', type=float, default=5, help="Seconds between passes over the queue.")
+    parser.add_argument('--max-shards', type=int, default=None, help="Stop after this many shards.")
+    args = parser.parse_args()
+    queue = ShardQueue(args.queue_dir)
+    if args.command == 'status':
+        print(json.dumps(queue.status()))
+    else:
+        print(json.dumps(queue.work(worker_id=args.worker_id, lease_seconds=args.lease, poll_seconds=args.poll,
+                                    max_shards=args.max_shards)))
+
+
+if __name__ == '__main__':
+    main()
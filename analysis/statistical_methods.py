@@ -1,10 +1,10 @@
+import logging
+import math
 import os
 import sys
 
 import numpy as np
 import pandas as pd
-import yfinance as yf
-from statsmodels.regression.rolling import RollingOLS
 from statsmodels.tsa.stattools import adfuller
 
 # Directory Path Setup
@@ -16,36 +16,322 @@ sys.path.append(root_dir)
 
 # Custom Module Imports
 from utils.my_timer import timeit
+from utils.profiling import profiled
 from analysis.DATES import Dates
+from analysis.price_cache import download_prices
+from analysis.backtest import zscore_signal
+from analysis.kalman import KalmanHedge, HEDGE_METHODS
+from analysis.result_store import series_hashes, pair_hash
+from analysis.cointegration import batch_adf_pvalues
 
 
-def collect_metrics_for_pair(stock_1, stock_2) -> pd.DataFrame:
+def window_sums(values: np.ndarray, window: int) -> np.ndarray:
+    """ Sum of the trailing window of each row, along axis 0, from one running sum: O(n) for any window length. """
+    running_sum = np.cumsum(values, axis=0)
+    sums = running_sum.copy()
+    sums[window:] -= running_sum[:-window]
+    return sums
+
+
+def rolling_beta(y, x, window: int) -> np.ndarray:
     """
-    Downloads and processes financial data for a pair of stocks.
-    Calculates returns, forward returns, hedge ratio using rolling OLS, spread, rolling correlation, and z-score.
-    Classifies z-scores into trading signals.
+    Slope of a rolling regression of y on x without an intercept, the hedge ratio that
+    RollingOLS(y, x, window=window).fit().params gives, computed from running sums of x*y and x*x.
+    y and x are 1-D arrays for one pair or 2-D (bars, pairs) arrays to run a batch of pairs column by column.
+    Rows where either value is NaN are skipped within their windows like RollingOLS does, and the first
+    window - 1 rows are NaN.
     """
+    y = np.asarray(y, dtype=float)
+    x = np.asarray(x, dtype=float)
+    missing = np.isnan(x) | np.isnan(y)
+    x = np.where(missing, 0.0, x)
+    y = np.where(missing, 0.0, y)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = window_sums(x * y, window) / window_sums(x * x, window)
+    beta[window_sums(~missing, window) < 1] = np.nan
+    beta[:window - 1] = np.nan
+    return beta
 
-    # Downloading the required data
-    stock_data_df = (
-        yf.download(tickers=[stock_1, stock_2], start=Dates.START_DATE.value, end=Dates.END_DATE.value))
-    stock_data_df = stock_data_df.stack()
 
+class RingBuffer:
+    """ Fixed size window of floats. push() returns the value that falls out of the window, or None until full. """
+
+    def __init__(self, size: int):
+        self.values = np.zeros(size)
+        self.size = size
+        self.count = 0
+        self.position = 0
+
+    def push(self, value: float):
+        evicted = self.values[self.position] if self.count == self.size else None
+        self.values[self.position] = value
+        self.position = (self.position + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        return evicted
+
+    def is_full(self) -> bool:
+        return self.count == self.size
+
+
+class RollingMoments:
+    """
+    Means and co-moment of one or two series over a sliding window, kept with Welford style updates: the oldest
+    pair of values is removed from the running moments before the newest is added, so each bar costs O(1)
+    without the cancellation of running sums of squares.
+    """
+
+    def __init__(self, window: int):
+        self.x = RingBuffer(window)
+        self.y = RingBuffer(window)
+        self.count = 0
+        self.mean_x = self.mean_y = 0.0
+        self.m2_x = self.m2_y = self.c_xy = 0.0
+
+    def _remove(self, x: float, y: float):
+        self.count -= 1
+        if self.count == 0:
+            self.mean_x = self.mean_y = self.m2_x = self.m2_y = self.c_xy = 0.0
+            return
+        dx, dy = x - self.mean_x, y - self.mean_y
+        self.mean_x -= dx / self.count
+        self.mean_y -= dy / self.count
+        self.m2_x -= dx * (x - self.mean_x)
+        self.m2_y -= dy * (y - self.mean_y)
+        self.c_xy -= dx * (y - self.mean_y)
+
+    def _add(self, x: float, y: float):
+        self.count += 1
+        dx, dy = x - self.mean_x, y - self.mean_y
+        self.mean_x += dx / self.count
+        self.mean_y += dy / self.count
+        self.m2_x += dx * (x - self.mean_x)
+        self.m2_y += dy * (y - self.mean_y)
+        self.c_xy += dx * (y - self.mean_y)
+
+    def push(self, x: float, y: float = 0.0):
+        evicted_x, evicted_y = self.x.push(x), self.y.push(y)
+        if evicted_x is not None:
+            self._remove(evicted_x, evicted_y)
+        self._add(x, y)
+
+    def is_full(self) -> bool:
+        return self.x.is_full()
+
+    def std_x(self) -> float:
+        """ Sample standard deviation (ddof=1) like pandas rolling().std(). """
+        return math.sqrt(max(self.m2_x, 0.0) / (self.count - 1))
+
+    def corr(self) -> float:
+        denominator = math.sqrt(max(self.m2_x, 0.0) * max(self.m2_y, 0.0))
+        return self.c_xy / denominator if denominator > 0 else np.nan
+
+
+class PairState:
+    """
+    Incremental version of collect_metrics_for_pair for live trading. Holds the rolling windows of a pair in ring
+    buffers and updates the hedge ratio, spread, z-score, rolling correlation and signal in constant time as each
+    new bar arrives, matching the batch computation on the same bars to within floating point.
+    Metrics are NaN until their windows have filled, exactly where the batch columns are NaN.
+    """
+
+    def __init__(self, hedge_window: int = 60, z_window: int = 50, corr_window: int = 180, entry: float = 1.0):
+        self.hedge_window = hedge_window
+        self.entry = entry
+        self.returns_1 = RingBuffer(hedge_window)
+        self.returns_2 = RingBuffer(hedge_window)
+        self.sum_xy = self.sum_xx = 0.0
+        self.valid_returns = RingBuffer(hedge_window)
+        self.valid_count = 0
+        self.spread_moments = RollingMoments(z_window)
+        self.price_moments = RollingMoments(corr_window)
+        self.previous_prices = None
+        self.bars = 0
+
+    @classmethod
+    def from_history(cls, prices_1, prices_2, **kwargs) -> 'PairState':
+        """ Creates a PairState seeded with the given price history. """
+        pair_state = cls(**kwargs)
+        pair_state.seed(prices_1, prices_2)
+        return pair_state
+
+    def seed(self, prices_1, prices_2) -> dict:
+        """ Feeds a price history bar by bar and returns the metrics of the last bar. """
+        metrics = None
+        for price_1, price_2 in zip(np.asarray(prices_1, dtype=float), np.asarray(prices_2, dtype=float)):
+            metrics = self.update(price_1, price_2)
+        return metrics
+
+    def _update_hedge_ratio(self, return_1: float, return_2: float) -> float:
+        valid = not (math.isnan(return_1) or math.isnan(return_2))
+        x, y = (return_1, return_2) if valid else (0.0, 0.0)
+        evicted_x, evicted_y = self.returns_1.push(x), self.returns_2.push(y)
+        self.valid_count += valid - (self.valid_returns.push(float(valid)) or 0)
+        if evicted_x is not None:
+            self.sum_xy -= evicted_x * evicted_y
+            self.sum_xx -= evicted_x * evicted_x
+        self.sum_xy += x * y
+        self.sum_xx += x * x
+        if self.bars % self.hedge_window == 0:
+            # Re-sum the window now and then so rounding in the running sums cannot drift
+            self.sum_xy = float(np.dot(self.returns_1.values, self.returns_2.values))
+            self.sum_xx = float(np.dot(self.returns_1.values, self.returns_1.values))
+
+        if not self.returns_1.is_full() or self.valid_count < 1 or self.sum_xx == 0:
+            return np.nan
+        return self.sum_xy / self.sum_xx
+
+    def update(self, price_1: float, price_2: float) -> dict:
+        """
+        Adds one bar of prices and returns the pair's current metrics.
+
+        Returns:
+        dict: hedge_ratio, spread, z_score, roll_corr and signal, with the column names of collect_metrics_for_pair.
+        """
+        self.bars += 1
+        if self.previous_prices is None:
+            return_1 = return_2 = np.nan
+        else:
+            return_1 = math.log(price_1 / self.previous_prices[0])
+            return_2 = math.log(price_2 / self.previous_prices[1])
+        self.previous_prices = (price_1, price_2)
+
+        # Stock 2's return regressed on stock 1's, as collect_metrics_for_pair does
+        hedge_ratio = self._update_hedge_ratio(return_1, return_2)
+        spread = price_1 - price_2 * hedge_ratio
+
+        z_score = np.nan
+        if not math.isnan(spread):
+            self.spread_moments.push(spread)
+            if self.spread_moments.is_full():
+                spread_std = self.spread_moments.std_x()
+                z_score = (spread - self.spread_moments.mean_x) / spread_std if spread_std > 0 else np.nan
+
+        self.price_moments.push(price_1, price_2)
+        roll_corr = self.price_moments.corr() if self.price_moments.is_full() else np.nan
+
+        signal = 1 if z_score < -self.entry else -1 if z_score > self.entry else 0
+        return {'hedge_ratio': hedge_ratio, 'spread': spread, 'z_score': z_score, 'roll_corr': roll_corr,
+                'signal': signal}
+
+
+# Session level memo of computed pair metrics, so a screen downloads and computes each pair at most once
+_pair_metrics_memo = {}
+
+
+def clear_pair_metrics_memo():
+    """ Empties the pair metrics memo, called at the start of each screen. """
+    _pair_metrics_memo.clear()
+
+
+def slice_pair_prices(price_panel: pd.DataFrame, stock_1, stock_2) -> (pd.DataFrame, pd.DataFrame):
+    """
+    Slices the adjusted close and open prices of a pair out of a preloaded price panel.
+    The panel is either an Adj Close panel with one column per ticker (StockData.price_history_df) or a panel with
+    (field, ticker) MultiIndex columns holding at least Adj Close and optionally Open (StockData.price_panel).
+    Returns the adjusted close prices and the open prices, or None for the open prices when the panel has none.
+    """
+    if isinstance(price_panel.columns, pd.MultiIndex):
+        fields = price_panel.columns.get_level_values(0)
+        adj_close = price_panel['Adj Close'][[stock_1, stock_2]]
+        open_prices = price_panel['Open'][[stock_1, stock_2]] if 'Open' in fields else None
+        return adj_close, open_prices
+    return price_panel[[stock_1, stock_2]], None
+
+
+def pair_returns(stock_1, stock_2, adj_close: pd.DataFrame, open_prices: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Builds the price and return columns of a pair that every strategy metric starts from: the adjusted close
+    prices, the next bar's open to close return (close to close without open prices) and the log returns.
+    """
     # Finding the required metrics
-    stock_data_df['return'] = (stock_data_df['Adj Close'] - stock_data_df['Open']) / stock_data_df['Open']
-    stock_data_df['forward_return'] = stock_data_df.groupby(level=1)['return'].transform(lambda x: x.shift(-1))
-    stock_data_df = stock_data_df[['Adj Close', 'forward_return']].unstack().droplevel(axis=1, level=0)
-    stock_data_df.columns = [stock_1, stock_2, f'{stock_1}_forward_return', f'{stock_2}_forward_return']
+    if open_prices is not None:
+        returns = (adj_close - open_prices) / open_prices
+    else:
+        returns = adj_close.pct_change()
+    forward_returns = returns.shift(-1)
+
+    stock_data_df = pd.DataFrame({stock_1: adj_close[stock_1],
+                                  stock_2: adj_close[stock_2],
+                                  f'{stock_1}_forward_return': forward_returns[stock_1],
+                                  f'{stock_2}_forward_return': forward_returns[stock_2]})
     stock_data_df[f'{stock_1}_return'] = np.log(stock_data_df[stock_1]).diff()
     stock_data_df[f'{stock_2}_return'] = np.log(stock_data_df[stock_2]).diff()
+    return stock_data_df
+
+
+def _pair_prices_hash(stock_1, stock_2, adj_close: pd.DataFrame, open_prices: pd.DataFrame = None) -> str:
+    """ Content hash of a pair's prices, see analysis.result_store.pair_hash. """
+    pair_prices = adj_close if open_prices is None else pd.concat({'Adj Close': adj_close, 'Open': open_prices},
+                                                                  axis=1)
+    hashes = series_hashes(pair_prices)
+    return pair_hash(hashes[stock_1], hashes[stock_2])
+
+
+@profiled
+def collect_metrics_for_pair(stock_1, stock_2, price_panel: pd.DataFrame = None, bar_store=None,
+                             bar_rule: str = None, hedge_method: str = 'rolling_ols',
+                             result_store=None) -> pd.DataFrame:
+    """
+    Downloads and processes financial data for a pair of stocks.
+    Calculates returns, forward returns, hedge ratio using rolling OLS, spread, rolling correlation, and z-score.
+    Classifies z-scores into trading signals.
+
+    If a price_panel is given the pair is sliced out of it instead of being downloaded, see slice_pair_prices.
+    With a bar_store (analysis.bar_store.BarStore) the pair is read from it, resampled to bar_rule if given.
+    hedge_method 'kalman' estimates the hedge ratio and an intercept with analysis.kalman.KalmanHedge instead of
+    the 60 bar rolling OLS, the spread is then stock 1's price less the fitted price from the bar before.
+    With a result_store (analysis.result_store.ResultStore) the metrics are also kept across sessions, keyed by a
+    hash of the pair's prices.
+    Without Open prices the daily return is measured close to close rather than open to close.
+    Results are memoised for the session, the returned DataFrame is a copy the caller is free to modify.
+    """
+    if hedge_method not in HEDGE_METHODS:
+        raise ValueError(f"hedge_method must be one of {HEDGE_METHODS}, got {hedge_method!r}")
+    if price_panel is None and bar_store is not None:
+        price_panel = bar_store.panel([stock_1, stock_2], start=Dates.START_DATE.value, end=Dates.END_DATE.value,
+                                      fields=('Adj Close', 'Open'), rule=bar_rule).dropna()
+    if price_panel is None:
+        memo_key = (stock_1, stock_2, Dates.START_DATE.value, Dates.END_DATE.value, hedge_method)
+        if memo_key in _pair_metrics_memo:
+            return _pair_metrics_memo[memo_key].copy()
+
+        # Downloading the required data
+        prices_df = download_prices([stock_1, stock_2], start=Dates.START_DATE.value, end=Dates.END_DATE.value,
+                                    fields=('Adj Close', 'Open'))
+        adj_close, open_prices = prices_df['Adj Close'], prices_df['Open']
+        input_hash = None
+    else:
+        adj_close, open_prices = slice_pair_prices(price_panel, stock_1, stock_2)
+        # Keyed by the pair's prices, two panels spanning the same dates may still hold different prices
+        input_hash = _pair_prices_hash(stock_1, stock_2, adj_close, open_prices)
+        memo_key = (stock_1, stock_2, input_hash, hedge_method)
+        if memo_key in _pair_metrics_memo:
+            return _pair_metrics_memo[memo_key].copy()
 
-    # Calculating the hedge ration using a rolling OLS regression
-    stock_data_df['hedge_ratio'] = RollingOLS(stock_data_df[f'{stock_2}_return'],
-                                              stock_data_df[f'{stock_1}_return'],
-                                              window=60).fit().params.values
+    if result_store is not None:
+        if input_hash is None:
+            input_hash = _pair_prices_hash(stock_1, stock_2, adj_close, open_prices)
+        params = {'hedge_method': hedge_method}
+        stored = result_store.get('pair_metrics', stock_1, stock_2, input_hash, params)
+        if stored is not None:
+            _pair_metrics_memo[memo_key] = stored
+            return stored.copy()
 
-    # Calculating the spread of stock 1 and stock 2 price
-    stock_data_df['spread'] = (stock_data_df[stock_1] - stock_data_df[stock_2] * stock_data_df['hedge_ratio'])
+    stock_data_df = pair_returns(stock_1, stock_2, adj_close, open_prices)
+
+    if hedge_method == 'kalman':
+        kalman = KalmanHedge(1).filter(stock_data_df[stock_1].to_numpy(), stock_data_df[stock_2].to_numpy())
+        stock_data_df['hedge_ratio'] = kalman['hedge_ratio']
+        stock_data_df['spread'] = kalman['spread']
+    else:
+        # Calculating the hedge ration using a rolling OLS regression
+        stock_data_df['hedge_ratio'] = rolling_beta(stock_data_df[f'{stock_2}_return'],
+                                                    stock_data_df[f'{stock_1}_return'],
+                                                    window=60)
+
+        # Calculating the spread of stock 1 and stock 2 price
+        stock_data_df['spread'] = (stock_data_df[stock_1] - stock_data_df[stock_2] * stock_data_df['hedge_ratio'])
 
     # Rolling Correlation test
     stock_data_df['roll_corr'] = stock_data_df[stock_1].rolling(180).corr(stock_data_df[stock_2])
@@ -55,43 +341,146 @@ def collect_metrics_for_pair(stock_1, stock_2) -> pd.DataFrame:
 
     stock_data_df['z_score'] = smooth_zscore(stock_data_df['spread'])
 
-    def classify_zscore(df: pd.DataFrame) -> int:
-        if df['z_score'] < -1:
-            return 1
-        elif df['z_score'] > 1:
-            return -1
-        else:
-            return 0
-
     # trading Signal
-    stock_data_df['signal'] = stock_data_df.apply(classify_zscore, axis=1)
+    stock_data_df['signal'] = zscore_signal(stock_data_df['z_score'])
+
+    stock_data_df = stock_data_df.dropna()
+    _pair_metrics_memo[memo_key] = stock_data_df
+    if result_store is not None:
+        result_store.put('pair_metrics', stock_1, stock_2, input_hash, stock_data_df, params)
+    return stock_data_df.copy()
 
-    return stock_data_df.dropna()
 
+# Parameters the ADF outcomes are stored under, those of adfuller's defaults on the rolling OLS spread
+ADF_PARAMS = {'regression': 'c', 'autolag': 'AIC', 'hedge_method': 'rolling_ols'}
 
-def adf_test(stock_1, stock_2) -> bool:
+
+@profiled
+def adf_pvalue(stock_1, stock_2, price_panel: pd.DataFrame = None) -> float:
+    """ The Augmented Dickey-Fuller p-value of the spread of two stocks, see collect_metrics_for_pair. """
+    removed_na_df = collect_metrics_for_pair(stock_1, stock_2, price_panel=price_panel)
+    return adfuller(removed_na_df['spread'])[1]
+
+
+@profiled
+def adf_test(stock_1, stock_2, price_panel: pd.DataFrame = None, p_value_thresh: float = 0.05) -> bool:
     """
     Performs the Augmented Dickey-Fuller test on the spread of two stocks to assess stationarity.
-    Returns True if the spread is stationary, False otherwise.
+    Returns True if the spread is stationary at p_value_thresh, False otherwise.
+    """
+    return adf_pvalue(stock_1, stock_2, price_panel=price_panel) <= p_value_thresh
+
+
+def pair_spreads(pairs: list, price_panel: pd.DataFrame) -> (pd.DataFrame, dict):
+    """
+    The rolling OLS spreads of many pairs at once, each NaN-masked to the bars collect_metrics_for_pair keeps for
+    the pair, so a column without its NaNs is the 'spread' column that function returns. The hedge ratios, rolling
+    correlations and z-scores that decide the mask are computed for all pairs together instead of pair by pair.
+
+    Args:
+    pairs (list): (stock_1, stock_2) ticker pairs.
+    price_panel (pd.DataFrame): Prices as collect_metrics_for_pair takes them, see slice_pair_prices.
+
+    Returns:
+    (pd.DataFrame, dict): (bars, pairs) spreads with one column per pair in order, and position -> error message
+        of the pairs that have no spread.
+    """
+    if isinstance(price_panel.columns, pd.MultiIndex):
+        adj_close = price_panel['Adj Close']
+        open_prices = price_panel['Open'] if 'Open' in price_panel.columns.get_level_values(0) else None
+    else:
+        adj_close, open_prices = price_panel, None
+    if open_prices is not None:
+        returns = (adj_close - open_prices[adj_close.columns]) / open_prices[adj_close.columns]
+    else:
+        returns = adj_close.pct_change()
+
+    errors = {}
+    positions_1 = adj_close.columns.get_indexer([stock_1 for stock_1, _ in pairs])
+    positions_2 = adj_close.columns.get_indexer([stock_2 for _, stock_2 in pairs])
+    for n, (stock_1, stock_2) in enumerate(pairs):
+        missing = [stock for stock, position in ((stock_1, positions_1[n]), (stock_2, positions_2[n])) if position < 0]
+        if missing:
+            errors[n] = f"{', '.join(missing)} not in the price panel"
+    positions_1, positions_2 = np.maximum(positions_1, 0), np.maximum(positions_2, 0)
+
+    prices = adj_close.to_numpy(dtype=float)
+    prices_1, prices_2 = prices[:, positions_1], prices[:, positions_2]
+    forward_returns = np.roll(returns.to_numpy(dtype=float), -1, axis=0)
+    forward_returns[-1] = np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_returns = np.diff(np.log(prices), axis=0, prepend=np.nan)
+    # Stock 2's return regressed on stock 1's, as collect_metrics_for_pair does
+    hedge_ratio = rolling_beta(log_returns[:, positions_2], log_returns[:, positions_1], window=60)
+    spread = pd.DataFrame(prices_1 - prices_2 * hedge_ratio)
+    roll_corr = pd.DataFrame(prices_1).rolling(180).corr(pd.DataFrame(prices_2))
+    z_score = (spread.rolling(1).mean() - spread.rolling(50).mean()) / spread.rolling(50).std()
+
+    kept = (~np.isnan(prices_1) & ~np.isnan(prices_2) & ~np.isnan(forward_returns[:, positions_1])
+            & ~np.isnan(forward_returns[:, positions_2]) & ~np.isnan(log_returns[:, positions_1])
+            & ~np.isnan(log_returns[:, positions_2]) & ~np.isnan(hedge_ratio) & spread.notna().to_numpy()
+            & roll_corr.notna().to_numpy() & z_score.notna().to_numpy())
+    kept[:, list(errors)] = False
+    return pd.DataFrame(np.where(kept, spread.to_numpy(), np.nan), index=adj_close.index), errors
+
+
+def adf_pvalues_for_pairs(highest_corr_pairs, price_panel: pd.DataFrame = None,
+                          result_store=None) -> (np.ndarray, dict):
+    """
+    ADF p-values of the spreads of every (Stock_1, Stock_2) pair of highest_corr_pairs, tested together: the
+    spreads come from pair_spreads and go through analysis.cointegration.batch_adf_pvalues, with adfuller's
+    constant and AIC lag selection. Without a price_panel the prices of all the pairs are downloaded at once.
+    With a result_store the p-values of the whole list are looked up in one query and only the pairs missing from
+    the store are tested.
+
+    Returns:
+    (np.ndarray, dict): The p-values in the order of the pairs, NaN for a pair whose test failed, and position ->
+        error message of those pairs.
     """
-    removed_na_df = collect_metrics_for_pair(stock_1, stock_2)
-    adf_result = adfuller(removed_na_df['spread'])[1]
-    return adf_result <= 0.05
+    pairs = list(zip(highest_corr_pairs['Stock_1'], highest_corr_pairs['Stock_2']))
+    if price_panel is None:
+        tickers = list(dict.fromkeys(stock for pair in pairs for stock in pair))
+        price_panel = download_prices(tickers, start=Dates.START_DATE.value, end=Dates.END_DATE.value,
+                                      fields=('Adj Close', 'Open'))
+    p_values = np.full(len(pairs), np.nan)
+    stored, keys = {}, None
+    if result_store is not None:
+        hashes = series_hashes(price_panel)
+        keys = [(stock_1, stock_2, pair_hash(hashes[stock_1], hashes[stock_2])) if stock_1 in hashes and
+                stock_2 in hashes else (stock_1, stock_2, None) for stock_1, stock_2 in pairs]
+        stored = result_store.get_many('adf', [key for key in keys if key[2] is not None], ADF_PARAMS)
+    missing = [n for n in range(len(pairs)) if keys is None or keys[n] not in stored]
+    for n in range(len(pairs)):
+        if keys is not None and keys[n] in stored:
+            p_values[n] = stored[keys[n]]
+
+    errors = {}
+    if missing:
+        spreads, spread_errors = pair_spreads([pairs[n] for n in missing], price_panel)
+        tested, adf_errors = batch_adf_pvalues(spreads.to_numpy(), regression=ADF_PARAMS['regression'],
+                                               autolag=ADF_PARAMS['autolag'])
+        p_values[missing] = tested
+        errors = {missing[position]: error for position, error in {**adf_errors, **spread_errors}.items()}
+        if keys is not None:
+            result_store.put_many('adf', [(*keys[n], float(p_values[n])) for n in missing if n not in errors],
+                                  ADF_PARAMS)
+    return p_values, errors
 
 
 @timeit
-def run_adf_on_best_pairs(highest_corr_pairs) -> list:
-    try:
-        """
-        Applies the ADF test on pairs of stocks with the highest correlation.
-        Returns a list of results indicating whether each pair's spread is stationary.
-        """
-        adf_list = []
-        if len(highest_corr_pairs) != 0:
-            for n in range(len(highest_corr_pairs)):
-                result = adf_test(highest_corr_pairs['Stock_1'][n], highest_corr_pairs['Stock_2'][n])
-                adf_list.append(result)
-            return adf_list
-    except Exception as e:
-        print(e)
+def run_adf_on_best_pairs(highest_corr_pairs, price_panel: pd.DataFrame = None, p_value_thresh: float = 0.05,
+                          result_store=None) -> list:
+    """
+    Applies the ADF test on pairs of stocks with the highest correlation.
+    Returns a list of results indicating whether each pair's spread is stationary, the adf_test column of
+    highest_corr_pairs. The spreads of all pairs are tested in one batch, see adf_pvalues_for_pairs. Pass the
+    screening price_panel so the pairs are sliced from it rather than downloaded again. A pair whose test fails is
+    logged and counts as not stationary, the other pairs are unaffected.
+    """
+    if len(highest_corr_pairs) == 0:
         return []
+    p_values, errors = adf_pvalues_for_pairs(highest_corr_pairs, price_panel=price_panel, result_store=result_store)
+    for n, error in sorted(errors.items()):
+        logging.warning(f"ADF test failed for {highest_corr_pairs['Stock_1'].iloc[n]} - "
+                        f"{highest_corr_pairs['Stock_2'].iloc[n]}: {error}")
+    return [bool(p_value <= p_value_thresh) for p_value in p_values]
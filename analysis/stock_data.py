@@ -1,9 +1,8 @@
 import os
 import sys
 
+import numpy as np
 import pandas as pd
-import yfinance as yf
-from statsmodels.tsa.stattools import coint
 
 # Directory Path Setup
 """ Set up the directory path for the script and adjust sys.path for module imports. """
@@ -14,72 +13,151 @@ sys.path.append(root_dir)
 # Custom Module Imports
 from utils.my_timer import timeit
 from analysis.DATES import Dates
+from analysis.price_cache import download_prices
 from analysis.errors import NoSuitablePairsError
 from utils.formatting_and_logs import blue_bold_print, green_bold_print
-from analysis.statistical_methods import run_adf_on_best_pairs
+from analysis.statistical_methods import run_adf_on_best_pairs, clear_pair_metrics_memo
+from analysis.cointegration import all_pairs, serial_coint_pvalues, parallel_coint_pvalues, batch_coint_pvalues
+from analysis.cointegration import COINT_ENGINES, cointegrated_pairs_frame
+from analysis.sharded_screening import sharded_coint_pvalues
+from analysis.screening import ScreeningReport
+from analysis.correlation import blocked_corr_pairs
+from analysis.result_store import series_hashes, pair_hash
 
 pd.set_option('mode.chained_assignment', None)
 
+# Parameters the cointegration outcomes are stored under, every engine runs coint(trend="c", autolag="BIC")
+COINT_PARAMS = {'trend': 'c', 'autolag': 'BIC'}
+
 
 class StockData:
     """ A class for managing and analyzing stock data. """
 
-    def __init__(self, asset_list, bypass_adf_test):
-        """ Initializes the StockData object by downloading stock data, finding high correlation and cointegrated
-        pairs, and determining the most suitable pair for analysis."""
-        self.price_history_df = self.download_stock_data(asset_list)
-        self.highest_corr_pairs_df = self.find_highest_corr_pairs(self.price_history_df)
-        self.co_integrated_pairs_df = self.find_cointegrated_pairs(self.price_history_df, p_value_thresh=0.05)
-        self.co_int_correlation_combined_df = self.combine_cointegration_correlation()
+    def __init__(self, asset_list, bypass_adf_test, coint_engine='serial', n_workers=None, corr_thresh=0.80,
+                 coint_p_thresh=0.05, adf_p_thresh=0.05, bar_store=None, bar_rule=None, corr_top_k=None,
+                 corr_dtype=np.float64, result_store=None, shard_dir=None):
+        """ Initializes the StockData object by downloading stock data and screening it for the most suitable pair.
+        The screen runs in stages, each on the survivors of the stage before: pairs correlated at corr_thresh or
+        above, then those cointegrated at coint_p_thresh, then those whose spread passes the ADF test at
+        adf_p_thresh, which are finally ranked. Timings and survivor counts are kept in screening_report.
+        coint_engine selects how the cointegration tests are run, see find_cointegrated_pairs, and n_workers
+        sizes the process pool of the parallel engine and the local workers of the sharded engine, whose queue is
+        kept in shard_dir. With a bar_store (analysis.bar_store.BarStore) the prices are read from it instead of
+        downloaded, resampled to bar_rule (e.g. '1h') if given. corr_top_k and corr_dtype bound the correlation
+        stage, see find_highest_corr_pairs. With a result_store (analysis.result_store.ResultStore) the
+        cointegration and ADF outcomes of earlier screens over the same prices are reused."""
+        if coint_engine not in COINT_ENGINES:
+            raise ValueError(f"coint_engine must be one of {COINT_ENGINES}, got {coint_engine!r}")
+        self.coint_engine = coint_engine
+        self.n_workers = n_workers
+        self.bar_store = bar_store
+        self.bar_rule = bar_rule
+        self.corr_top_k = corr_top_k
+        self.corr_dtype = corr_dtype
+        self.result_store = result_store
+        self.shard_dir = shard_dir
+        self.screening_report = ScreeningReport()
+        clear_pair_metrics_memo()
+        self.price_panel = self.download_stock_data(asset_list)
+        self.price_history_df = self.price_panel['Adj Close']
+
+        n_tickers = len(self.price_history_df.columns)
+        with self.screening_report.stage('correlation', candidates=n_tickers * (n_tickers - 1) // 2) as stage:
+            self.highest_corr_pairs_df = self.find_highest_corr_pairs(self.price_history_df, corr_thresh)
+            stage['survivors'] = len(self.highest_corr_pairs_df)
+
+        with self.screening_report.stage('cointegration', candidates=len(self.highest_corr_pairs_df)) as stage:
+            survivors = list(zip(self.highest_corr_pairs_df['Stock_1'], self.highest_corr_pairs_df['Stock_2']))
+            self.co_integrated_pairs_df = self.find_cointegrated_pairs(self.price_history_df,
+                                                                       p_value_thresh=coint_p_thresh, pairs=survivors)
+            self.co_int_correlation_combined_df = self.combine_cointegration_correlation()
+            stage['survivors'] = len(self.co_int_correlation_combined_df)
+
         if bypass_adf_test:
             self.adf_tested_df = self.co_int_correlation_combined_df
         else:
-            self.adf_tested_df = self.filter_for_best_pairs()
+            with self.screening_report.stage('adf', candidates=len(self.co_int_correlation_combined_df)) as stage:
+                self.adf_tested_df = self.filter_for_best_pairs(adf_p_thresh)
+                stage['survivors'] = len(self.adf_tested_df)
+
+        with self.screening_report.stage('ranking', candidates=len(self.adf_tested_df)) as stage:
+            self.adf_tested_df = self.rank_pairs(self.adf_tested_df)
+            stage['survivors'] = len(self.adf_tested_df)
+        blue_bold_print("Screening stages:")
+        print(self.screening_report)
+        if self.result_store is not None:
+            blue_bold_print("Result store " + self.result_store.summary())
+
         self.most_suitable_pair = self.find_most_suitable_pair()
 
     @timeit
     def download_stock_data(self, asset_list: list):
-        """ Downloads the historical adjusted close prices of the stocks in the given asset list. """
+        """ Downloads the historical adjusted close and open prices of the stocks in the given asset list. The
+        open prices are kept so per-pair metrics can be sliced from this panel instead of downloaded again. """
         blue_bold_print("Starting data download...")
         end = Dates.END_DATE.value
         start = Dates.START_DATE.value
-        prices_df = yf.download(tickers=asset_list, start=start, end=end)['Adj Close']
-        prices_df = prices_df.dropna(axis=0)
+        if self.bar_store is not None:
+            prices_df = self.bar_store.panel(asset_list, start=start, end=end, fields=('Adj Close', 'Open'),
+                                             rule=self.bar_rule)
+        else:
+            prices_df = download_prices(asset_list, start=start, end=end, fields=('Adj Close', 'Open'))
+        # Only copied when there are gaps, bars read straight from a bar store stay views of its files
+        if prices_df.isna().to_numpy().any():
+            prices_df = prices_df.dropna(axis=0)
         return prices_df
 
     @timeit
-    def find_highest_corr_pairs(self, df):
-        """ Identifies the highest correlation pairs from the given DataFrame. """
-        corr_matrix = df.corr().abs()
-        cmu = corr_matrix.unstack()
-        cmu = cmu[cmu != 1]
-        cmu = cmu[~cmu.duplicated()]
-        cmu = cmu.sort_values(kind="quicksort", ascending=False)
-        cmu = cmu.reset_index()
-        cmu = cmu.rename(columns={"level_0": 'Stock_1', "level_1": 'Stock_2', 0: 'Correlation'})
-        highest_corr_pairs = cmu[cmu['Correlation'] >= 0.80]
+    def find_highest_corr_pairs(self, df, corr_thresh=0.80):
+        """ Identifies the pairs from the given DataFrame whose absolute correlation is at least corr_thresh, only
+        the corr_top_k most correlated if set. The correlations are computed in tiles of the upper triangle, see
+        analysis.correlation.blocked_corr_pairs, so the N x N matrix is never held in memory. """
+        highest_corr_pairs = blocked_corr_pairs(df, corr_thresh=corr_thresh, top_k=self.corr_top_k,
+                                                dtype=self.corr_dtype)
         highest_corr_pairs['lookup'] = highest_corr_pairs['Stock_1'] + ' - ' + highest_corr_pairs['Stock_2']
         return highest_corr_pairs
 
     @timeit
-    def find_cointegrated_pairs(self, df, p_value_thresh):
-        """ Finds cointegrated pairs of stocks within a given DataFrame based on a specified p-value threshold. """
-        n = len(df.columns)
-        cointegrated_pairs_dict = {}
-
-        for i in range(n):
-            for j in range(i + 1, n):
-                S1 = df.iloc[:, i]
-                S2 = df.iloc[:, j]
-                result = coint(S1, S2, trend="c", autolag="BIC")
-                p_value = round(result[1], 5)
-                if p_value <= p_value_thresh:
-                    cointegrated_pairs_dict[f"{df.columns[i]} - {df.columns[j]}"] = p_value
-
-        cointegrated_pairs_df = (pd.DataFrame.from_dict(cointegrated_pairs_dict, orient='index')
-                                 .rename(columns={0: 'Cointegration'}))
+    def find_cointegrated_pairs(self, df, p_value_thresh, pairs=None):
+        """ Finds cointegrated pairs of stocks within a given DataFrame based on a specified p-value threshold.
+        Only the (Stock_1, Stock_2) ticker pairs given are tested, every pair of columns if pairs is None.
+        With the 'parallel' engine the pairs are tested in chunks across a process pool, the result is identical
+        to the 'serial' engine. The 'batch' engine runs a vectorised Engle-Granger test over all pairs at once,
+        its p-values match statsmodels to within floating point. The 'sharded' engine queues the pairs in shards in
+        shard_dir, see analysis.sharded_screening, so workers on other machines sharing it can help. With a
+        result_store only the pairs it does not hold for these prices are tested. """
+        if pairs is None:
+            pairs = all_pairs(len(df.columns))
+        else:
+            pairs = [(df.columns.get_loc(stock_1), df.columns.get_loc(stock_2)) for stock_1, stock_2 in pairs]
+        stored, keys = {}, None
+        if self.result_store is not None:
+            hashes = series_hashes(df)
+            keys = [(df.columns[i], df.columns[j], pair_hash(hashes[df.columns[i]], hashes[df.columns[j]]))
+                    for i, j in pairs]
+            stored = self.result_store.get_many('coint', keys, COINT_PARAMS)
+        missing = [n for n in range(len(pairs)) if keys is None or keys[n] not in stored]
+        missing_pairs = [pairs[n] for n in missing]
+        if not missing_pairs:
+            tested = []
+        elif self.coint_engine == 'parallel':
+            tested = parallel_coint_pvalues(df, missing_pairs, n_workers=self.n_workers)
+        elif self.coint_engine == 'batch':
+            tested = batch_coint_pvalues(df, missing_pairs)
+        elif self.coint_engine == 'sharded':
+            tested = sharded_coint_pvalues(df, missing_pairs, queue_dir=self.shard_dir, n_workers=self.n_workers)
+        else:
+            tested = serial_coint_pvalues(df, missing_pairs)
+        if keys is not None:
+            self.result_store.put_many('coint', [(*keys[n], p_value) for n, p_value in zip(missing, tested)],
+                                       COINT_PARAMS)
+            p_values = [stored[key] if key in stored else None for key in keys]
+            for n, p_value in zip(missing, tested):
+                p_values[n] = p_value
+        else:
+            p_values = tested
 
-        return cointegrated_pairs_df
+        return cointegrated_pairs_frame(df.columns, pairs, p_values, p_value_thresh)
 
     @timeit
     def combine_cointegration_correlation(self) -> pd.DataFrame:
@@ -90,13 +168,25 @@ class StockData:
         print(coint_corr_data)
         return coint_corr_data
 
-    def filter_for_best_pairs(self):
-        """ Filters the given DataFrame for the best pairs based on highest correlation and cointegration. """
-        self.co_int_correlation_combined_df['adf_test'] = run_adf_on_best_pairs(self.co_int_correlation_combined_df)
+    def filter_for_best_pairs(self, p_value_thresh=0.05):
+        """ Filters the combined DataFrame for the pairs whose spread passes the ADF test at p_value_thresh. """
+        adf_results = run_adf_on_best_pairs(self.co_int_correlation_combined_df, price_panel=self.price_panel,
+                                            p_value_thresh=p_value_thresh, result_store=self.result_store)
+        self.co_int_correlation_combined_df['adf_test'] = adf_results
         filtered_data = self.co_int_correlation_combined_df.query('adf_test == True')
-        filtered_data = filtered_data.sort_values(by=['Correlation', 'Cointegration'], ascending=False)
         return filtered_data
 
+    @staticmethod
+    def rank_pairs(pairs_df) -> pd.DataFrame:
+        """ Ranks the pairs based on highest correlation and cointegration. """
+        return pairs_df.sort_values(by=['Correlation', 'Cointegration'], ascending=False)
+
+    def find_suitable_pairs(self, top_k: int = None) -> list:
+        """ The ranked pairs that passed the screen as [stock_1, stock_2] lists, best first, only the top_k best
+        if given. """
+        pairs = self.adf_tested_df[['Stock_1', 'Stock_2']].values.tolist()
+        return pairs if top_k is None else pairs[:top_k]
+
     @timeit
     def find_most_suitable_pair(self) -> list:
         """ Identifies the most suitable stock pair based on highest correlation and cointegration criteria. Raises
@@ -0,0 +1,255 @@
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# Directory Path Setup
+""" Set up the directory path for the script and adjust sys.path for module imports. """
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+# Custom Module Imports
+from analysis.cointegration import batch_coint_pvalues
+from analysis.screening import ScreeningReport
+from analysis.statistical_methods import adf_pvalue
+from analysis.stock_data import StockData
+
+RESULT_COLUMNS = ['Stock_1', 'Stock_2', 'coint_p', 'coint_tested_at', 'adf_p', 'adf_tested_at']
+# Names the directory of state_dir holding the last complete state
+CURRENT_FILE = 'current.json'
+
+
+class WalkForwardScreener:
+    """
+    Re-screens a universe as its price window walks forward a few bars at a time, reusing the work of earlier
+    screens. The running sums of the window's prices and their cross products are kept, so new bars update every
+    correlation by adding the new rows and removing the rows that left the window, instead of recomputing the
+    matrix. Each pair's last cointegration and ADF p-values are kept too, and a pair is only re-tested when its
+    p-value was within p_margin of the threshold for every update since it was tested, it newly passed the stage
+    before, or its result is max_age updates old. Everything is persisted in state_dir, so a daily job only loads
+    the state and feeds it the day's bars. Each save writes a new state directory and then switches current.json
+    to it, so a crash part way through a save leaves the previous state whole.
+
+    The screen applies the stages and ranking of StockData: absolute correlation at least corr_thresh,
+    Engle-Granger p-value at most coint_p_thresh and, unless adf_p_thresh is None, ADF p-value of the spread at
+    most adf_p_thresh.
+    """
+
+    def __init__(self, state_dir: str, window: int = 252, corr_thresh: float = 0.80, coint_p_thresh: float = 0.05,
+                 adf_p_thresh: float = 0.05, p_margin: float = 0.02, max_age: int = 20, resync_every: int = 63):
+        """
+        Args:
+        state_dir (str): Directory the state is persisted in, loaded from if it holds one.
+        window (int): Bars in the price window.
+        corr_thresh (float): Lowest absolute correlation of a candidate pair.
+        coint_p_thresh (float): Highest cointegration p-value that passes.
+        adf_p_thresh (float): Highest ADF p-value of the spread that passes, None to skip the ADF stage.
+        p_margin (float): How far a p-value may drift per update. One within p_margin times its age of its
+            threshold is re-tested, results further away are reused. Reuse trades exactness for speed: p-values of
+            marginal pairs can jump further than this from one bar to the next.
+        max_age (int): Updates after which any p-value is re-tested.
+        resync_every (int): Updates after which the running sums are recomputed from the window, bounding the
+            rounding error they accumulate.
+        """
+        self.state_dir = state_dir
+        self.config = {'window': window, 'corr_thresh': corr_thresh, 'coint_p_thresh': coint_p_thresh,
+                       'adf_p_thresh': adf_p_thresh, 'p_margin': p_margin, 'max_age': max_age,
+                       'resync_every': resync_every, 'updates': 0, 'updates_since_resync': 0}
+        self.window_panel = None
+        self.results = {}
+        self.ranked_pairs = None
+        self.last_update = {}
+        self.screening_report = None
+        os.makedirs(self.state_dir, exist_ok=True)
+        if os.path.exists(self._path(CURRENT_FILE)):
+            self.load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.state_dir, name)
+
+    @property
+    def tickers(self) -> list:
+        return list(self.window_panel['Adj Close'].columns)
+
+    @staticmethod
+    def _as_panel(prices: pd.DataFrame) -> pd.DataFrame:
+        """ Accepts an Adj Close frame with one column per ticker or a (field, ticker) panel like
+        StockData.price_panel. """
+        if isinstance(prices.columns, pd.MultiIndex):
+            return prices
+        return pd.concat({'Adj Close': prices}, axis=1)
+
+    def _resync(self):
+        """ Recomputes the running sums from the window, centred on its mean to keep the cross products small. """
+        prices = self.window_panel['Adj Close'].to_numpy(dtype=float)
+        self.shift = prices.mean(axis=0)
+        centred = prices - self.shift
+        self.sums = centred.sum(axis=0)
+        self.cross_products = centred.T @ centred
+        self.config['updates_since_resync'] = 0
+
+    def correlations(self) -> np.ndarray:
+        """ The absolute correlation matrix of the window, from the running sums. """
+        n = len(self.window_panel)
+        covariances = self.cross_products - np.outer(self.sums, self.sums) / n
+        variances = np.diag(covariances)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.abs(covariances / np.sqrt(np.outer(variances, variances)))
+
+    def initialise(self, prices: pd.DataFrame) -> pd.DataFrame:
+        """ Runs a full screen on the last window bars of prices, dropping any earlier state, and returns the
+        ranked pairs. """
+        panel = self._as_panel(prices).dropna(axis=0)
+        self.window_panel = panel.iloc[-self.config['window']:]
+        self.results = {}
+        self.config['updates'] = 0
+        self._resync()
+        return self._screen()
+
+    def update(self, new_bars: pd.DataFrame) -> pd.DataFrame:
+        """
+        Appends new bars of the same tickers, drops as many of the oldest bars from the window, updates the
+        running sums and re-screens. Bars that are not newer than the window are ignored.
+
+        Returns:
+        pd.DataFrame: The ranked pairs, see ranked_pairs. What was reused and re-tested is in last_update.
+        """
+        if self.window_panel is None:
+            raise RuntimeError("Nothing to update, call initialise first")
+        new_bars = self._as_panel(new_bars).dropna(axis=0)
+        new_bars = new_bars[new_bars.index > self.window_panel.index[-1]]
+        if list(new_bars['Adj Close'].columns) != self.tickers:
+            raise ValueError("New bars must hold the same tickers as the window, initialise to change them")
+        new_bars = new_bars[self.window_panel.columns]
+
+        combined = pd.concat([self.window_panel, new_bars])
+        n_dropped = max(0, len(combined) - self.config['window'])
+        dropped = combined['Adj Close'].to_numpy(dtype=float)[:n_dropped] - self.shift
+        added = new_bars['Adj Close'].to_numpy(dtype=float) - self.shift
+        self.sums += added.sum(axis=0) - dropped.sum(axis=0)
+        self.cross_products += added.T @ added - dropped.T @ dropped
+        self.window_panel = combined.iloc[n_dropped:]
+        self.config['updates'] += 1
+        self.config['updates_since_resync'] += 1
+        if self.config['updates_since_resync'] >= self.config['resync_every']:
+            self._resync()
+        return self._screen()
+
+    def _needs_test(self, p_value, tested_at, thresh: float, force: bool = False) -> bool:
+        if force or p_value is None or np.isnan(p_value):
+            return True
+        # A p-value drifts further from where it was tested with every update, so the band re-tested widens
+        age = self.config['updates'] - tested_at
+        return abs(p_value - thresh) <= self.config['p_margin'] * max(age, 1) or age >= self.config['max_age']
+
+    def _screen(self) -> pd.DataFrame:
+        config = self.config
+        updates = config['updates']
+        tickers = self.tickers
+        prices = self.window_panel['Adj Close']
+        self.screening_report = ScreeningReport()
+        start_time = time.perf_counter()
+        n_tickers = len(tickers)
+
+        with self.screening_report.stage('correlation', candidates=n_tickers * (n_tickers - 1) // 2) as stage:
+            correlations = self.correlations()
+            rows, cols = np.nonzero(np.triu(correlations >= config['corr_thresh'], k=1))
+            candidates = [(tickers[i], tickers[j]) for i, j in zip(rows, cols)]
+            stage['survivors'] = len(candidates)
+
+        with self.screening_report.stage('cointegration', candidates=len(candidates)) as stage:
+            previous = {pair: self.results.get(pair, {}) for pair in candidates}
+            retest = [position for position, pair in enumerate(candidates)
+                      if self._needs_test(previous[pair].get('coint_p'), previous[pair].get('coint_tested_at'),
+                                          config['coint_p_thresh'])]
+            p_values = batch_coint_pvalues(prices, [(rows[n], cols[n]) for n in retest]) if retest else []
+            for position, p_value in zip(retest, p_values):
+                self.results[candidates[position]] = {**previous[candidates[position]], 'coint_p': p_value,
+                                                      'coint_tested_at': updates}
+            cointegrated = [pair for pair in candidates if self.results[pair]['coint_p'] <= config['coint_p_thresh']]
+            stage['survivors'] = len(cointegrated)
+
+        adf_retested = 0
+        if config['adf_p_thresh'] is None:
+            survivors = cointegrated
+        else:
+            with self.screening_report.stage('adf', candidates=len(cointegrated)) as stage:
+                for pair in cointegrated:
+                    result = self.results[pair]
+                    # A pair that newly passed cointegration has no ADF result of this regime to reuse
+                    newly_cointegrated = not previous[pair].get('coint_p', np.inf) <= config['coint_p_thresh']
+                    if self._needs_test(result.get('adf_p'), result.get('adf_tested_at'), config['adf_p_thresh'],
+                                        force=newly_cointegrated):
+                        result['adf_p'] = adf_pvalue(pair[0], pair[1], price_panel=self.window_panel)
+                        result['adf_tested_at'] = updates
+                        adf_retested += 1
+                survivors = [pair for pair in cointegrated if self.results[pair]['adf_p'] <= config['adf_p_thresh']]
+                stage['survivors'] = len(survivors)
+
+        with self.screening_report.stage('ranking', candidates=len(survivors)) as stage:
+            positions = {ticker: position for position, ticker in enumerate(tickers)}
+            ranked = pd.DataFrame({'Stock_1': [pair[0] for pair in survivors],
+                                   'Stock_2': [pair[1] for pair in survivors],
+                                   'Correlation': [correlations[positions[pair[0]], positions[pair[1]]]
+                                                   for pair in survivors],
+                                   'Cointegration': [self.results[pair]['coint_p'] for pair in survivors],
+                                   'adf_p': [self.results[pair].get('adf_p', np.nan) for pair in survivors]})
+            self.ranked_pairs = StockData.rank_pairs(ranked).reset_index(drop=True)
+            stage['survivors'] = len(self.ranked_pairs)
+
+        self.last_update = {'updates': updates, 'candidates': len(candidates), 'coint_retested': len(retest),
+                            'coint_reused': len(candidates) - len(retest), 'adf_retested': adf_retested,
+                            'seconds': time.perf_counter() - start_time}
+        self.save()
+        return self.ranked_pairs
+
+    def save(self):
+        """ Writes the window, running sums, pair results and config to a new directory of state_dir and makes it
+        the current state, removing the ones before it. """
+        state = f"state-{self.config['updates']:06d}-{uuid.uuid4().hex[:8]}"
+        state_path = self._path(state)
+        os.makedirs(state_path)
+        self.window_panel.to_parquet(os.path.join(state_path, 'window.parquet'))
+        np.savez(os.path.join(state_path, 'sums.npz'), shift=self.shift, sums=self.sums,
+                 cross_products=self.cross_products)
+        results = pd.DataFrame([{'Stock_1': pair[0], 'Stock_2': pair[1], **result}
+                                for pair, result in self.results.items()], columns=RESULT_COLUMNS)
+        results.to_parquet(os.path.join(state_path, 'results.parquet'))
+        self.ranked_pairs.to_parquet(os.path.join(state_path, 'ranked_pairs.parquet'))
+        with open(os.path.join(state_path, 'config.json'), 'w') as file:
+            json.dump(self.config, file)
+        # Switching current.json is the one step that makes the new state visible
+        tmp_path = self._path(CURRENT_FILE + '.tmp')
+        with open(tmp_path, 'w') as file:
+            json.dump({'state': state}, file)
+        os.replace(tmp_path, self._path(CURRENT_FILE))
+        # Earlier states and any left by a crashed save are no longer referenced
+        for name in os.listdir(self.state_dir):
+            if name.startswith('state-') and name != state:
+                shutil.rmtree(self._path(name), ignore_errors=True)
+
+    def load(self):
+        """ Reads the current state saved in state_dir, keeping the thresholds this screener was created with. """
+        with open(self._path(CURRENT_FILE), 'r') as file:
+            state_path = self._path(json.load(file)['state'])
+        with open(os.path.join(state_path, 'config.json'), 'r') as file:
+            saved = json.load(file)
+        self.config['updates'] = saved['updates']
+        self.config['updates_since_resync'] = saved['updates_since_resync']
+        self.window_panel = pd.read_parquet(os.path.join(state_path, 'window.parquet'))
+        sums = np.load(os.path.join(state_path, 'sums.npz'))
+        self.shift, self.sums, self.cross_products = sums['shift'], sums['sums'], sums['cross_products']
+        results = pd.read_parquet(os.path.join(state_path, 'results.parquet'))
+        self.results = {(row['Stock_1'], row['Stock_2']): {key: row[key] for key in RESULT_COLUMNS[2:]
+                                                           if not pd.isna(row[key])}
+                        for row in results.to_dict('records')}
+        self.ranked_pairs = pd.read_parquet(os.path.join(state_path, 'ranked_pairs.parquet'))
+        if saved['window'] != self.config['window']:
+            # A different window invalidates every running sum and p-value
+            self.initialise(self.window_panel)
@@ -0,0 +1,108 @@
+""" Benchmarks the Alpaca class's order path against FakeTradingClient, so results depend only on the simulated
+latency and not on the network or market hours. Run with: python benchmarks/bench_order_path.py --help """
+import argparse
+import contextlib
+import io
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Directory Path Setup
+""" Set up the directory path for the script and adjust sys.path for module imports. """
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+# Custom Module Imports
+from alpaca.trading import OrderSide
+from trading.alpaca_functions import Alpaca
+from trading.fake_alpaca import FakeTradingClient
+from trading.order_scheduler import OrderScheduler
+
+
+def latency_ms(seconds) -> dict:
+    seconds = np.asarray([s for s in seconds if s is not None], dtype=float) * 1000
+    if len(seconds) == 0:
+        return {'p50_ms': np.nan, 'p95_ms': np.nan, 'max_ms': np.nan}
+    return {'p50_ms': np.percentile(seconds, 50), 'p95_ms': np.percentile(seconds, 95), 'max_ms': seconds.max()}
+
+
+def server_fill_latency(client: FakeTradingClient) -> list:
+    """ Submission to fill of every filled order as recorded by the fake broker. """
+    return [(order.filled_at - order.submitted_at).total_seconds() for order in client.orders.values()
+            if order.filled_at is not None]
+
+
+def bench_market_orders(args) -> dict:
+    """ send_market_order one order at a time, the path of the manual trade menu. """
+    client = FakeTradingClient(latency=args.latency, fill_delay=args.fill_delay, jitter=args.jitter, seed=args.seed)
+    alpaca = Alpaca(client=client)
+    start_time = time.perf_counter()
+    for n in range(args.orders):
+        alpaca.send_market_order(f'S{n % 50}', 1, OrderSide.BUY)
+    elapsed = time.perf_counter() - start_time
+    return {'benchmark': 'send_market_order', 'orders': args.orders, 'seconds': elapsed,
+            'orders_per_sec': args.orders / elapsed, **latency_ms(server_fill_latency(client))}
+
+
+def bench_hedge_positions(args) -> dict:
+    """ enter_hedge_position pair after pair, waiting for both fills of each, latency is client observed. """
+    client = FakeTradingClient(latency=args.latency, fill_delay=args.fill_delay, jitter=args.jitter, seed=args.seed)
+    alpaca = Alpaca(client=client)
+    n_pairs = args.orders // 2
+    start_time = time.perf_counter()
+    results = [alpaca.enter_hedge_position(f'L{n % 50}', f'S{n % 50}', 'buy', leverage=10, hr=0.5)
+               for n in range(n_pairs)]
+    elapsed = time.perf_counter() - start_time
+    fill_latency = [leg['fill_latency'] for result in results for leg in result['legs']]
+    return {'benchmark': 'enter_hedge_position', 'orders': 2 * n_pairs, 'seconds': elapsed,
+            'orders_per_sec': 2 * n_pairs / elapsed, **latency_ms(fill_latency)}
+
+
+def bench_basket(args) -> dict:
+    """ enter_basket through an OrderScheduler at the given request rate. """
+    client = FakeTradingClient(latency=args.latency, fill_delay=args.fill_delay, jitter=args.jitter, seed=args.seed)
+    alpaca = Alpaca(client=client)
+    pairs = [(f'L{n}', f'S{n}', 0.5) for n in range(args.orders // 2)]
+    start_time = time.perf_counter()
+    with OrderScheduler(client, rate=args.rate, burst=args.burst, n_workers=args.workers) as scheduler:
+        alpaca.enter_basket(pairs, leverage=10, scheduler=scheduler)
+    elapsed = time.perf_counter() - start_time
+    # Wait for the delayed fills before reading the broker's fill times
+    time.sleep(args.fill_delay + args.jitter + 0.05)
+    return {'benchmark': 'enter_basket', 'orders': 2 * len(pairs), 'seconds': elapsed,
+            'orders_per_sec': 2 * len(pairs) / elapsed, **latency_ms(server_fill_latency(client))}
+
+
+def main(argv=None) -> pd.DataFrame:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=200, help='Orders per benchmark.')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds per simulated REST request.')
+    parser.add_argument('--jitter', type=float, default=0.005, help='Up to this many seconds added per request.')
+    parser.add_argument('--fill-delay', type=float, default=0.01, help='Seconds from order acceptance to fill.')
+    parser.add_argument('--rate', type=float, default=200 / 60, help='Scheduler requests per second.')
+    parser.add_argument('--burst', type=int, default=10, help='Scheduler burst size.')
+    parser.add_argument('--workers', type=int, default=8, help='Scheduler worker threads.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    rows = []
+    for bench in [bench_market_orders, bench_hedge_positions, bench_basket]:
+        # The order path prints every order, keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows.append(bench(args))
+    logging.disable(logging.NOTSET)
+
+    report = pd.DataFrame(rows).set_index('benchmark').round(2)
+    print(f"latency={args.latency}s jitter={args.jitter}s fill_delay={args.fill_delay}s rate={args.rate:.2f}/s")
+    print(report.to_string())
+    return report
+
+
+if __name__ == '__main__':
+    main()
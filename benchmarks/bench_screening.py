@@ -0,0 +1,173 @@
+""" Benchmarks every stage of the StockData screen and collect_metrics_for_pair on seeded synthetic universes and
+compares the timings with earlier runs. Run with: python benchmarks/bench_screening.py --help """
+import argparse
+import contextlib
+import datetime as dt
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+import warnings
+
+import pandas as pd
+
+# Directory Path Setup
+""" Set up the directory path for the script and adjust sys.path for module imports. """
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+# Custom Module Imports
+from analysis.price_cache import PriceCache, get_default_cache, set_default_cache
+from analysis.statistical_methods import collect_metrics_for_pair, clear_pair_metrics_memo
+from analysis.stock_data import StockData
+from benchmarks.synthetic_universe import synthetic_universe, SyntheticProvider
+
+DEFAULT_HISTORY = os.path.join(current_dir, 'results', 'screening_history.jsonl')
+
+
+class BenchmarkStockData(StockData):
+    """ StockData that also records its download as a stage of the screening report, and does not fail when too
+    few pairs survive the screen to pick the most suitable one. """
+
+    def download_stock_data(self, asset_list: list):
+        with self.screening_report.stage('download', candidates=len(asset_list)) as stage:
+            prices_df = super().download_stock_data(asset_list)
+            stage['survivors'] = prices_df['Adj Close'].shape[1]
+        return prices_df
+
+    def find_most_suitable_pair(self):
+        return self.find_suitable_pairs(1)
+
+
+def run_screen(n_tickers: int, args, trace_memory: bool = False):
+    """
+    Screens a synthetic universe of n_tickers with the prices served through a fresh PriceCache, then collects the
+    metrics of the top ranked pairs.
+
+    Returns:
+    tuple: The screening report frame with a 'throughput' column of candidates per second, and the share of the
+        planted pairs that survived the cointegration stage.
+    """
+    bars, planted_pairs = synthetic_universe(n_tickers, seed=args.seed)
+    tickers = list(bars['Adj Close'].columns)
+    cache_dir = tempfile.mkdtemp()
+    previous_cache = get_default_cache()
+    set_default_cache(PriceCache(cache_dir, provider=SyntheticProvider(bars)))
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            stock_data = BenchmarkStockData(tickers, bypass_adf_test=False, coint_engine=args.engine,
+                                            n_workers=args.workers)
+            top_pairs = stock_data.find_suitable_pairs(args.top_k)
+            with stock_data.screening_report.stage('metrics', candidates=len(top_pairs)) as stage:
+                clear_pair_metrics_memo()
+                for stock_1, stock_2 in top_pairs:
+                    collect_metrics_for_pair(stock_1, stock_2, price_panel=stock_data.price_panel)
+                stage['survivors'] = len(top_pairs)
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        set_default_cache(previous_cache)
+        shutil.rmtree(cache_dir)
+
+    report = stock_data.screening_report.to_df()
+    report['throughput'] = report['candidates'] / report['seconds']
+    cointegrated = stock_data.co_int_correlation_combined_df
+    found = set(zip(cointegrated['Stock_1'], cointegrated['Stock_2']))
+    recall = sum(pair in found or pair[::-1] in found for pair in planted_pairs) / len(planted_pairs)
+    return report, recall
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root_dir, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def load_history(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def compare_with_history(results: pd.DataFrame, history: list, config: dict, window: int,
+                         tolerance: float) -> pd.DataFrame:
+    """
+    Compares each size and stage's seconds with the median of the last window runs that used the same config.
+    A stage regressed if it took more than (1 + tolerance) times that median.
+    """
+    previous = [run for run in history if run['config'] == config][-window:]
+    if not previous:
+        results['baseline_seconds'] = float('nan')
+    else:
+        baseline = pd.DataFrame([row for run in previous for row in run['results']])
+        baseline = baseline.groupby(['n_tickers', 'stage'])['seconds'].median().rename('baseline_seconds')
+        results = results.join(baseline, on=['n_tickers', 'stage'])
+    results['ratio'] = results['seconds'] / results['baseline_seconds']
+    results['regression'] = results['ratio'] > 1 + tolerance
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 500, 2000], help='Universe sizes to screen.')
+    parser.add_argument('--engine', default='batch', help='Cointegration engine, see StockData.')
+    parser.add_argument('--workers', type=int, default=None, help='Workers of the parallel engine.')
+    parser.add_argument('--top-k', type=int, default=20, help='Top pairs whose metrics are collected.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc pass measuring peak memory.')
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='JSON lines file of earlier runs.')
+    parser.add_argument('--no-save', action='store_true', help='Do not append this run to the history.')
+    parser.add_argument('--window', type=int, default=5, help='Earlier runs the baseline is the median of.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Slowdown over the baseline that fails.')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit with 1 if any stage regressed.')
+    args = parser.parse_args(argv)
+
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.INFO)
+    frames = []
+    for n_tickers in args.sizes:
+        # Timings come from an untraced pass, tracemalloc slows allocation heavy code down
+        report, recall = run_screen(n_tickers, args)
+        if not args.no_memory:
+            memory_report, _ = run_screen(n_tickers, args, trace_memory=True)
+            report['peak_mb'] = memory_report['peak_mb'].values
+        report.insert(0, 'n_tickers', n_tickers)
+        report['coint_recall'] = recall
+        frames.append(report)
+    logging.disable(logging.NOTSET)
+    results = pd.concat(frames, ignore_index=True)
+
+    config = {'engine': args.engine, 'workers': args.workers, 'seed': args.seed, 'top_k': args.top_k}
+    compared = compare_with_history(results, load_history(args.history), config, args.window, args.tolerance)
+    columns = ['n_tickers', 'stage', 'candidates', 'survivors', 'seconds', 'throughput', 'peak_mb',
+               'baseline_seconds', 'ratio', 'regression', 'coint_recall']
+    print(compared[[column for column in columns if column in compared.columns]].round(3).to_string(index=False))
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        record = {'timestamp': dt.datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+                  'python': platform.python_version(), 'machine': platform.machine(), 'config': config,
+                  'results': json.loads(results.to_json(orient='records'))}
+        with open(args.history, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+
+    regressions = compared[compared['regression']]
+    if len(regressions):
+        print(f"{len(regressions)} stage(s) slower than {1 + args.tolerance:.2f}x their baseline")
+    return 1 if args.fail_on_regression and len(regressions) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
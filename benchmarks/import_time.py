@@ -0,0 +1,86 @@
+""" Measures how long the CLI takes to import in a fresh interpreter with python -X importtime, lists the slowest
+modules and checks the total against a budget. Run with: python benchmarks/import_time.py --help """
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import subprocess
+import sys
+
+# Directory Path Setup
+""" Set up the directory path for the script and adjust sys.path for module imports. """
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+DEFAULT_MODULE = 'executors.cli_controller'
+DEFAULT_HISTORY = os.path.join(current_dir, 'results', 'import_time_history.jsonl')
+# The menu must render without these, they are imported by the option that needs them
+HEAVY_MODULES = ('pandas', 'numpy', 'statsmodels', 'matplotlib', 'yfinance', 'alpaca', 'scipy')
+# Milliseconds, about 10 are spent importing the CLI today against 2800 when it loaded everything up front
+BUDGET_MS = 150
+
+
+def measure_import(module: str = DEFAULT_MODULE) -> dict:
+    """
+    Imports module in a new interpreter with -X importtime.
+
+    Returns:
+    dict: 'total_ms', the cumulative import time of module, 'modules', each imported module's (name, self ms,
+        cumulative ms), and 'heavy', the HEAVY_MODULES that were imported along with it.
+    """
+    code = f"import sys, json, {module}; print(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=root_dir, capture_output=True,
+                            text=True, check=True)
+    # Each top level import is reported after the modules it pulled in, keep only the block of module itself and
+    # not the interpreter's own startup imports
+    modules, block = [], []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        block.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+        if len(name) - len(name.lstrip()) == 1:
+            if name.strip() == module:
+                modules = block
+            block = []
+    loaded = json.loads(result.stdout.splitlines()[-1])
+    total_ms = modules[-1][2]
+    heavy = sorted({name.split('.')[0] for name in loaded} & set(HEAVY_MODULES))
+    return {'total_ms': total_ms, 'modules': modules, 'heavy': heavy}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--module', default=DEFAULT_MODULE, help='Module whose import is measured.')
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS, help='Import time that fails.')
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters, the best total is reported.')
+    parser.add_argument('--top', type=int, default=10, help='Slowest modules listed.')
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='JSON lines file the totals are appended to.')
+    parser.add_argument('--no-save', action='store_true', help='Do not append this run to the history.')
+    args = parser.parse_args(argv)
+
+    # The first run also warms the bytecode cache, the best of the rest is the least noisy
+    runs = [measure_import(args.module) for _ in range(args.repeat)]
+    best = min(runs, key=lambda run: run['total_ms'])
+    print(f"{args.module}: {best['total_ms']:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, self_ms, cumulative_ms in sorted(best['modules'], key=lambda module: module[2],
+                                               reverse=True)[:args.top]:
+        print(f"  {cumulative_ms:>9.1f} ms cumulative {self_ms:>8.1f} ms self  {name}")
+    if best['heavy']:
+        print(f"Heavy modules imported up front: {', '.join(best['heavy'])}")
+
+    if not args.no_save:
+        from benchmarks.bench_screening import git_commit
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        record = {'timestamp': dt.datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+                  'python': platform.python_version(), 'machine': platform.machine(), 'module': args.module,
+                  'total_ms': best['total_ms'], 'heavy': best['heavy']}
+        with open(args.history, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+    return 1 if best['total_ms'] > args.budget_ms or best['heavy'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
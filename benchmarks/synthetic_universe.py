@@ -0,0 +1,77 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Directory Path Setup
+""" Set up the directory path for the script and adjust sys.path for module imports. """
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.append(root_dir)
+
+# Custom Module Imports
+from analysis.DATES import Dates
+from analysis.price_cache import PriceProvider
+
+
+def synthetic_universe(n_tickers: int, n_pairs: int = None, seed: int = 0, dates: pd.DatetimeIndex = None):
+    """
+    Seeded universe of daily bars where n_pairs planted pairs are cointegrated and every other ticker is an
+    independent geometric random walk. The second ticker of a planted pair is a multiple of the first plus a
+    stationary AR(1) spread, so the pair passes the correlation and Engle-Granger cointegration stages of the
+    screen.
+
+    Args:
+    n_tickers (int): Tickers in the universe, planted pairs included.
+    n_pairs (int): Planted pairs, defaults to one per 20 tickers and at least 2.
+    seed (int): Seed of the random generator, the same seed gives the same bars.
+    dates (pd.DatetimeIndex): Bar dates, defaults to the business days of the Dates window.
+
+    Returns:
+    tuple: Bars with (field, ticker) MultiIndex columns like yf.download, and the planted (stock_1, stock_2) pairs.
+    """
+    if dates is None:
+        dates = pd.bdate_range(Dates.START_DATE.value.normalize() - pd.DateOffset(days=10),
+                               Dates.END_DATE.value, name='Date')
+    if n_pairs is None:
+        n_pairs = max(2, n_tickers // 20)
+    if 2 * n_pairs > n_tickers:
+        raise ValueError("n_tickers must be at least twice n_pairs")
+    rng = np.random.default_rng(seed)
+    n_days = len(dates)
+
+    log_returns = rng.standard_normal((n_days, n_tickers)) * 0.015
+    close = 100 * np.exp(np.cumsum(log_returns, axis=0))
+
+    # AR(1) spreads with phi 0.5 mean revert within a few days
+    shocks = rng.standard_normal((n_days, n_pairs))
+    spread = np.zeros((n_days, n_pairs))
+    for t in range(1, n_days):
+        spread[t] = 0.5 * spread[t - 1] + shocks[t]
+    betas = rng.uniform(0.5, 2.0, n_pairs)
+    close[:, 1:2 * n_pairs:2] = betas * close[:, 0:2 * n_pairs:2] + 20 + spread
+
+    tickers = [f'SYN{n:05d}' for n in range(n_tickers)]
+    open_prices = close * (1 + rng.standard_normal(close.shape) * 0.002)
+    fields = {'Open': open_prices, 'High': np.maximum(open_prices, close) * 1.005,
+              'Low': np.minimum(open_prices, close) * 0.995, 'Close': close, 'Adj Close': close,
+              'Volume': np.full(close.shape, 1e6)}
+    bars = pd.concat({field: pd.DataFrame(values, index=dates, columns=tickers) for field, values in fields.items()},
+                     axis=1)
+    planted_pairs = [(tickers[2 * n], tickers[2 * n + 1]) for n in range(n_pairs)]
+    return bars, planted_pairs
+
+
+class SyntheticProvider(PriceProvider):
+    """ Serves bars from an in-memory frame, e.g. from synthetic_universe, as a stand in for a download. """
+
+    def __init__(self, bars: pd.DataFrame):
+        self.bars = bars
+
+    def fetch(self, tickers, start, end):
+        tickers = [ticker for ticker in tickers if ticker in self.bars.columns.get_level_values(1)]
+        if not tickers:
+            return pd.DataFrame()
+        window = self.bars[(self.bars.index >= start) & (self.bars.index < end)]
+        return window.loc[:, (slice(None), tickers)]
@@ -1,6 +1,6 @@
 import os
 import sys
-from typing import List, Tuple, Optional
+from typing import List, Optional
 # Get the directory of the current script
 # If the script is not in the root directory, navigate to the root directory
 # Append the root directory to sys.path so that modules can be imported
@@ -9,10 +9,9 @@ root_dir = os.path.dirname(current_dir)
 sys.path.append(root_dir)
 
 from analysis.statistical_methods import collect_metrics_for_pair
-from executors.cli_controller import main_menu
-from analysis.visualisation import spread_visualisation, zscored_spread, visualise_returns
 from analysis.errors import NoSuitablePairsError
 from analysis.stock_data import StockData
+from analysis.result_store import get_default_result_store
 from utils.formatting_and_logs import green_bold_print, blue_bold_print, red_bold_print
 from utils.formatting_and_logs import CustomFormatter
 import logging
@@ -44,25 +43,28 @@ def read_tickers_from_file(path: str) -> Optional[List[str]]:
         return None
 
 
-def process_stock_data(symbols_list: List[str]) -> Optional[Tuple[str, str]]:
+def process_stock_data(symbols_list: List[str]) -> Optional[StockData]:
     """
     Processes stock symbols to find the most suitable pair for analysis.
     Args:
     symbols_list (List[str]): List of stock ticker symbols.
     Returns:
-    Optional[Tuple[str, str]]: Most suitable pair of stocks, or None if no suitable pair is found.
+    Optional[StockData]: The screened StockData, its most_suitable_pair holds the pair and its price_panel the
+    prices, or None if no suitable pair is found.
     """
     try:
-        stock_data = StockData(asset_list=symbols_list, bypass_adf_test=False)
-        red_bold_print("Most Suitable Pair: " + stock_data.most_suitable_pair)
-        return stock_data.most_suitable_pair
+        stock_data = StockData(asset_list=symbols_list, bypass_adf_test=False,
+                               result_store=get_default_result_store())
+        red_bold_print("Most Suitable Pair: {}, {}".format(stock_data.most_suitable_pair[0], stock_data.most_suitable_pair[1]))
+        return stock_data
     except NoSuitablePairsError:
         logging.warning("No suitable pairs found. Option to bypass adf_test is available but not recommended (y/n): ")
         bypass_adf_test = input()
         if bypass_adf_test.lower() == 'y':
-            stock_data = StockData(asset_list=symbols_list, bypass_adf_test=True)
+            stock_data = StockData(asset_list=symbols_list, bypass_adf_test=True,
+                                   result_store=get_default_result_store())
             red_bold_print("Most Suitable Pair: {}, {}".format(stock_data.most_suitable_pair[0], stock_data.most_suitable_pair[1]))
-            return stock_data.most_suitable_pair
+            return stock_data
         else:
             return None
 
@@ -84,19 +86,44 @@ def run_analysis() -> None:
                             "back:")
             path = input()
             if path == 'b':
-                main_menu(alpaca=Alpaca())
+                # Back to the main menu loop of cli_controller, no broker connection needed to get there
+                return
             symbols_list = read_tickers_from_file(path)
 
             if symbols_list is not None:
                 logging.info("Tickers to analyse: " + str(symbols_list))
-                most_suitable_pair = process_stock_data(symbols_list)
-                strategy_info = collect_metrics_for_pair(most_suitable_pair[0], most_suitable_pair[1])
+                stock_data = process_stock_data(symbols_list)
+                if stock_data is None:
+                    break
+                most_suitable_pair = stock_data.most_suitable_pair
+                # Sliced from the screening panel rather than downloaded again
+                strategy_info = collect_metrics_for_pair(most_suitable_pair[0], most_suitable_pair[1],
+                                                         price_panel=stock_data.price_panel,
+                                                         result_store=get_default_result_store())
                 print(strategy_info)
                 hedge_ratio = strategy_info['hedge_ratio'].iloc[0]
                 print("Hedge Ratio: " + str(hedge_ratio))
-                red_bold_print("Would you like to enter a hedge position using this pair? (y/n)")
+                red_bold_print("Would you like to enter a hedge position using this pair? (y/n) Or enter a number K "
+                               "to enter the top K pairs:")
                 choice = input()
-                if choice.lower() == "y":
+                if choice.strip().isdigit():
+                    try:
+                        alpaca = Alpaca()
+                        leverage = float(input("Please enter the leverage: "))
+                        tp_sl = input("Please enter the take profit and stop loss percentage in the format 0.05, 0.05: ")
+                        tp, sl = tp_sl.split(',')
+                        tp, sl = float(tp.strip()), float(sl.strip())
+                        basket = []
+                        for stock_1, stock_2 in stock_data.find_suitable_pairs(int(choice)):
+                            pair_info = collect_metrics_for_pair(stock_1, stock_2, price_panel=stock_data.price_panel)
+                            basket.append((stock_1, stock_2, pair_info['hedge_ratio'].iloc[0]))
+                        alpaca.enter_basket(basket, leverage=leverage, side="buy")
+                        logging.info("Basket of hedge positions entered.")
+                        alpaca.use_live_tp_sl(tp, sl)
+                        break
+                    except Exception as e:
+                        print(e)
+                elif choice.lower() == "y":
                     try:
                         alpaca = Alpaca()
                         leverage = float(input("Please enter the leverage: "))
@@ -121,6 +148,8 @@ def backtest_strategy() -> None:
     """
     Backtests a trading strategy based on user choices and stock pairs.
     """
+    # matplotlib is only needed once a backtest is plotted
+    from analysis.visualisation import spread_visualisation, zscored_spread, visualise_returns
 
     def backtest_menu() -> str:
         """
@@ -131,6 +160,7 @@ def backtest_strategy() -> None:
         blue_bold_print("1: Visualise Spread")
         blue_bold_print("2: Visualise Z-Scored Spread")
         blue_bold_print("3: Visualise Returns")
+        blue_bold_print("4: Save Reports of Several Pairs to Files")
         return input("Please select an option or type 'b' to return to the main menu: ")
 
     blue_bold_print("Please enter the stock ticker you would like to backtest in the format stock_1, stock_2:")
@@ -141,7 +171,7 @@ def backtest_strategy() -> None:
     while True:
         try:
             choice = backtest_menu()
-            if choice not in ["1", "2", "3", "b"]:
+            if choice not in ["1", "2", "3", "4", "b"]:
                 raise ValueError
             elif choice == "1":
                 blue_bold_print("You have selected to visualise the spread.")
@@ -155,7 +185,19 @@ def backtest_strategy() -> None:
                 tp_sl = input()
                 tp, sl = tp_sl.split(',')
                 tp, sl = float(tp.strip()), float(sl.strip())
-                visualise_returns(strategy_info, tp, sl)
+                metrics = visualise_returns(strategy_info, tp, sl)
+                green_bold_print("Sharpe: {sharpe:.2f} | Max Drawdown: {max_drawdown:.2%} | Total Return: "
+                                 "{total_return:.2%} | Turnover: {turnover:.2f} | Trades: {trades:.0f}".format(**metrics))
+            elif choice == "4":
+                from analysis.report import render_reports, DEFAULT_REPORT_DIR
+                blue_bold_print("Please enter the pairs to report in the format stock_1, stock_2; stock_3, stock_4:")
+                pairs = [[stock.strip() for stock in pair.split(',')] for pair in input().split(';') if pair.strip()]
+                blue_bold_print("Rendering the spread, z-score and returns charts of each pair...")
+                results = render_reports(pairs, fmt='html')
+                for result in results.to_dict('records'):
+                    if isinstance(result.get('error'), str):
+                        red_bold_print(f"{result['Stock_1']} - {result['Stock_2']}: {result['error']}")
+                green_bold_print(f"Reports saved to {os.path.join(DEFAULT_REPORT_DIR, 'index.html')}")
             elif choice == 'b':
                 break
         except Exception as e:
@@ -7,23 +7,37 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 root_dir = os.path.dirname(current_dir)
 sys.path.append(root_dir)
 
-# Get the directory of the current script
-# If the script is not in the root directory, navigate to the root directory
-# Append the root directory to sys.path so that modules can be imported
-current_dir = os.path.dirname(os.path.abspath(__file__))
-root_dir = os.path.dirname(current_dir)
-sys.path.append(root_dir)
-
-from trading.alpaca_functions import Alpaca
+# Only light modules are imported up front so the menu renders at once. Analysis (pandas, statsmodels,
+# matplotlib, yfinance) and trading (alpaca-py) modules are imported when an option first needs them, and the
+# broker connection is opened the first time an option uses it.
 from utils.formatting_and_logs import green_bold_print, blue_bold_print, red_bold_print, emphasis_bold_red_print
-from executors import analysis_executor
-from executors import alpaca_executor
 
 
-def main_menu(alpaca: Alpaca):
+class LazyAlpaca:
+    """ Holds the Alpaca connection, which is only opened, and trading.alpaca_functions only imported, when get
+    is first called. """
+
+    def __init__(self, alpaca=None):
+        self._alpaca = alpaca
+
+    @property
+    def connected(self) -> bool:
+        return self._alpaca is not None
+
+    def get(self):
+        if self._alpaca is None:
+            from trading.alpaca_functions import Alpaca
+            self._alpaca = Alpaca()
+        return self._alpaca
+
+
+def main_menu(alpaca):
     # new line
     sys.stdout.write("\n")
-    emphasis_bold_red_print("Main Menu | " + "Alpaca Balance: $" + str(alpaca.account.buying_power))
+    if isinstance(alpaca, LazyAlpaca):
+        alpaca = alpaca._alpaca
+    balance = "$" + str(alpaca.account.buying_power) if alpaca is not None else "not connected"
+    emphasis_bold_red_print("Main Menu | " + "Alpaca Balance: " + balance)
     blue_bold_print("1: Run analysis - Find Suitable Pair")
     blue_bold_print("2: Current Positions - Live Portfolio")
     blue_bold_print("3: Enter New Hedge Position")
@@ -34,21 +48,26 @@ def main_menu(alpaca: Alpaca):
 
 
 def main():
-    alpaca_connection = Alpaca()
+    alpaca_connection = LazyAlpaca()
     while True:
         try:
             choice = main_menu(alpaca=alpaca_connection)
             if choice not in ["1", "2", "3", "4", "5"]:
                 raise ValueError
             elif choice == "1":
+                from executors import analysis_executor
                 analysis_executor.run_analysis()
             elif choice == "2":
-                alpaca_executor.live_position_menu(alpaca_connection)
+                from executors import alpaca_executor
+                alpaca_executor.live_position_menu(alpaca_connection.get())
             elif choice == "3":
-                alpaca_executor.enter_new_hedge_position_menu(alpaca_connection)
+                from executors import alpaca_executor
+                alpaca_executor.enter_new_hedge_position_menu(alpaca_connection.get())
             elif choice == "4":
-                alpaca_executor.manual_trade_menu(alpaca_connection)
+                from executors import alpaca_executor
+                alpaca_executor.manual_trade_menu(alpaca_connection.get())
             elif choice == "5":
+                from executors import analysis_executor
                 analysis_executor.backtest_strategy()
         except ValueError:
             red_bold_print("Invalid input")
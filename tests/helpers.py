@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+from analysis.stock_data import StockData
+
+
+def make_universe(n_tickers=8, n_days=250, seed=3) -> pd.DataFrame:
+    """ Random walks where every other ticker is a noisy copy of the one before it. """
+    rng = np.random.default_rng(seed)
+    prices = {}
+    for n in range(n_tickers):
+        if n % 2 == 0:
+            walk = 100 + rng.standard_normal(n_days).cumsum()
+        else:
+            walk = 0.8 * prices[f'T{n - 1}'] + 20 + rng.standard_normal(n_days)
+        prices[f'T{n}'] = walk
+    return pd.DataFrame(prices, index=pd.bdate_range('2023-01-02', periods=n_days))
+
+
+def stock_data_for(engine) -> StockData:
+    """ A StockData that only screens, with the given cointegration engine and no download, store or queue. """
+    stock_data = StockData.__new__(StockData)
+    stock_data.coint_engine = engine
+    stock_data.n_workers = 2
+    stock_data.result_store = None
+    stock_data.shard_dir = None
+    return stock_data
@@ -1,5 +1,6 @@
 import os
 import sys
+import time
 import unittest
 
 # Get the directory of the current script
@@ -9,7 +10,10 @@ root_dir = os.path.dirname(current_dir)
 # Append the root directory to sys.path so that modules can be imported
 sys.path.append(root_dir)
 
+from alpaca.trading import OrderSide, OrderStatus
+
 from trading.alpaca_functions import Alpaca
+from trading.fake_alpaca import FakeTradingClient
 
 
 class TestAlpacaFunctions(unittest.TestCase):
@@ -22,3 +26,103 @@ class TestAlpacaFunctions(unittest.TestCase):
 
     def test_connection(self):
         self.assertTrue(self.alpaca.connected, 'Failed to connect to alpaca')
+
+
+class TestEnterHedgePosition(unittest.TestCase):
+
+    def test_legs_are_submitted_concurrently(self):
+        client = FakeTradingClient(latency=0.2)
+        alpaca = Alpaca(client=client)
+        start_time = time.perf_counter()
+        result = alpaca.enter_hedge_position('aaa', 'bbb', 'buy', leverage=10, hr=0.5)
+        assert time.perf_counter() - start_time < 0.35
+        assert result['status'] == 'filled'
+        assert {symbol: position['qty'] for symbol, position in client.positions.items()} == {'AAA': 10, 'BBB': -5}
+        assert all(leg['ack_latency'] >= 0.2 and leg['fill_latency'] is not None for leg in result['legs'])
+
+    def test_rejected_leg_is_compensated(self):
+        client = FakeTradingClient(reject={'BBB': 40310000})
+        result = Alpaca(client=client).enter_hedge_position('AAA', 'BBB', 'buy', leverage=10, hr=0.5)
+        assert result['status'] == 'compensated'
+        assert result['legs'][1]['error'] == 40310000
+        assert [(order.symbol, order.side, float(order.qty)) for order in client.orders.values()] == \
+            [('AAA', OrderSide.BUY, 10), ('AAA', OrderSide.SELL, 10)]
+        assert client.positions == {}
+
+    def test_unfilled_leg_is_cancelled(self):
+        client = FakeTradingClient(fill_delay=10, reject={'BBB': 40310000})
+        result = Alpaca(client=client).enter_hedge_position('AAA', 'BBB', 'buy', leverage=10, hr=0.5)
+        assert result['legs'][0]['status'] == 'compensated'
+        assert [order.status for order in client.orders.values()] == [OrderStatus.CANCELED]
+
+
+    def test_failed_fill_poll_is_recorded(self):
+        client = FakeTradingClient(fill_delay=10)
+
+        def unavailable(order_id):
+            raise ConnectionError('connection reset')
+
+        client.get_order_by_id = unavailable
+        with self.assertLogs(level='ERROR'):
+            result = Alpaca(client=client).enter_hedge_position('AAA', 'BBB', 'buy', leverage=10, hr=0.5,
+                                                               fill_timeout=1)
+        assert result['status'] == 'acknowledged'
+        assert all(leg['error'] == 'connection reset' and leg['status'] == OrderStatus.ACCEPTED
+                   for leg in result['legs'])
+
+    def test_failed_compensation_is_reported(self):
+        client = FakeTradingClient(reject={'BBB': 40310000})
+        submit_order = client.submit_order
+
+        def no_closing_orders(order_data):
+            if order_data.side == OrderSide.SELL:
+                raise ConnectionError('connection reset')
+            return submit_order(order_data=order_data)
+
+        client.submit_order = no_closing_orders
+        with self.assertLogs(level='ERROR'):
+            result = Alpaca(client=client).enter_hedge_position('AAA', 'BBB', 'buy', leverage=10, hr=0.5)
+        assert result['status'] == 'compensation_failed'
+        assert result['legs'][0]['compensation_error'] == 'connection reset'
+        assert result['legs'][0]['status'] == OrderStatus.FILLED
+        assert client.positions['AAA']['qty'] == 10
+
+
+class TestPositionsSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeTradingClient(prices={'AAA': 102, 'BBB': 126.25, 'CCC': 126.25})
+        self.client.set_position('AAA', 10, 100)
+        self.client.set_position('BBB', -8, 125)
+        self.client.set_position('CCC', 4, 125)
+        self.alpaca = Alpaca(client=self.client, positions_ttl=60)
+
+    def test_connecting_does_not_fetch_positions(self):
+        assert self.client.requests['get_account'] == 1
+        assert self.client.requests['get_all_positions'] == 0
+
+    def test_readers_share_one_fetch(self):
+        positions_df = self.alpaca.get_positions_df()
+        self.alpaca.print_positions()
+        profit_pc = self.alpaca.get_unrealised_profit_pc()
+        assert self.client.requests['get_all_positions'] == 1
+        assert len(positions_df) == 3
+        assert positions_df['unrealized_pl'].dtype == float
+        assert profit_pc == 0.6
+
+    def test_orders_invalidate_the_snapshot(self):
+        assert self.alpaca.in_position
+        self.alpaca.close_all_positions()
+        assert self.alpaca.get_positions_df().empty
+        assert self.client.requests['get_all_positions'] == 2
+        assert not self.alpaca.in_position
+
+    def test_snapshot_expires_after_ttl(self):
+        self.alpaca.positions_ttl = 0
+        self.alpaca.get_unrealised_profit_pc()
+        self.alpaca.get_unrealised_profit_pc()
+        assert self.client.requests['get_all_positions'] == 2
+
+
+if __name__ == '__main__':
+    unittest.main()
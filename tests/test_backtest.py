@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from analysis.backtest import (zscore_signal, tp_sl_signal, hold_until_reversion_signal, performance_metrics,
+                               run_backtest)
+
+
+def make_metrics_df(n_bars=300, seed=4) -> pd.DataFrame:
+    """ A frame with the columns collect_metrics_for_pair produces. """
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range('2023-01-02', periods=n_bars)
+    metrics_df = pd.DataFrame({'AAA': 100 + rng.standard_normal(n_bars).cumsum(),
+                               'BBB': 50 + rng.standard_normal(n_bars).cumsum(),
+                               'AAA_forward_return': rng.standard_normal(n_bars) * 0.01,
+                               'BBB_forward_return': rng.standard_normal(n_bars) * 0.01,
+                               'AAA_return': rng.standard_normal(n_bars) * 0.01,
+                               'BBB_return': rng.standard_normal(n_bars) * 0.01,
+                               'hedge_ratio': 0.5 + rng.standard_normal(n_bars) * 0.05}, index=index)
+    metrics_df['z_score'] = np.sin(np.arange(n_bars) / 7) * 2 + rng.standard_normal(n_bars) * 0.3
+    return metrics_df
+
+
+class TestBacktestSignals(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.metrics_df = make_metrics_df()
+        cls.z_score = cls.metrics_df['z_score'].to_numpy()
+
+    def test_zscore_signal_matches_row_rule(self):
+        expected = [1 if z < -1 else -1 if z > 1 else 0 for z in self.z_score]
+        assert list(zscore_signal(self.z_score)) == expected
+
+    def test_tp_sl_signal_matches_row_rule(self):
+        combined = (self.metrics_df['AAA_return'] + self.metrics_df['BBB_return'] * self.metrics_df['hedge_ratio'])
+        tp, sl = 0.01, -0.01
+        expected = [1 if c > tp or z < -1 else -1 if c < sl or z > 1 else 0 for c, z in zip(combined, self.z_score)]
+        assert list(tp_sl_signal(combined, self.z_score, tp, sl)) == expected
+
+    def test_hold_until_reversion_matches_loop(self):
+        expected, position = [], 0
+        for z in self.z_score:
+            if z < -1:
+                position = 1
+            elif z > 1:
+                position = -1
+            elif (position == 1 and z >= 0) or (position == -1 and z <= 0):
+                position = 0
+            expected.append(position)
+        assert list(hold_until_reversion_signal(self.z_score)) == expected
+
+    def test_batch_metrics_match_single(self):
+        rng = np.random.default_rng(1)
+        returns = rng.standard_normal((200, 3)) * 0.01
+        signal = rng.integers(-1, 2, (200, 3))
+        batch = performance_metrics(returns, signal)
+        single = performance_metrics(returns[:, 2], signal[:, 2])
+        for name, value in single.items():
+            self.assertAlmostEqual(batch[name][2], value)
+
+    def test_run_backtest(self):
+        backtest_df, metrics = run_backtest(self.metrics_df, rule='hold')
+        assert {'signal', 'strategy_return', 'cumulative_return'} <= set(backtest_df.columns)
+        self.assertAlmostEqual(metrics['total_return'], backtest_df['cumulative_return'].iloc[-1] - 1)
+        assert metrics['max_drawdown'] <= 0
+        assert 0 <= metrics['turnover'] <= 2
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from analysis.DATES import Dates
+from analysis.bar_store import BarStore
+from analysis.statistical_methods import collect_metrics_for_pair, clear_pair_metrics_memo
+from analysis.stock_data import StockData
+from benchmarks.synthetic_universe import synthetic_universe
+
+
+def minute_dates(days: pd.DatetimeIndex) -> pd.DatetimeIndex:
+    """ The 390 minute bars of the regular session of each day. """
+    minutes = pd.timedelta_range('9h30min', periods=390, freq='min')
+    return pd.DatetimeIndex([day + minute for day in days for minute in minutes], name='Date')
+
+
+class TestBarStore(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = BarStore(self.root)
+        days = pd.bdate_range('2024-03-04', periods=10)
+        self.bars, _ = synthetic_universe(4, n_pairs=2, seed=3, dates=minute_dates(days))
+        self.store.write_panel(self.bars)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_slices_are_views_of_the_files(self):
+        start, end = pd.Timestamp('2024-03-05 10:00'), pd.Timestamp('2024-03-06 12:00')
+        values = self.store.slice('SYN00000', 'Adj Close', start, end)
+        expected = self.bars['Adj Close']['SYN00000']
+        expected = expected[(expected.index >= start) & (expected.index < end)]
+        assert np.array_equal(values, expected.to_numpy())
+        assert isinstance(values.base, np.memmap)
+
+        panel = self.store.panel(['SYN00000', 'SYN00001'], start, end, fields=('Adj Close', 'Open'))
+        assert panel.columns.tolist() == [('Adj Close', 'SYN00000'), ('Adj Close', 'SYN00001'),
+                                          ('Open', 'SYN00000'), ('Open', 'SYN00001')]
+        assert np.shares_memory(panel['Adj Close']['SYN00000'].to_numpy(), values)
+
+    def test_appends_and_merges(self):
+        ticker = self.bars.xs('SYN00002', axis=1, level=1)
+        store = BarStore(tempfile.mkdtemp())
+        store.write('SYN00002', ticker.iloc[:1000])
+        size = os.path.getsize(store._path('SYN00002', 'Adj Close'))
+        store.write('SYN00002', ticker.iloc[1000:])
+        assert os.path.getsize(store._path('SYN00002', 'Adj Close')) == size * len(ticker) // 1000
+        # Overlapping and out of order bars are merged, the new value wins
+        revised = ticker.iloc[500:1500] * 2
+        store.write('SYN00002', revised)
+        stored = BarStore(store.root).read('SYN00002')
+        assert len(stored) == len(ticker)
+        pd.testing.assert_series_equal(stored['Close'].iloc[500:1500], revised['Close'], check_names=False,
+                                       check_freq=False, check_index_type=False)
+        shutil.rmtree(store.root)
+
+    def test_chunked_resampling_matches_pandas(self):
+        resampled = self.store.resample('SYN00001', '1h', chunk_rows=1000)
+        expected = (self.bars.xs('SYN00001', axis=1, level=1)
+                    .resample('1h').agg({'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last',
+                                         'Adj Close': 'last', 'Volume': 'sum'}).dropna())
+        pd.testing.assert_frame_equal(resampled[expected.columns], expected, check_names=False, check_freq=False,
+                                      check_index_type=False)
+        daily = self.store.panel(['SYN00000', 'SYN00001'], fields=('Adj Close',), rule='1D')
+        assert len(daily) == 10
+        assert daily['Adj Close']['SYN00001'].tolist() == expected['Adj Close'].resample('1D').last().dropna().tolist()
+
+    def test_unaligned_tickers_are_joined(self):
+        self.store.write('LATE', self.bars.xs('SYN00003', axis=1, level=1).iloc[100:])
+        panel = self.store.panel(['SYN00000', 'LATE', 'MISSING'])
+        assert panel.columns.tolist() == [('Adj Close', 'SYN00000'), ('Adj Close', 'LATE')]
+        assert panel['Adj Close']['LATE'].isna().sum() == 100
+
+
+    def test_missing_field_is_nan_when_resampled(self):
+        self.store.write('ADJ_ONLY', self.bars.xs('SYN00001', axis=1, level=1)[['Adj Close']])
+        fields = ('Adj Close', 'Open')
+        raw = self.store.panel(['SYN00000', 'ADJ_ONLY'], fields=fields)
+        hourly = self.store.panel(['SYN00000', 'ADJ_ONLY'], fields=fields, rule='1h')
+        assert raw['Open']['ADJ_ONLY'].isna().all() and hourly['Open']['ADJ_ONLY'].isna().all()
+        pd.testing.assert_series_equal(hourly['Adj Close']['ADJ_ONLY'],
+                                       self.store.resample('SYN00001', '1h')['Adj Close'], check_names=False)
+
+
+class TestBarStoreScreening(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = BarStore(self.root)
+        dates = pd.bdate_range(Dates.START_DATE.value.normalize(), Dates.END_DATE.value, name='Date')
+        self.bars, self.planted_pairs = synthetic_universe(8, n_pairs=2, seed=1, dates=dates)
+        self.store.write_panel(self.bars)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_metrics_from_the_store_match_the_panel(self):
+        clear_pair_metrics_memo()
+        stock_1, stock_2 = self.planted_pairs[0]
+        from_store = collect_metrics_for_pair(stock_1, stock_2, bar_store=self.store)
+        clear_pair_metrics_memo()
+        window = self.bars[self.bars.index >= Dates.START_DATE.value]
+        from_panel = collect_metrics_for_pair(stock_1, stock_2, price_panel=window)
+        pd.testing.assert_frame_equal(from_store, from_panel, check_names=False, check_freq=False,
+                                      check_index_type=False)
+
+    def test_screen_reads_the_store(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            stock_data = StockData(list(self.bars['Adj Close'].columns), bypass_adf_test=True, coint_engine='batch',
+                                   bar_store=self.store)
+        assert np.shares_memory(stock_data.price_history_df.iloc[:, 0].to_numpy(),
+                                self.store.slice(stock_data.price_history_df.columns[0], 'Adj Close'))
+        assert tuple(stock_data.most_suitable_pair) in self.planted_pairs
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.adfvalues import mackinnonp
+from statsmodels.tsa.stattools import coint, adfuller
+
+from analysis.cointegration import all_pairs, serial_coint_pvalues, parallel_coint_pvalues
+from analysis.cointegration import batch_coint_pvalues, batch_adf_stats, mackinnon_pvalues
+from tests.helpers import make_universe, stock_data_for
+
+
+class TestParallelCointegration(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        warnings.filterwarnings("ignore")
+        cls.prices = make_universe()
+
+    def test_all_pairs_matches_double_loop(self):
+        assert all_pairs(4) == [(0, 1), (0, 2), (0, 3), (1, 2), (1, 3), (2, 3)]
+
+    def test_serial_matches_statsmodels(self):
+        pairs = all_pairs(len(self.prices.columns))
+        expected = [round(coint(self.prices.iloc[:, i], self.prices.iloc[:, j], trend="c", autolag="BIC")[1], 5)
+                    for i, j in pairs]
+        assert serial_coint_pvalues(self.prices, pairs) == expected
+
+    def test_parallel_matches_serial(self):
+        pairs = all_pairs(len(self.prices.columns))
+        parallel = parallel_coint_pvalues(self.prices, pairs, n_workers=2, chunk_size=5, show_progress=False)
+        assert parallel == serial_coint_pvalues(self.prices, pairs)
+
+    def test_find_cointegrated_pairs_engines_agree(self):
+        serial = stock_data_for('serial').find_cointegrated_pairs(self.prices, p_value_thresh=0.05)
+        parallel = stock_data_for('parallel').find_cointegrated_pairs(self.prices, p_value_thresh=0.05)
+        pd.testing.assert_frame_equal(serial, parallel)
+        assert 'T0 - T1' in serial.index
+
+
+class TestBatchCointegration(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        warnings.filterwarnings("ignore")
+        cls.prices = make_universe(n_tickers=10, n_days=300, seed=11)
+
+    def test_batch_matches_serial(self):
+        pairs = all_pairs(len(self.prices.columns))
+        batch = batch_coint_pvalues(self.prices, pairs, max_batch=3)
+        np.testing.assert_allclose(batch, serial_coint_pvalues(self.prices, pairs), atol=1e-4)
+
+    def test_batch_on_subset_of_pairs(self):
+        pairs = [(3, 7), (0, 1), (5, 2)]
+        np.testing.assert_allclose(batch_coint_pvalues(self.prices, pairs),
+                                   serial_coint_pvalues(self.prices, pairs), atol=1e-4)
+
+    def test_adf_stats_match_adfuller(self):
+        x = self.prices.to_numpy()
+        stats, lags = batch_adf_stats(x, autolag='AIC', regression='c')
+        for column in range(x.shape[1]):
+            result = adfuller(x[:, column], autolag='AIC', regression='c')
+            self.assertAlmostEqual(stats[column], result[0], places=8)
+            assert lags[column] == result[2]
+
+    def test_fixed_lag_adf_matches_adfuller(self):
+        x = self.prices.to_numpy()
+        stats, _ = batch_adf_stats(x, maxlag=2, autolag=None, regression='n')
+        expected = [adfuller(x[:, column], maxlag=2, autolag=None, regression='n')[0] for column in range(x.shape[1])]
+        np.testing.assert_allclose(stats, expected, rtol=1e-8)
+
+    def test_mackinnon_pvalues_match_scalar(self):
+        test_stats = np.array([-30.0, -5.0, -3.4, -2.0, 0.5, 5.0])
+        expected = [mackinnonp(stat, regression='c', N=2) for stat in test_stats]
+        np.testing.assert_allclose(mackinnon_pvalues(test_stats, regression='c', N=2), expected)
+
+    def test_find_cointegrated_pairs_batch_engine(self):
+        serial = stock_data_for('serial').find_cointegrated_pairs(self.prices, p_value_thresh=0.05)
+        batch = stock_data_for('batch').find_cointegrated_pairs(self.prices, p_value_thresh=0.05)
+        assert list(serial.index) == list(batch.index)
+
+
+if __name__ == '__main__':
+    unittest.main()
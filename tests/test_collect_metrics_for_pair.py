@@ -1,7 +1,7 @@
 import unittest
 import numpy as np
 import pandas as pd
-from analysis.statistical_methods import collect_metrics_for_pair
+from analysis.statistical_methods import collect_metrics_for_pair, clear_pair_metrics_memo, _pair_metrics_memo
 import warnings
 
 no_df_result = "result is not a DataFrame"
@@ -46,5 +46,54 @@ class TestCollectMetricsForPair(unittest.TestCase):
         assert 'z_score' in self.metrics.columns, "z_score not found in columns"
 
 
+class TestCollectMetricsFromPanel(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        warnings.filterwarnings("ignore")
+        dates = pd.bdate_range('2023-01-02', periods=300, name='Date')
+        rng = np.random.default_rng(7)
+        common = 100 + rng.standard_normal(len(dates)).cumsum()
+        adj_close = pd.DataFrame({'AAA': common + rng.standard_normal(len(dates)),
+                                  'BBB': 0.5 * common + 60 + rng.standard_normal(len(dates)),
+                                  'CCC': 100 + rng.standard_normal(len(dates)).cumsum()}, index=dates)
+        open_prices = adj_close * (1 + rng.standard_normal(adj_close.shape) * 0.002)
+        cls.adj_close = adj_close
+        cls.panel = pd.concat({'Adj Close': adj_close, 'Open': open_prices}, axis=1)
+
+    def setUp(self):
+        clear_pair_metrics_memo()
+
+    def test_slices_pair_from_panel(self):
+        metrics = collect_metrics_for_pair('BBB', 'AAA', price_panel=self.panel)
+        assert list(metrics.columns[:4]) == ['BBB', 'AAA', 'BBB_forward_return', 'AAA_forward_return']
+        assert not metrics.isin([np.inf, -np.inf, np.nan]).values.any(), "result contains infinite or NaN values"
+        pd.testing.assert_series_equal(metrics['AAA'], self.adj_close['AAA'].loc[metrics.index], check_freq=False)
+        expected_return = (self.panel['Adj Close']['AAA'] - self.panel['Open']['AAA']) / self.panel['Open']['AAA']
+        pd.testing.assert_series_equal(metrics['AAA_forward_return'], expected_return.shift(-1).loc[metrics.index],
+                                       check_names=False, check_freq=False)
+
+    def test_adj_close_only_panel(self):
+        metrics = collect_metrics_for_pair('AAA', 'BBB', price_panel=self.adj_close)
+        assert not metrics.empty
+        assert 'z_score' in metrics.columns, "z_score not found in columns"
+
+    def test_pair_computed_once(self):
+        first = collect_metrics_for_pair('AAA', 'BBB', price_panel=self.panel)
+        first['spread'] = 0
+        second = collect_metrics_for_pair('AAA', 'BBB', price_panel=self.panel)
+        assert len(_pair_metrics_memo) == 1
+        assert (second['spread'] != 0).any(), "memoised result was modified through a returned copy"
+
+    def test_same_span_with_other_prices_is_recomputed(self):
+        first = collect_metrics_for_pair('AAA', 'BBB', price_panel=self.panel)
+        revised = self.panel.copy()
+        revised.loc[revised.index[-20:], ('Adj Close', 'AAA')] *= 1.1
+        second = collect_metrics_for_pair('AAA', 'BBB', price_panel=revised)
+        assert len(_pair_metrics_memo) == 2
+        assert not second['spread'].equals(first['spread'])
+        pd.testing.assert_frame_equal(second, collect_metrics_for_pair('AAA', 'BBB', price_panel=revised.copy()))
+        assert len(_pair_metrics_memo) == 2
+
+
 if __name__ == '__main__':
     unittest.main()
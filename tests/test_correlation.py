@@ -0,0 +1,58 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from analysis.correlation import blocked_corr_pairs
+
+
+def dense_corr_pairs(prices: pd.DataFrame, corr_thresh: float) -> dict:
+    """ Every pair of the upper triangle of df.corr() at or above corr_thresh, as (Stock_1, Stock_2) -> value. """
+    corr_matrix = prices.corr().abs().to_numpy()
+    rows, cols = np.triu_indices(len(prices.columns), k=1)
+    return {(prices.columns[i], prices.columns[j]): corr_matrix[i, j] for i, j in zip(rows, cols)
+            if corr_matrix[i, j] >= corr_thresh}
+
+
+class TestBlockedCorrPairs(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        factors = rng.standard_normal((250, 5)).cumsum(axis=0)
+        loadings = rng.standard_normal((5, 70))
+        prices = 100 + factors @ loadings + rng.standard_normal((250, 70)) * 3
+        self.prices = pd.DataFrame(prices, columns=[f'T{n}' for n in range(70)])
+
+    def test_matches_the_dense_matrix_across_tiles(self):
+        pairs = blocked_corr_pairs(self.prices, corr_thresh=0.6, block_size=16)
+        expected = dense_corr_pairs(self.prices, 0.6)
+        assert len(pairs) == len(expected) > 100
+        found = dict(zip(zip(pairs['Stock_1'], pairs['Stock_2']), pairs['Correlation']))
+        assert found.keys() == expected.keys()
+        assert max(abs(found[pair] - expected[pair]) for pair in expected) < 1e-10
+        assert pairs['Correlation'].is_monotonic_decreasing
+
+    def test_top_k(self):
+        pairs = blocked_corr_pairs(self.prices, corr_thresh=None, top_k=25, block_size=16)
+        everything = blocked_corr_pairs(self.prices, corr_thresh=None)
+        assert len(everything) == 70 * 69 // 2
+        pd.testing.assert_frame_equal(pairs, everything.head(25))
+
+    def test_float32(self):
+        pairs = blocked_corr_pairs(self.prices, corr_thresh=0.6, dtype=np.float32)
+        exact = blocked_corr_pairs(self.prices, corr_thresh=0.6)
+        found = dict(zip(zip(pairs['Stock_1'], pairs['Stock_2']), pairs['Correlation']))
+        for stock_1, stock_2, value in exact.itertuples(index=False):
+            if abs(value - 0.6) > 1e-5:
+                assert abs(found[stock_1, stock_2] - value) < 1e-5
+
+    def test_pairs_sharing_a_correlation_are_all_kept(self):
+        prices = self.prices[['T0', 'T1']].copy()
+        prices['T2'] = prices['T1'] * 2 + 1
+        pairs = blocked_corr_pairs(prices, corr_thresh=0.0)
+        assert len(pairs) == 3
+        assert pairs['Correlation'].iloc[1] == pairs['Correlation'].iloc[2]
+
+
+if __name__ == '__main__':
+    unittest.main()
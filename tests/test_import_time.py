@@ -0,0 +1,18 @@
+import unittest
+
+from benchmarks.import_time import BUDGET_MS, measure_import
+
+
+class TestImportTime(unittest.TestCase):
+
+    def test_cli_imports_within_budget(self):
+        result = min((measure_import() for _ in range(3)), key=lambda run: run['total_ms'])
+        assert result['heavy'] == []
+        assert result['total_ms'] < BUDGET_MS
+
+    def test_heavy_modules_are_detected(self):
+        assert 'pandas' in measure_import('analysis.price_cache')['heavy']
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from analysis.kalman import KalmanHedge
+from analysis.statistical_methods import collect_metrics_for_pair, clear_pair_metrics_memo
+
+
+class TestKalmanHedge(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(4)
+        cls.n_bars, cls.n_pairs = 600, 6
+        cls.prices_2 = 50 + rng.standard_normal((cls.n_bars, cls.n_pairs)).cumsum(axis=0)
+        # The hedge ratio steps from 1.0 to 1.5 half way through
+        cls.betas = np.where(np.arange(cls.n_bars)[:, None] < cls.n_bars // 2, 1.0, 1.5)
+        cls.prices_1 = cls.betas * cls.prices_2 + 10 + rng.standard_normal((cls.n_bars, cls.n_pairs)) * 0.5
+
+    def test_tracks_a_regime_change(self):
+        estimates = KalmanHedge(self.n_pairs, delta=1e-4, obs_var=0.25).filter(self.prices_1, self.prices_2)
+        before, after = estimates['hedge_ratio'][250:300], estimates['hedge_ratio'][-50:]
+        assert np.abs(before - 1.0).max() < 0.15
+        assert np.abs(after - 1.5).max() < 0.15
+        # Once settled the prediction errors are the observation noise
+        assert 0.3 < estimates['spread'][-100:].std() < 1.0
+
+    def test_batch_matches_single_pairs_and_steps(self):
+        batch = KalmanHedge(self.n_pairs).filter(self.prices_1, self.prices_2)
+        single = KalmanHedge(1).filter(self.prices_1[:, 2], self.prices_2[:, 2])
+        for name, values in single.items():
+            np.testing.assert_allclose(batch[name][:, 2], values, rtol=1e-12)
+
+        seeded = KalmanHedge(self.n_pairs)
+        seeded.filter(self.prices_1[:400], self.prices_2[:400])
+        for bar in range(400, self.n_bars):
+            step = seeded.step(self.prices_1[bar], self.prices_2[bar])
+            np.testing.assert_allclose(step['spread'], batch['spread'][bar], rtol=1e-12)
+
+    def test_missing_prices_keep_the_state(self):
+        kalman = KalmanHedge(2)
+        kalman.filter(self.prices_1[:100, :2], self.prices_2[:100, :2])
+        state = kalman.state.copy()
+        step = kalman.step([np.nan, self.prices_1[100, 1]], self.prices_2[100, :2])
+        assert np.isnan(step['spread'][0])
+        assert kalman.state[0].tolist() == state[0].tolist()
+        assert kalman.state[1].tolist() != state[1].tolist()
+        assert kalman.cov[0, 0, 0] > 0
+
+    def test_thousands_of_pairs_per_bar(self):
+        n_pairs = 5000
+        kalman = KalmanHedge(n_pairs)
+        prices_2 = np.full(n_pairs, 50.0)
+        timings = []
+        for bar in range(50):
+            start_time = time.perf_counter()
+            kalman.step(prices_2 * 1.2 + bar % 3, prices_2)
+            timings.append(time.perf_counter() - start_time)
+        assert np.median(timings) < 0.005
+
+
+class TestKalmanMetrics(unittest.TestCase):
+
+    def test_collect_metrics_with_kalman(self):
+        rng = np.random.default_rng(1)
+        dates = pd.bdate_range('2023-01-02', periods=400, name='Date')
+        close_2 = 100 + rng.standard_normal(400).cumsum()
+        close_1 = 0.8 * close_2 + 20 + rng.standard_normal(400)
+        panel = pd.DataFrame({'AAA': close_1, 'BBB': close_2}, index=dates)
+        clear_pair_metrics_memo()
+        kalman = collect_metrics_for_pair('AAA', 'BBB', price_panel=panel, hedge_method='kalman')
+        rolling = collect_metrics_for_pair('AAA', 'BBB', price_panel=panel)
+        assert list(kalman.columns) == list(rolling.columns)
+        assert abs(kalman['hedge_ratio'].iloc[-50:].mean() - 0.8) < 0.15
+        intercept = pd.Series(KalmanHedge(1).filter(panel['AAA'], panel['BBB'])['intercept'], index=dates)
+        np.testing.assert_allclose(kalman['spread'], kalman['AAA'] - kalman['hedge_ratio'] * kalman['BBB']
+                                   - intercept[kalman.index])
+        with self.assertRaises(ValueError):
+            collect_metrics_for_pair('AAA', 'BBB', price_panel=panel, hedge_method='ewma')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from alpaca.common.exceptions import APIError
+from alpaca.trading import OrderSide, MarketOrderRequest, TimeInForce
+
+from trading.alpaca_functions import Alpaca
+from trading.order_scheduler import OrderScheduler, TokenBucket
+from trading.fake_alpaca import FakeTradingClient
+
+
+def market_order(symbol):
+    return MarketOrderRequest(symbol=symbol, qty=1, side=OrderSide.BUY, time_in_force=TimeInForce.DAY)
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_rate_is_respected_after_burst(self):
+        bucket = TokenBucket(rate=50, capacity=5)
+        start_time = time.perf_counter()
+        for _ in range(15):
+            bucket.acquire()
+        # The burst of 5 is free, the 10 after it take 1 / 50 seconds each
+        assert 0.18 <= time.perf_counter() - start_time < 0.5
+
+
+class TestOrderScheduler(unittest.TestCase):
+
+    def test_orders_go_out_by_priority(self):
+        client = FakeTradingClient()
+        gate = threading.Event()
+        submit_order = client.submit_order
+        client.submit_order = lambda order_data: gate.wait() and submit_order(order_data)
+        with OrderScheduler(client, rate=1000, burst=1000, n_workers=1) as scheduler:
+            # The worker takes the first order and blocks on it while the rest are queued
+            scheduler.submit(market_order('FIRST'), priority=0)
+            time.sleep(0.05)
+            scheduler.submit_batch([market_order('LOW_1'), market_order('LOW_2')], priority=2)
+            scheduler.submit(market_order('HIGH'), priority=1)
+            gate.set()
+        assert [order.symbol for order in client.orders.values()] == ['FIRST', 'HIGH', 'LOW_1', 'LOW_2']
+
+    def test_transient_errors_are_retried(self):
+        client = FakeTradingClient(transient_failures=2)
+        with OrderScheduler(client, rate=1000, burst=1000, backoff=0.01) as scheduler:
+            order = scheduler.submit(market_order('AAA')).result(timeout=5)
+        assert order.symbol == 'AAA'
+        assert scheduler.retries == 2 and scheduler.requests == 3
+
+    def test_accepted_order_is_not_duplicated_by_a_retry(self):
+        client = FakeTradingClient(lost_responses=1)
+        with OrderScheduler(client, rate=1000, burst=1000, backoff=0.01) as scheduler:
+            order = scheduler.submit(market_order('AAA')).result(timeout=5)
+        assert scheduler.retries == 1
+        assert len(client.orders) == 1
+        assert client.positions['AAA']['qty'] == 1
+        assert order.id == next(iter(client.orders))
+
+    def test_lost_response_on_the_last_retry_is_not_a_failure(self):
+        # Every attempt fails, the last one after the order was accepted
+        client = FakeTradingClient(transient_failures=3, lost_responses=1)
+        with OrderScheduler(client, rate=1000, burst=1000, backoff=0.01, max_retries=3) as scheduler:
+            order = scheduler.submit(market_order('AAA')).result(timeout=5)
+        assert scheduler.retries == 3
+        assert len(client.orders) == 1
+        assert order.id == next(iter(client.orders))
+
+    def test_retries_running_out_fail_the_order(self):
+        client = FakeTradingClient(transient_failures=4)
+        with OrderScheduler(client, rate=1000, burst=1000, backoff=0.01, max_retries=3) as scheduler:
+            future = scheduler.submit(market_order('AAA'))
+            assert isinstance(future.exception(timeout=5), APIError)
+        assert client.orders == {}
+
+    def test_other_errors_fail_at_once(self):
+        client = FakeTradingClient(reject={'AAA': 40310000})
+        with OrderScheduler(client, rate=1000, burst=1000, backoff=0.01) as scheduler:
+            future = scheduler.submit(market_order('AAA'))
+            assert isinstance(future.exception(timeout=5), APIError)
+        assert scheduler.requests == 1
+
+
+class TestEnterBasket(unittest.TestCase):
+
+    def test_thirty_pairs_enter_concurrently(self):
+        client = FakeTradingClient(latency=0.05, reject={'S12': 40310000})
+        alpaca = Alpaca(client=client)
+        pairs = [(f'L{n}', f'S{n}', 0.5) for n in range(30)]
+        start_time = time.perf_counter()
+        with OrderScheduler(client, rate=1000, burst=1000, n_workers=8) as scheduler:
+            results = alpaca.enter_basket(pairs, leverage=10, scheduler=scheduler)
+        # 60 orders of 50 ms each would take 3 seconds one at a time
+        assert time.perf_counter() - start_time < 1.5
+        assert [result['pair'] for result in results] == [pair[:2] for pair in pairs]
+        assert [result['status'] for result in results].count('compensated') == 1
+        assert results[12]['legs'][1]['error'] == 40310000
+        # 59 accepted legs and the order flattening the rejected pair's long leg
+        assert len(client.orders) == 60
+        assert len(client.positions) == 58
+        assert all(leg['ack_latency'] >= 0.05 for result in results for leg in result['legs'])
+
+    def test_failing_pair_does_not_stop_the_basket(self):
+        client = FakeTradingClient(reject={'S1': 40310000, 'S3': 40310000})
+        alpaca = Alpaca(client=client)
+        submit_order = client.submit_order
+
+        def no_closing_orders(order_data):
+            if order_data.symbol == 'L1' and order_data.side == OrderSide.SELL:
+                raise ConnectionError('connection reset')
+            return submit_order(order_data=order_data)
+
+        client.submit_order = no_closing_orders
+        compensate_leg = alpaca._compensate_leg
+
+        def broken_for_l3(leg):
+            if leg['symbol'] == 'L3':
+                raise RuntimeError('unexpected order state')
+            return compensate_leg(leg)
+
+        pairs = [(f'L{n}', f'S{n}', 0.5) for n in range(5)]
+        with mock.patch.object(alpaca, '_compensate_leg', broken_for_l3), self.assertLogs(level='ERROR'):
+            with OrderScheduler(client, rate=1000, burst=1000, n_workers=4) as scheduler:
+                results = alpaca.enter_basket(pairs, leverage=10, scheduler=scheduler)
+        assert [result['status'] for result in results] == ['acknowledged', 'compensation_failed', 'acknowledged',
+                                                            'failed', 'acknowledged']
+        assert results[1]['legs'][0]['compensation_error'] == 'connection reset'
+        assert results[3]['error'] == 'unexpected order state'
+
+
+if __name__ == '__main__':
+    unittest.main()
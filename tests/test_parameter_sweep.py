@@ -0,0 +1,68 @@
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from analysis.backtest import run_backtest
+from analysis.parameter_sweep import parameter_grid, random_parameters, load_pair_inputs, run_parameter_sweep
+from analysis.statistical_methods import collect_metrics_for_pair, clear_pair_metrics_memo
+
+
+class TestParameterSweep(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        warnings.filterwarnings("ignore")
+        dates = pd.bdate_range('2023-01-02', periods=260, name='Date')
+        rng = np.random.default_rng(9)
+        common = 100 + rng.standard_normal(len(dates)).cumsum()
+        adj_close = pd.DataFrame({'AAA': common + rng.standard_normal(len(dates)),
+                                  'BBB': 0.7 * common + 40 + rng.standard_normal(len(dates))}, index=dates)
+        open_prices = adj_close * (1 + rng.standard_normal(adj_close.shape) * 0.003)
+        cls.panel = pd.concat({'Adj Close': adj_close, 'Open': open_prices}, axis=1)
+        cls.pair_inputs = {('AAA', 'BBB'): load_pair_inputs('AAA', 'BBB', price_panel=cls.panel)}
+
+    def test_live_parameters_match_backtest(self):
+        clear_pair_metrics_memo()
+        for rule in ['zscore', 'tp_sl', 'hold']:
+            swept = run_parameter_sweep(self.pair_inputs, parameter_grid({'rule': [rule], 'tp': [0.01],
+                                                                          'sl': [-0.01]}), n_workers=1)
+            _, expected = run_backtest(collect_metrics_for_pair('AAA', 'BBB', price_panel=self.panel), rule=rule,
+                                       tp=0.01, sl=-0.01)
+            for name, value in expected.items():
+                self.assertAlmostEqual(swept[name].iloc[0], value, places=10)
+
+    def test_default_grid_does_not_gate_on_correlation(self):
+        # The second leg moves against the first, so the rolling correlation is negative throughout
+        adj_close = self.panel['Adj Close'].assign(BBB=lambda df: 250 - df['BBB'])
+        panel = pd.concat({'Adj Close': adj_close, 'Open': adj_close * (self.panel['Open'] / self.panel['Adj Close'])},
+                          axis=1)
+        pair_inputs = {('AAA', 'BBB'): load_pair_inputs('AAA', 'BBB', price_panel=panel)}
+        assert (adj_close['AAA'].rolling(180).corr(adj_close['BBB']).dropna() < 0).all()
+
+        clear_pair_metrics_memo()
+        swept = run_parameter_sweep(pair_inputs, parameter_grid({}), n_workers=1)
+        _, expected = run_backtest(collect_metrics_for_pair('AAA', 'BBB', price_panel=panel))
+        assert expected['trades'] > 0
+        for name, value in expected.items():
+            self.assertAlmostEqual(swept[name].iloc[0], value, places=10)
+        gated = run_parameter_sweep(pair_inputs, parameter_grid({'min_corr': [0.0]}), n_workers=1)
+        assert gated['trades'].iloc[0] == 0
+
+    def test_sweep_is_ranked_and_complete(self):
+        grid = parameter_grid({'hedge_window': [20, 60], 'z_window': [20, 50], 'entry': [0.5, 1.0, 1.5],
+                               'rule': ['zscore', 'hold'], 'min_corr': [0.0, 0.9]})
+        swept = run_parameter_sweep(self.pair_inputs, grid, n_workers=1)
+        assert len(swept) == len(grid) == 48
+        assert swept['sharpe'].is_monotonic_decreasing
+
+    def test_process_pool_matches_in_process(self):
+        combinations = random_parameters({'hedge_window': [20, 40, 60], 'z_window': [20, 50],
+                                          'entry': [0.5, 1.0, 2.0]}, n=30, seed=1)
+        in_process = run_parameter_sweep(self.pair_inputs, combinations, n_workers=1)
+        pooled = run_parameter_sweep(self.pair_inputs, combinations, n_workers=2)
+        pd.testing.assert_frame_equal(in_process, pooled)
+
+
+if __name__ == '__main__':
+    unittest.main()
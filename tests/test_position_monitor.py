@@ -0,0 +1,137 @@
+import asyncio
+import time
+import unittest
+import uuid
+from types import SimpleNamespace
+
+from alpaca.trading import OrderSide, Position, PositionSide, TradeEvent
+
+from trading.alpaca_functions import Alpaca
+from trading.fake_alpaca import FakeTradingClient
+from trading.position_monitor import PositionBook, TpSlMonitor
+
+
+def make_position(symbol, qty, cost_basis, unrealized_pl) -> Position:
+    return Position(asset_id=uuid.uuid4(), symbol=symbol, exchange='NASDAQ', asset_class='us_equity',
+                    avg_entry_price=str(abs(cost_basis / qty)), qty=str(qty),
+                    side=PositionSide.LONG if qty > 0 else PositionSide.SHORT, cost_basis=str(cost_basis),
+                    unrealized_pl=str(unrealized_pl))
+
+
+def make_trade_update(event, symbol, position_qty):
+    return SimpleNamespace(event=event, order=SimpleNamespace(id=uuid.uuid4(), symbol=symbol),
+                           position_qty=position_qty)
+
+
+class TestPositionBook(unittest.TestCase):
+
+    def test_profit_on_gross_cost_basis(self):
+        book = PositionBook()
+        book.load_positions([make_position('AAA', 10, 1000, 30), make_position('BBB', -5, -1000, -10)])
+        assert book.unrealised_profit_pc() == 1.0
+
+    def test_trade_updates_track_orders_and_quantities(self):
+        book = PositionBook()
+        new_order = make_trade_update(TradeEvent.NEW, 'AAA', None)
+        assert not book.apply_trade_update(new_order)
+        assert len(book.orders) == 1
+        fill = SimpleNamespace(event='fill', order=new_order.order, position_qty=10)
+        assert book.apply_trade_update(fill)
+        assert book.orders == {}
+        assert book.positions['AAA']['qty'] == 10
+
+
+class TestTpSlMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeTradingClient(prices={'AAA': 100, 'BBB': 50})
+        self.client.set_position('AAA', 10, 100)
+        self.alpaca = Alpaca(client=self.client)
+
+    def test_fill_event_triggers_take_profit_without_waiting_for_poll(self):
+        stream = self.client.stream()
+        monitor = TpSlMonitor(self.alpaca, tp=2, sl=2, stream=stream, poll_interval=60, min_refresh_interval=0)
+
+        async def scenario():
+            run = asyncio.create_task(monitor.run())
+            await asyncio.sleep(0.05)
+            self.client.set_price('AAA', 105)
+            await asyncio.to_thread(self.alpaca.send_market_order, 'BBB', 1, OrderSide.BUY)
+            return await asyncio.wait_for(run, timeout=5)
+
+        start_time = time.perf_counter()
+        assert asyncio.run(scenario()) == 'take_profit'
+        assert time.perf_counter() - start_time < 5
+        assert self.client.positions == {}
+
+    def test_polling_fallback_triggers_stop_loss(self):
+        monitor = TpSlMonitor(self.alpaca, tp=2, sl=2, poll_interval=0.01, min_refresh_interval=0)
+
+        async def scenario():
+            run = asyncio.create_task(monitor.run())
+            await asyncio.sleep(0.05)
+            self.client.set_price('AAA', 95)
+            return await asyncio.wait_for(run, timeout=5)
+
+        assert asyncio.run(scenario()) == 'stop_loss'
+        assert self.client.positions == {}
+
+    def test_api_errors_do_not_stop_the_monitor(self):
+        monitor = TpSlMonitor(self.alpaca, tp=2, sl=2, poll_interval=0.01, min_refresh_interval=0)
+        get_all_positions, close_all_positions = self.client.get_all_positions, self.client.close_all_positions
+        failures = {'get_all_positions': 3, 'close_all_positions': 1}
+
+        def failing(name, call):
+            def wrapper(*args, **kwargs):
+                if failures[name] > 0:
+                    failures[name] -= 1
+                    raise ConnectionError(f'{name} failed')
+                return call(*args, **kwargs)
+            return wrapper
+
+        async def scenario():
+            run = asyncio.create_task(monitor.run())
+            await asyncio.sleep(0.05)
+            self.client.get_all_positions = failing('get_all_positions', get_all_positions)
+            self.client.close_all_positions = failing('close_all_positions', close_all_positions)
+            self.client.set_price('AAA', 95)
+            return await asyncio.wait_for(run, timeout=5)
+
+        with self.assertLogs(level='ERROR'):
+            assert asyncio.run(scenario()) == 'stop_loss'
+        assert failures == {'get_all_positions': 0, 'close_all_positions': 0}
+        assert self.client.positions == {}
+
+    def test_dead_stream_is_raised(self):
+        stream = self.client.stream()
+
+        async def broken():
+            raise ConnectionError('websocket closed')
+
+        stream._run_forever = broken
+        monitor = TpSlMonitor(self.alpaca, tp=2, sl=2, stream=stream, poll_interval=60)
+        with self.assertRaises(ConnectionError):
+            asyncio.run(asyncio.wait_for(monitor.run(), timeout=5))
+        with self.assertRaises(TypeError):
+            TpSlMonitor(self.alpaca, tp=2, sl=2, stream=SimpleNamespace(subscribe_trade_updates=print))
+
+    def test_event_bursts_are_throttled(self):
+        stream = self.client.stream()
+        monitor = TpSlMonitor(self.alpaca, tp=2, sl=2, stream=stream, poll_interval=60, min_refresh_interval=60)
+
+        async def scenario():
+            run = asyncio.create_task(monitor.run())
+            await asyncio.sleep(0.05)
+            for _ in range(10):
+                await asyncio.to_thread(self.alpaca.send_market_order, 'BBB', 1, OrderSide.BUY)
+            await asyncio.sleep(0.1)
+            monitor.stop()
+            return await run
+
+        asyncio.run(scenario())
+        assert stream.delivered == 20
+        assert monitor.refreshes == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
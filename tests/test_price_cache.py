@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from analysis.price_cache import FileProvider, PriceCache
+
+
+class CountingFileProvider(FileProvider):
+    """ FileProvider that records every range it is asked for. """
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.calls = []
+
+    def fetch(self, tickers, start, end):
+        self.calls.append((tuple(tickers), start, end))
+        return super().fetch(tickers, start, end)
+
+
+class TestPriceCache(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.cache_dir = tempfile.mkdtemp()
+        dates = pd.bdate_range('2023-01-02', '2023-12-29', name='Date')
+        rng = np.random.default_rng(0)
+        for ticker in ['AAA', 'BBB', 'CCC']:
+            close = 100 + rng.standard_normal(len(dates)).cumsum()
+            bars = pd.DataFrame({'Open': close - 0.5, 'High': close + 1, 'Low': close - 1, 'Close': close,
+                                 'Adj Close': close, 'Volume': 1000}, index=dates)
+            bars.to_csv(os.path.join(self.data_dir, f'{ticker}.csv'))
+        self.provider = CountingFileProvider(self.data_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+        shutil.rmtree(self.cache_dir)
+
+    def test_matches_provider(self):
+        cache = PriceCache(self.cache_dir, provider=self.provider)
+        cached = cache.get(['AAA', 'BBB'], '2023-02-01', '2023-06-01', fields=('Adj Close', 'Open'))
+        direct = self.provider.fetch(['AAA', 'BBB'], pd.Timestamp('2023-02-01'), pd.Timestamp('2023-06-01'))
+        pd.testing.assert_frame_equal(cached['Adj Close'], direct['Adj Close'], check_names=False,
+                                      check_freq=False)
+
+    def test_repeat_request_served_from_disk(self):
+        cache = PriceCache(self.cache_dir, provider=self.provider)
+        cache.get(['AAA', 'BBB'], '2023-02-01', '2023-06-01')
+        self.assertEqual(len(self.provider.calls), 1)
+
+        # A fresh instance reads the same directory and does not fetch again
+        cache = PriceCache(self.cache_dir, provider=self.provider)
+        cache.get(['AAA', 'BBB'], '2023-03-01', '2023-05-01')
+        self.assertEqual(len(self.provider.calls), 1)
+
+    def test_only_missing_tail_is_fetched(self):
+        cache = PriceCache(self.cache_dir, provider=self.provider)
+        cache.get(['AAA', 'BBB'], '2023-02-01', '2023-06-01')
+        prices = cache.get(['AAA', 'BBB'], '2023-02-01', '2023-07-01')
+        tickers, start, end = self.provider.calls[-1]
+        # From the last cached bar, which checks the adjustment basis
+        self.assertEqual((start, end), (pd.Timestamp('2023-05-31'), pd.Timestamp('2023-07-01')))
+        self.assertEqual(prices.index.max(), pd.Timestamp('2023-06-30'))
+        self.assertFalse(prices.isna().any().any())
+
+    def test_new_adjustment_basis_refetches_history(self):
+        cache = PriceCache(self.cache_dir, provider=self.provider)
+        cache.get(['AAA', 'BBB'], '2023-02-01', '2023-06-01')
+        # A 2:1 split of AAA, the provider now serves its whole history halved
+        path = os.path.join(self.data_dir, 'AAA.csv')
+        bars = pd.read_csv(path, index_col='Date', parse_dates=True)
+        bars[['Open', 'High', 'Low', 'Close', 'Adj Close']] /= 2
+        bars.to_csv(path)
+
+        prices = cache.get(['AAA', 'BBB'], '2023-02-01', '2023-07-01')
+        self.assertEqual(self.provider.calls[-1],
+                         (('AAA',), pd.Timestamp('2023-02-01'), pd.Timestamp('2023-07-01')))
+        direct = self.provider.fetch(['AAA', 'BBB'], pd.Timestamp('2023-02-01'), pd.Timestamp('2023-07-01'))
+        pd.testing.assert_frame_equal(prices['Adj Close'], direct['Adj Close'], check_names=False,
+                                      check_freq=False)
+
+    def test_unpublished_bars_are_fetched_later(self):
+        today = pd.Timestamp.now().normalize()
+        dates = pd.bdate_range(today - pd.Timedelta(days=60), today - pd.Timedelta(days=1), name='Date')
+        bars = pd.DataFrame({'Close': np.arange(len(dates), dtype=float) + 100}, index=dates)
+        bars['Adj Close'] = bars['Close']
+        path = os.path.join(self.data_dir, 'AAA.csv')
+        # The provider has yet to publish the last bar
+        bars.iloc[:-1].to_csv(path)
+        cache = PriceCache(self.cache_dir, provider=self.provider)
+        assert len(cache.get(['AAA'], dates[0], today)) == len(dates) - 1
+
+        bars.to_csv(path)
+        prices = cache.get(['AAA'], dates[0], today)
+        self.assertEqual(prices.index.max(), dates[-1])
+        self.assertEqual(self.provider.calls[-1][1], dates[-2])
+
+    def test_eviction_keeps_cache_bounded(self):
+        cache = PriceCache(self.cache_dir, provider=self.provider)
+        cache.get(['AAA'], '2023-01-01', '2024-01-01')
+        one_ticker_bytes = cache.index['AAA']['bytes']
+        cache.max_bytes = int(one_ticker_bytes * 1.5)
+        cache.get(['BBB'], '2023-01-01', '2024-01-01')
+        self.assertNotIn('AAA', cache.index)
+        self.assertIn('BBB', cache.index)
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, 'AAA.parquet')))
+
+    def test_unknown_ticker_returns_empty_column(self):
+        cache = PriceCache(self.cache_dir, provider=self.provider)
+        prices = cache.get(['AAA', 'ZZZ'], '2023-02-01', '2023-03-01')
+        self.assertTrue(prices['Adj Close']['ZZZ'].isna().all())
+        self.assertNotIn('ZZZ', cache.index)
+
+
+if __name__ == '__main__':
+    unittest.main()
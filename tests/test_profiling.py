@@ -0,0 +1,91 @@
+import json
+import os
+import pstats
+import tempfile
+import time
+import timeit as stdlib_timeit
+import unittest
+
+import numpy as np
+
+from utils.my_timer import timeit
+from utils.profiling import Profiler, profiled, profiler, span
+
+
+@profiled
+def inner():
+    time.sleep(0.001)
+
+
+@timeit
+def outer(n):
+    for _ in range(n):
+        inner()
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        profiler.disable()
+        profiler.reset()
+
+    def tearDown(self):
+        profiler.disable()
+        profiler.reset()
+
+    def test_nested_spans_are_aggregated(self):
+        profiler.enable()
+        with span('screen'):
+            outer(5)
+            outer(5)
+        stats = profiler.to_dict()
+        assert set(stats) == {'screen', 'screen/outer', 'screen/outer/inner'}
+        assert stats['screen/outer']['count'] == 2
+        assert stats['screen/outer/inner']['count'] == 10
+        assert 0.001 <= stats['screen/outer/inner']['p50_seconds'] <= stats['screen/outer/inner']['max_seconds']
+        assert stats['screen']['total_seconds'] >= stats['screen/outer']['total_seconds']
+
+    def test_disabled_records_nothing_and_costs_little(self):
+        @profiled
+        def noop():
+            pass
+
+        def bare():
+            pass
+
+        with span('ignored'):
+            noop()
+        assert profiler.to_dict() == {}
+        wrapped, plain = (min(stdlib_timeit.repeat(f, number=100000, repeat=5)) for f in (noop, bare))
+        # One attribute check and one extra call per invocation
+        assert (wrapped - plain) / 100000 < 1e-6
+
+    def test_memory_deltas(self):
+        local_profiler = Profiler()
+        local_profiler.enable(memory=True)
+        with local_profiler.span('allocate'):
+            kept = np.ones(2 ** 20)
+        local_profiler.disable()
+        assert local_profiler.to_dict()['allocate']['memory_delta_bytes'] >= kept.nbytes
+
+    def test_exports(self):
+        profiler.enable(cprofile=True)
+        outer(3)
+        profiler.disable()
+        directory = tempfile.mkdtemp()
+        profiler.export(os.path.join(directory, 'spans.json'))
+        profiler.export(os.path.join(directory, 'spans.prom'))
+        profiler.dump_cprofile(os.path.join(directory, 'spans.pstats'))
+
+        with open(os.path.join(directory, 'spans.json')) as file:
+            assert json.load(file)['outer/inner']['count'] == 3
+        with open(os.path.join(directory, 'spans.prom')) as file:
+            prometheus = file.read()
+        assert 'pairs_span_seconds_count{span="outer/inner"} 3' in prometheus
+        assert 'pairs_span_seconds{span="outer",quantile="0.99"}' in prometheus
+        stats = pstats.Stats(os.path.join(directory, 'spans.pstats'))
+        assert any(function[2] == 'inner' for function in stats.stats)
+
+
+if __name__ == '__main__':
+    unittest.main()
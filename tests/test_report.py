@@ -0,0 +1,110 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+from analysis.price_cache import FileProvider, PriceCache, get_default_cache, set_default_cache
+from analysis.report import lttb, downsample, draw_spread, render_reports, render_pair_report
+from analysis.statistical_methods import collect_metrics_for_pair
+from benchmarks.synthetic_universe import synthetic_universe
+from tests.test_stock_data import write_universe
+
+
+class TestLttb(unittest.TestCase):
+
+    def test_keeps_the_ends_and_the_spikes(self):
+        y = np.sin(np.linspace(0, 20, 10_000))
+        y[4321], y[7000] = 5.0, -5.0
+        kept = lttb(np.arange(len(y)), y, 200)
+        assert len(kept) == 200 and kept[0] == 0 and kept[-1] == len(y) - 1
+        assert (np.diff(kept) > 0).all()
+        assert {4321, 7000} <= set(kept)
+        assert y[kept].max() == 5.0 and y[kept].min() == -5.0
+
+    def test_short_series_are_untouched(self):
+        series = pd.Series([1.0, np.nan, 3.0, 2.0], index=pd.bdate_range('2024-01-02', periods=4))
+        pd.testing.assert_series_equal(downsample(series, 10), series.dropna())
+
+
+class TestReport(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        warnings.filterwarnings("ignore")
+        bars, cls.planted_pairs = synthetic_universe(8, n_pairs=3, seed=2)
+        cls.panel = bars[['Adj Close', 'Open']]
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_lines_are_downsampled(self):
+        metrics = collect_metrics_for_pair(*self.planted_pairs[0], price_panel=self.panel)
+        figure = Figure()
+        ax = figure.subplots()
+        assert len(metrics) > 50
+        draw_spread(ax, metrics, max_points=50)
+        assert len(ax.lines[0].get_xdata()) == 50
+
+    def test_renders_many_pairs_in_a_pool(self):
+        pairs = self.planted_pairs + [('SYN00000', 'MISSING')]
+        results = render_reports(pairs, out_dir=self.out_dir, price_panel=self.panel, fmt='html', n_workers=2)
+        assert len(results) == len(pairs)
+        assert results['error'].iloc[:-1].isna().all() and isinstance(results['error'].iloc[-1], str)
+        with open(os.path.join(self.out_dir, 'index.html')) as file:
+            index = file.read()
+        for stock_1, stock_2 in self.planted_pairs:
+            with open(os.path.join(self.out_dir, f'{stock_1}-{stock_2}.html')) as file:
+                assert 'data:image/png;base64,' in file.read()
+            assert f'href="{stock_1}-{stock_2}.html"' in index
+
+        png = render_reports(self.planted_pairs[:1], out_dir=self.out_dir, price_panel=self.panel, fmt='png',
+                             n_workers=1)
+        with open(png['path'].iloc[0], 'rb') as file:
+            assert file.read(8) == b'\x89PNG\r\n\x1a\n'
+        with self.assertRaises(ValueError):
+            render_reports(self.planted_pairs, out_dir=self.out_dir, fmt='svg')
+
+    def test_prices_are_downloaded_once_for_every_worker(self):
+        data_dir, cache_dir = tempfile.mkdtemp(dir=self.out_dir), tempfile.mkdtemp(dir=self.out_dir)
+        tickers = write_universe(data_dir, n_tickers=8)
+        previous_cache = get_default_cache()
+        set_default_cache(PriceCache(cache_dir, provider=FileProvider(data_dir)))
+        try:
+            pairs = list(zip(tickers[::2], tickers[1::2])) + [('T0', 'MISSING')]
+            results = render_reports(pairs, out_dir=self.out_dir, fmt='png', n_workers=4, dpi=20)
+        finally:
+            set_default_cache(previous_cache)
+        assert results['error'].iloc[:-1].isna().all() and 'MISSING' in results['error'].iloc[-1]
+        # Every ticker went through one cache, whose index on disk lists them all
+        with open(os.path.join(cache_dir, 'index.json')) as file:
+            assert sorted(json.load(file)) == sorted(tickers)
+
+    def test_render_time_does_not_grow_with_bars(self):
+        dates = pd.date_range('2020-01-01', periods=40_000, freq='h')
+        rng = np.random.default_rng(0)
+        close_2 = 100 + rng.standard_normal(len(dates)).cumsum() * 0.1
+        close_1 = 0.8 * close_2 + 20 + rng.standard_normal(len(dates)) * 0.2
+        panel = pd.DataFrame({'AAA': close_1, 'BBB': close_2}, index=dates)
+
+        def render_seconds(bars):
+            start_time = time.perf_counter()
+            render_pair_report('AAA', 'BBB', out_dir=self.out_dir, price_panel=panel.iloc[-bars:], max_points=500,
+                               dpi=50)
+            return time.perf_counter() - start_time
+
+        render_seconds(2_000)
+        # 20 times the bars, the metrics are the only part that grows
+        assert render_seconds(40_000) < 3 * render_seconds(2_000) + 0.5
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from analysis.price_cache import FileProvider, PriceCache, get_default_cache, set_default_cache
+from analysis.result_store import ResultStore, series_hashes, pair_hash
+from analysis.statistical_methods import collect_metrics_for_pair, clear_pair_metrics_memo, run_adf_on_best_pairs
+from analysis.stock_data import StockData
+from tests.test_stock_data import write_universe
+
+
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'results.sqlite')
+        self.store = ResultStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.root)
+
+    def test_bulk_lookup_and_hit_rate(self):
+        keys = [(f'A{n}', f'B{n}', 'hash') for n in range(10)]
+        self.store.put_many('coint', [(*key, n / 100) for n, key in enumerate(keys[:6])], {'trend': 'c'})
+        found = self.store.get_many('coint', keys, {'trend': 'c'})
+        assert found == {key: n / 100 for n, key in enumerate(keys[:6])}
+        # Different parameters are a different key
+        assert self.store.get_many('coint', keys, {'trend': 'ct'}) == {}
+        assert self.store.hits['coint'] == 6 and self.store.misses['coint'] == 14
+        assert self.store.hit_rate() == 6 / 20
+        assert 'coint 6/20' in self.store.summary()
+
+    def test_version_bump_invalidates_entries(self):
+        self.store.put('adf', 'A', 'B', 'hash', 0.01)
+        self.store.close()
+        self.store = ResultStore(self.path, versions={'adf': 2})
+        assert self.store.get('adf', 'A', 'B', 'hash') is None
+        self.store.put('adf', 'C', 'D', 'hash', 0.02)
+        assert self.store.purge_stale() == 1
+        assert len(self.store) == 1
+
+    def test_dataframe_roundtrip(self):
+        frame = pd.DataFrame({'spread': [0.5, -0.25], 'zscore': [1.0, np.nan]},
+                             index=pd.DatetimeIndex(['2024-01-02', '2024-01-03'], name='Date'))
+        self.store.put('pair_metrics', 'A', 'B', 'hash', frame)
+        pd.testing.assert_frame_equal(self.store.get('pair_metrics', 'A', 'B', 'hash'), frame)
+
+    def test_changed_prices_change_the_hash(self):
+        prices = pd.DataFrame({'A': [1.0, 2.0, 3.0], 'B': [2.0, 3.0, 4.0]},
+                              index=pd.bdate_range('2024-01-02', periods=3))
+        hashes = series_hashes(prices)
+        changed = prices.copy()
+        changed.iloc[-1, 0] = 3.5
+        changed_hashes = series_hashes(changed)
+        assert changed_hashes['B'] == hashes['B']
+        assert pair_hash(changed_hashes['A'], changed_hashes['B']) != pair_hash(hashes['A'], hashes['B'])
+        assert pair_hash(hashes['A'], hashes['B']) != pair_hash(hashes['B'], hashes['A'])
+        assert series_hashes(prices.iloc[1:])['B'] != hashes['B']
+
+
+class TestScreeningReusesResults(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        warnings.filterwarnings("ignore")
+        cls.data_dir = tempfile.mkdtemp()
+        cls.cache_dir = tempfile.mkdtemp()
+        cls.tickers = write_universe(cls.data_dir)
+        cls.previous_cache = get_default_cache()
+        set_default_cache(PriceCache(cls.cache_dir, provider=FileProvider(cls.data_dir)))
+
+    @classmethod
+    def tearDownClass(cls):
+        set_default_cache(cls.previous_cache)
+        shutil.rmtree(cls.data_dir)
+        shutil.rmtree(cls.cache_dir)
+
+    def setUp(self):
+        self.store = ResultStore(os.path.join(self.cache_dir, 'results.sqlite'))
+
+    def tearDown(self):
+        self.store.close()
+        os.remove(self.store.path)
+
+    def test_second_screen_is_answered_from_the_store(self):
+        first = StockData(self.tickers, bypass_adf_test=False, coint_engine='batch', corr_thresh=0.5,
+                          adf_p_thresh=0.5, result_store=self.store)
+        assert self.store.hit_rate() == 0
+        stored = len(self.store)
+        second = StockData(self.tickers, bypass_adf_test=False, coint_engine='batch', corr_thresh=0.5,
+                           adf_p_thresh=0.5, result_store=self.store)
+        assert len(self.store) == stored
+        assert self.store.hits['coint'] == self.store.misses['coint'] > 0
+        assert self.store.hits['adf'] == self.store.misses['adf'] > 0
+        pd.testing.assert_frame_equal(first.adf_tested_df, second.adf_tested_df)
+
+    def test_adf_and_metrics_match_the_uncached_results(self):
+        stock_data = StockData(self.tickers, bypass_adf_test=True, coint_engine='batch', corr_thresh=0.5)
+        pairs = stock_data.co_int_correlation_combined_df
+        expected = run_adf_on_best_pairs(pairs, price_panel=stock_data.price_panel, p_value_thresh=0.5)
+        for _ in range(2):
+            clear_pair_metrics_memo()
+            assert run_adf_on_best_pairs(pairs, price_panel=stock_data.price_panel, p_value_thresh=0.5,
+                                         result_store=self.store) == expected
+        assert self.store.hit_rate('adf') == 0.5
+
+        stock_1, stock_2 = stock_data.most_suitable_pair
+        clear_pair_metrics_memo()
+        metrics = collect_metrics_for_pair(stock_1, stock_2, price_panel=stock_data.price_panel,
+                                           result_store=self.store)
+        clear_pair_metrics_memo()
+        stored = collect_metrics_for_pair(stock_1, stock_2, price_panel=stock_data.price_panel,
+                                          result_store=self.store)
+        pd.testing.assert_frame_equal(stored, metrics, check_index_type=False)
+        assert self.store.hits['pair_metrics'] == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
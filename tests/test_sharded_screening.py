@@ -0,0 +1,85 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from analysis.cointegration import all_pairs, batch_coint_pvalues
+from analysis.sharded_screening import ShardQueue, sharded_coint_pvalues
+from tests.helpers import make_universe, stock_data_for
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'analysis',
+                      'sharded_screening.py')
+
+
+class TestShardedScreening(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        warnings.filterwarnings("ignore")
+        cls.prices = make_universe(n_tickers=16, n_days=250, seed=5)
+        cls.pairs = all_pairs(len(cls.prices.columns))
+        cls.expected = batch_coint_pvalues(cls.prices, cls.pairs)
+
+    def setUp(self):
+        self.queue_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.queue_dir)
+
+    def test_worker_processes_share_the_queue(self):
+        queue = ShardQueue.create(self.queue_dir, self.prices, shard_size=10, checkpoint_every=4)
+        workers = [subprocess.Popen([sys.executable, SCRIPT, 'worker', self.queue_dir, '--worker-id', f'w{n}',
+                                     '--poll', '0.2'], stdout=subprocess.PIPE, text=True) for n in range(3)]
+        reports = [json.loads(worker.communicate(timeout=300)[0].strip().splitlines()[-1]) for worker in workers]
+
+        ran = sorted(shard for report in reports for shard in report['shards'])
+        assert ran == list(range(queue.job['n_shards']))
+        assert queue.status() == {'shards': 12, 'done': 12, 'claimed': 0, 'pending': 0}
+        np.testing.assert_allclose(queue.p_values(), self.expected, atol=1e-5)
+        expected = stock_data_for('batch').find_cointegrated_pairs(self.prices, p_value_thresh=0.05)
+        pd.testing.assert_frame_equal(queue.reduce(0.05), expected)
+
+    def test_crashed_worker_is_resumed_from_its_checkpoint(self):
+        queue = ShardQueue.create(self.queue_dir, self.prices, shard_size=10, checkpoint_every=4)
+        # A worker claimed shard 1, checkpointed its first chunk and died
+        assert queue.claim(1, 'crashed', lease_seconds=60)
+        np.save(os.path.join(self.queue_dir, 'checkpoints', '000001.npy'), np.array(self.expected[10:14]))
+        assert not queue.claim(1, 'other', lease_seconds=60)
+        expired = time.time() - 120
+        os.utime(os.path.join(self.queue_dir, 'locks', '000001.lock'), (expired, expired))
+
+        report = queue.work('survivor', lease_seconds=60, poll_seconds=0.1)
+        assert report['resumed_pairs'] == 4
+        assert sorted(report['shards']) == list(range(12))
+        assert os.listdir(os.path.join(self.queue_dir, 'locks')) == []
+        assert os.listdir(os.path.join(self.queue_dir, 'checkpoints')) == []
+        np.testing.assert_allclose(queue.p_values(), self.expected, atol=1e-5)
+
+    def test_requeueing_the_same_job_keeps_progress(self):
+        queue = ShardQueue.create(self.queue_dir, self.prices, shard_size=40)
+        queue.work('first', max_shards=1)
+        with self.assertRaises(RuntimeError):
+            queue.reduce(0.05)
+        assert ShardQueue.create(self.queue_dir, self.prices, shard_size=40).status()['done'] == 1
+        # Different prices are a different job
+        assert ShardQueue.create(self.queue_dir, self.prices * 2, shard_size=40).status()['done'] == 0
+
+    def test_sharded_engine_matches_batch(self):
+        pairs = self.pairs[::3]
+        p_values = sharded_coint_pvalues(self.prices, pairs, queue_dir=self.queue_dir, n_workers=2, shard_size=7,
+                                         checkpoint_every=3)
+        np.testing.assert_allclose(p_values, batch_coint_pvalues(self.prices, pairs), atol=1e-5)
+        sharded = stock_data_for('sharded').find_cointegrated_pairs(self.prices, p_value_thresh=0.05)
+        assert list(sharded.index) == list(stock_data_for('batch').find_cointegrated_pairs(
+            self.prices, p_value_thresh=0.05).index)
+
+
+if __name__ == '__main__':
+    unittest.main()
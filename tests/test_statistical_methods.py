@@ -0,0 +1,126 @@
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+from statsmodels.regression.rolling import RollingOLS
+from statsmodels.tsa.stattools import adfuller
+
+from analysis.cointegration import batch_adf_pvalues
+from analysis.statistical_methods import rolling_beta, pair_returns, PairState
+from analysis.statistical_methods import collect_metrics_for_pair, clear_pair_metrics_memo, pair_spreads
+from analysis.statistical_methods import run_adf_on_best_pairs
+from benchmarks.synthetic_universe import synthetic_universe
+
+
+class TestRollingBeta(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        warnings.filterwarnings("ignore")
+        rng = np.random.default_rng(2)
+        cls.x = rng.standard_normal((400, 5)) * 0.02
+        cls.y = cls.x * np.array([0.5, 1.0, -0.3, 2.0, 0.0]) + rng.standard_normal((400, 5)) * 0.01
+        cls.x[0] = np.nan
+        cls.y[0] = np.nan
+
+    def rolling_ols(self, column, window):
+        return RollingOLS(self.y[:, column], self.x[:, column], window=window).fit().params[:, 0]
+
+    def test_matches_rolling_ols(self):
+        for window in [5, 60, 180]:
+            np.testing.assert_allclose(rolling_beta(self.y[:, 1], self.x[:, 1], window),
+                                       self.rolling_ols(1, window), rtol=1e-9, atol=1e-12)
+
+    def test_batch_matches_single_pairs(self):
+        batch = rolling_beta(self.y, self.x, 60)
+        assert batch.shape == self.y.shape
+        for column in range(self.y.shape[1]):
+            np.testing.assert_allclose(batch[:, column], self.rolling_ols(column, 60), rtol=1e-9, atol=1e-12)
+
+    def test_gap_inside_window_is_skipped(self):
+        x, y = self.x[:, 2].copy(), self.y[:, 2].copy()
+        x[150] = np.nan
+        expected = RollingOLS(y, x, window=60).fit().params[:, 0]
+        np.testing.assert_allclose(rolling_beta(y, x, 60), expected, rtol=1e-9, atol=1e-12)
+
+
+class TestPairState(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(6)
+        common = 100 + rng.standard_normal(400).cumsum()
+        cls.prices = pd.DataFrame({'AAA': common + rng.standard_normal(400),
+                                   'BBB': 0.6 * common + 50 + rng.standard_normal(400)})
+        # The batch computation of collect_metrics_for_pair, before it drops the warm up rows
+        batch = pair_returns('AAA', 'BBB', cls.prices)
+        batch['hedge_ratio'] = rolling_beta(batch['BBB_return'], batch['AAA_return'], 60)
+        batch['spread'] = batch['AAA'] - batch['BBB'] * batch['hedge_ratio']
+        batch['roll_corr'] = batch['AAA'].rolling(180).corr(batch['BBB'])
+        batch['z_score'] = ((batch['spread'] - batch['spread'].rolling(50).mean()) /
+                            batch['spread'].rolling(50).std())
+        cls.batch = batch
+
+    def test_updates_match_batch(self):
+        pair_state = PairState()
+        updates = pd.DataFrame([pair_state.update(price_1, price_2)
+                                for price_1, price_2 in zip(self.prices['AAA'], self.prices['BBB'])])
+        for column in ['hedge_ratio', 'spread', 'z_score', 'roll_corr']:
+            np.testing.assert_allclose(updates[column], self.batch[column], rtol=1e-9, atol=1e-9,
+                                       err_msg=column)
+
+    def test_seeded_state_continues_like_batch(self):
+        pair_state = PairState.from_history(self.prices['AAA'][:300], self.prices['BBB'][:300])
+        metrics = pair_state.update(self.prices['AAA'].iloc[300], self.prices['BBB'].iloc[300])
+        self.assertAlmostEqual(metrics['z_score'], self.batch['z_score'].iloc[300], places=9)
+        self.assertAlmostEqual(metrics['roll_corr'], self.batch['roll_corr'].iloc[300], places=9)
+        assert metrics['signal'] == (1 if metrics['z_score'] < -1 else -1 if metrics['z_score'] > 1 else 0)
+
+
+class TestBatchedAdf(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        warnings.filterwarnings("ignore")
+        bars, _ = synthetic_universe(12, n_pairs=3, seed=9)
+        cls.panel = bars[['Adj Close', 'Open']].copy()
+        # A gap in one ticker gives its pairs their own NaN mask and length
+        cls.panel.iloc[300:305, cls.panel.columns.get_loc(('Adj Close', 'SYN00004'))] = np.nan
+        tickers = list(cls.panel['Adj Close'].columns)
+        cls.pairs = pd.DataFrame([(tickers[i], tickers[j]) for i in range(12) for j in range(i + 1, 12)],
+                                 columns=['Stock_1', 'Stock_2'])
+
+    def test_spreads_match_collect_metrics(self):
+        clear_pair_metrics_memo()
+        spreads, errors = pair_spreads(list(zip(self.pairs['Stock_1'], self.pairs['Stock_2'])), self.panel)
+        assert errors == {}
+        for n in [0, 3, 20, 45]:
+            expected = collect_metrics_for_pair(self.pairs['Stock_1'][n], self.pairs['Stock_2'][n],
+                                                price_panel=self.panel)['spread']
+            np.testing.assert_allclose(spreads[n].dropna().to_numpy(), expected.to_numpy(), rtol=1e-10)
+            assert (spreads[n].dropna().index == expected.index).all()
+
+    def test_batch_matches_adfuller_on_each_pair(self):
+        clear_pair_metrics_memo()
+        expected = [adfuller(collect_metrics_for_pair(stock_1, stock_2, price_panel=self.panel)['spread'])[1] <= 0.05
+                    for stock_1, stock_2 in zip(self.pairs['Stock_1'], self.pairs['Stock_2'])]
+        assert run_adf_on_best_pairs(self.pairs, price_panel=self.panel) == expected
+
+    def test_failures_are_reported_per_pair(self):
+        x = np.random.default_rng(0).standard_normal((200, 4)).cumsum(axis=0)
+        x[:, 1] = 5.0
+        x[:150, 2] = np.nan
+        x[:197, 3] = np.nan
+        p_values, errors = batch_adf_pvalues(x)
+        self.assertAlmostEqual(p_values[0], adfuller(x[:, 0])[1], places=10)
+        self.assertAlmostEqual(p_values[2], adfuller(x[150:, 2])[1], places=10)
+        assert sorted(errors) == [1, 3] and np.isnan(p_values[[1, 3]]).all()
+
+        pairs = pd.concat([self.pairs.iloc[:2], pd.DataFrame({'Stock_1': ['NOPE'], 'Stock_2': ['SYN00001']})],
+                          ignore_index=True)
+        with self.assertLogs(level='WARNING') as logs:
+            results = run_adf_on_best_pairs(pairs, price_panel=self.panel)
+        assert len(results) == 3 and results[2] is False
+        assert 'NOPE - SYN00001' in logs.output[0]
+
+
+if __name__ == '__main__':
+    unittest.main()
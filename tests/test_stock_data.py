@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from analysis.DATES import Dates
+from analysis.price_cache import FileProvider, PriceCache, get_default_cache, set_default_cache
+from analysis.screening import ScreeningReport
+from analysis.stock_data import StockData
+
+
+def write_universe(root, n_tickers=10, seed=5) -> list:
+    """ Writes CSV bars covering the Dates window where every other ticker tracks the one before it. """
+    dates = pd.bdate_range(Dates.START_DATE.value.normalize() - pd.DateOffset(days=10), Dates.END_DATE.value,
+                           name='Date')
+    rng = np.random.default_rng(seed)
+    tickers, close = [], None
+    for n in range(n_tickers):
+        if n % 2 == 0:
+            close = 100 + rng.standard_normal(len(dates)).cumsum()
+        else:
+            close = 0.9 * close + 15 + rng.standard_normal(len(dates)) * 0.5
+        bars = pd.DataFrame({'Open': close * (1 + rng.standard_normal(len(dates)) * 0.002), 'High': close + 1,
+                             'Low': close - 1, 'Close': close, 'Adj Close': close, 'Volume': 1000}, index=dates)
+        bars.to_csv(os.path.join(root, f'T{n}.csv'))
+        tickers.append(f'T{n}')
+    return tickers
+
+
+class TestStagedScreening(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        warnings.filterwarnings("ignore")
+        cls.data_dir = tempfile.mkdtemp()
+        cls.cache_dir = tempfile.mkdtemp()
+        cls.tickers = write_universe(cls.data_dir)
+        cls.previous_cache = get_default_cache()
+        set_default_cache(PriceCache(cls.cache_dir, provider=FileProvider(cls.data_dir)))
+        cls.stock_data = StockData(cls.tickers, bypass_adf_test=True, coint_engine='batch', corr_thresh=0.5)
+
+    @classmethod
+    def tearDownClass(cls):
+        set_default_cache(cls.previous_cache)
+        shutil.rmtree(cls.data_dir)
+        shutil.rmtree(cls.cache_dir)
+
+    def test_report_has_every_stage(self):
+        report = self.stock_data.screening_report.to_df()
+        assert list(report['stage']) == ['correlation', 'cointegration', 'ranking']
+        assert report['candidates'].iloc[0] == len(self.tickers) * (len(self.tickers) - 1) // 2
+        # Each stage only sees the survivors of the stage before it
+        assert (report['candidates'].iloc[1:].values == report['survivors'].iloc[:-1].values).all()
+
+    def test_pruned_screen_matches_full_screen(self):
+        full_coint = self.stock_data.find_cointegrated_pairs(self.stock_data.price_history_df, p_value_thresh=0.05)
+        full = self.stock_data.highest_corr_pairs_df.merge(full_coint, left_on='lookup', right_on=full_coint.index)
+        full = StockData.rank_pairs(full)
+        pd.testing.assert_frame_equal(full.reset_index(drop=True),
+                                      self.stock_data.adf_tested_df.reset_index(drop=True))
+
+    def test_most_suitable_pair_is_planted(self):
+        stock_1, stock_2 = self.stock_data.most_suitable_pair
+        assert abs(int(stock_1[1:]) - int(stock_2[1:])) == 1
+
+
+class TestScreeningReport(unittest.TestCase):
+
+    def test_peak_memory_is_recorded_while_tracing(self):
+        report = ScreeningReport()
+        with report.stage('untraced', candidates=1) as stage:
+            stage['survivors'] = 1
+        assert 'peak_mb' not in report.to_df().columns
+        tracemalloc.start()
+        try:
+            with report.stage('traced', candidates=1) as stage:
+                block = np.ones(2 ** 20)
+                del block
+                stage['survivors'] = 1
+        finally:
+            tracemalloc.stop()
+        assert report.to_df()['peak_mb'].iloc[1] >= 8
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from analysis.walk_forward import WalkForwardScreener
+from benchmarks.synthetic_universe import synthetic_universe
+
+
+class TestWalkForwardScreener(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        warnings.filterwarnings("ignore")
+        bars, cls.planted_pairs = synthetic_universe(60, n_pairs=4, seed=7)
+        cls.panel = bars[['Adj Close', 'Open']]
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.full_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+        shutil.rmtree(self.full_dir)
+
+    def walk(self, screener, n_updates):
+        with contextlib.redirect_stdout(io.StringIO()):
+            screener.initialise(self.panel.iloc[:-n_updates])
+            for n in range(n_updates, 0, -1):
+                ranked = screener.update(self.panel.iloc[len(self.panel) - n:len(self.panel) - n + 1])
+        return ranked
+
+    def test_updates_reuse_results_and_match_a_full_screen(self):
+        screener = WalkForwardScreener(self.state_dir, corr_thresh=0.5, adf_p_thresh=None)
+        ranked = self.walk(screener, 3)
+        full = WalkForwardScreener(self.full_dir, corr_thresh=0.5, adf_p_thresh=None)
+        with contextlib.redirect_stdout(io.StringIO()):
+            full_ranked = full.initialise(self.panel)
+
+        np.testing.assert_allclose(screener.correlations(), full.correlations(), atol=1e-10)
+        assert screener.last_update['coint_retested'] < screener.last_update['candidates'] / 2
+        assert screener.last_update['coint_reused'] > 0
+        # Planted pairs are far from the threshold, only marginal pairs can differ from the full screen
+        found, full_found = set(zip(ranked['Stock_1'], ranked['Stock_2'])), set(zip(full_ranked['Stock_1'],
+                                                                                   full_ranked['Stock_2']))
+        assert set(self.planted_pairs) <= found & full_found
+        for pair in found ^ full_found:
+            assert abs(full.results[pair]['coint_p'] - 0.05) < 0.1
+
+    def test_state_is_persisted(self):
+        screener = WalkForwardScreener(self.state_dir, corr_thresh=0.5)
+        ranked = self.walk(screener, 2)
+        reloaded = WalkForwardScreener(self.state_dir, corr_thresh=0.5)
+        assert reloaded.config['updates'] == 2
+        assert reloaded.results == screener.results
+        assert reloaded.ranked_pairs.equals(ranked)
+        np.testing.assert_array_equal(reloaded.cross_products, screener.cross_products)
+        assert list(ranked.columns) == ['Stock_1', 'Stock_2', 'Correlation', 'Cointegration', 'adf_p']
+
+    def test_crashed_save_keeps_the_previous_state(self):
+        screener = WalkForwardScreener(self.state_dir, corr_thresh=0.5)
+        self.walk(screener, 2)
+        saved = WalkForwardScreener(self.state_dir, corr_thresh=0.5)
+        to_parquet = pd.DataFrame.to_parquet
+        calls = []
+
+        def crash_after_the_window(frame, *args, **kwargs):
+            calls.append(frame)
+            if len(calls) > 1:
+                raise OSError('disk full')
+            return to_parquet(frame, *args, **kwargs)
+
+        # The window and sums of the next update are written, the results are not
+        with mock.patch.object(pd.DataFrame, 'to_parquet', crash_after_the_window), self.assertRaises(OSError):
+            with contextlib.redirect_stdout(io.StringIO()):
+                screener.update(self.panel.iloc[-1:])
+        reloaded = WalkForwardScreener(self.state_dir, corr_thresh=0.5)
+        assert reloaded.config['updates'] == 2
+        pd.testing.assert_frame_equal(reloaded.window_panel, saved.window_panel)
+        np.testing.assert_array_equal(reloaded.cross_products, saved.cross_products)
+        assert reloaded.results == saved.results
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            reloaded.update(self.panel.iloc[-1:])
+        assert len([name for name in os.listdir(self.state_dir) if name.startswith('state-')]) == 1
+
+    def test_new_bars_must_hold_the_same_tickers(self):
+        screener = WalkForwardScreener(self.state_dir, corr_thresh=0.5, adf_p_thresh=None)
+        with contextlib.redirect_stdout(io.StringIO()):
+            screener.initialise(self.panel.iloc[:-1])
+        with self.assertRaises(ValueError):
+            screener.update(self.panel.iloc[-1:].drop(columns='SYN00003', level=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
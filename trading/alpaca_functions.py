@@ -1,7 +1,10 @@
+import asyncio
+import json
 import os
 import sys
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from utils.formatting_and_logs import green_bold_print, red_bold_print
 
@@ -13,16 +16,25 @@ root_dir = os.path.dirname(current_dir)
 sys.path.append(root_dir)
 
 import pandas as pd
-from alpaca.trading import OrderSide, TimeInForce, PositionSide, Position
+from alpaca.trading import OrderSide, OrderStatus, TimeInForce, PositionSide, Position
 from alpaca.trading.client import TradingClient
 from alpaca.trading.requests import MarketOrderRequest, LimitOrderRequest
 from alpaca.trading.stream import TradingStream
 
+from trading.position_monitor import TpSlMonitor
+from trading.order_scheduler import OrderScheduler
+
 os.environ['APCA_API_BASE_URL'] = 'https://paper-api.alpaca.markets'
 
 # Configure the logging; you can adjust the level and format as needed
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Order statuses after which an order will not fill any further
+FINAL_ORDER_STATUSES = {OrderStatus.FILLED, OrderStatus.CANCELED, OrderStatus.EXPIRED, OrderStatus.REJECTED,
+                        OrderStatus.REPLACED, OrderStatus.DONE_FOR_DAY}
+# Order statuses of a leg that did not go through
+FAILED_ORDER_STATUSES = {OrderStatus.CANCELED, OrderStatus.EXPIRED, OrderStatus.REJECTED}
+
 
 def connect_to_trading_stream():
     """
@@ -35,6 +47,14 @@ def connect_to_trading_stream():
         logging.error(e)
 
 
+def api_error_code(error: Exception):
+    """ The Alpaca error code of an exception, e.g. 40310000, or its message if it has none. """
+    try:
+        return json.loads(str(error))['code']
+    except (ValueError, KeyError, TypeError):
+        return str(error)
+
+
 def pause_algo(seconds):
     for remaining in range(seconds, 0, -1):
         sys.stdout.write("\r" + "Paused Algorithm: {:2d} seconds remaining.".format(remaining))
@@ -48,19 +68,62 @@ class Alpaca:
     retrieving and displaying position data, profit calculation, and order management.
     """
 
-    def __init__(self):
+    def __init__(self, client: TradingClient = None, positions_ttl: float = 2.0):
         """
         Constructor for Alpaca class.
-        Initializes connection to Alpaca API, retrieves current positions,
-        and sets up trading stream.
+        Initializes connection to Alpaca API and retrieves the account. Positions are only fetched when
+        first read, see get_all_positions.
+
+        Args:
+        client (TradingClient): Optional client to use instead of connecting with the paper account credentials,
+            e.g. a local fake for tests.
+        positions_ttl (float): Seconds a positions snapshot is served before it is fetched again.
         """
         self.connected = False
-        self.client = self.connect_to_alpaca("PKNWSWFGL7X6F50PJ8UH", "1qpcAmhEmzxONh3Im0V6lzgqtVOX2xD3k7mViYLX",
-                                             paper=True)
-        self.in_position = bool(self.client.get_all_positions())
-        self.positions = self.client.get_all_positions()
+        self.positions_ttl = positions_ttl
+        self._positions = None
+        self._positions_fetched_at = None
+        self._order_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='alpaca-orders')
+        if client is not None:
+            self.client = client
+            self.account = client.get_account()
+            self.connected = True
+        else:
+            self.client = self.connect_to_alpaca("PKNWSWFGL7X6F50PJ8UH", "1qpcAmhEmzxONh3Im0V6lzgqtVOX2xD3k7mViYLX",
+                                                 paper=True)
         self.balance = self.account.buying_power
 
+    def get_all_positions(self, refresh: bool = False) -> list:
+        """
+        Returns the positions snapshot, fetching it from the API only when it is older than positions_ttl,
+        has been invalidated by an order, or refresh is set. Every position reader goes through here so one
+        fetch serves all of them.
+
+        Args:
+        refresh (bool): Fetch a new snapshot regardless of its age.
+
+        Returns:
+        list: Position objects as returned by TradingClient.get_all_positions.
+        """
+        now = time.monotonic()
+        if (refresh or self._positions is None or self._positions_fetched_at is None
+                or now - self._positions_fetched_at >= self.positions_ttl):
+            self._positions = self.client.get_all_positions()
+            self._positions_fetched_at = time.monotonic()
+        return self._positions
+
+    @property
+    def positions(self) -> list:
+        return self.get_all_positions()
+
+    @property
+    def in_position(self) -> bool:
+        return bool(self.get_all_positions())
+
+    def invalidate_positions(self):
+        """ Marks the positions snapshot stale, called after every order so the next read sees its effect. """
+        self._positions_fetched_at = None
+
     def connect_to_alpaca(self, api_key: str, api_secret: str, paper: bool) -> TradingClient:
         """
         Establishes a connection to the Alpaca trading service using API credentials.
@@ -103,6 +166,7 @@ class Alpaca:
                     side=side,
                     time_in_force=TimeInForce.DAY
                 ))
+            self.invalidate_positions()
             green_bold_print("{} market order executed for {} shares of {}".format(side, qty, symbol))
         except Exception as e:
             print(e)
@@ -132,15 +196,22 @@ class Alpaca:
                     stop_loss=kwargs.get('stop_loss', None),
                     time_in_force=TimeInForce.DAY
                 ))
+            self.invalidate_positions()
             logging.info("Limit order placed for {} shares of {} at {}".format(qty, symbol, limit_price))
 
         except Exception as e:
             red_bold_print(e)
 
-    def enter_hedge_position(self, stock_1, stock_2, side, leverage, hr):
+    def enter_hedge_position(self, stock_1, stock_2, side, leverage, hr, fill_timeout: float = 5.0) -> dict:
         """
         Enters a hedge position by placing market orders on two stocks.
         A hedge position involves buying one stock and selling another.
+        Both legs are submitted at the same time from the order thread pool, so the position is never left
+        unhedged for a full round trip, and their fills are then awaited together. If one leg is rejected, on
+        submission or afterwards (e.g. 40310000, a short sell while a long buy order is open), the other leg is
+        cancelled, or flattened with an opposite market order if it has already filled. Broker errors once the
+        orders are live never escape: a leg whose fill could not be polled keeps its last status with the error
+        recorded, and a leg that could not be compensated is reported with its 'compensation_error'.
 
         Args:
         stock_1 (str): Symbol of the first stock.
@@ -148,6 +219,11 @@ class Alpaca:
         side (str): 'buy' or 'sell', indicating the direction of the hedge.
         leverage (float): Leverage factor to apply to the order quantity.
         hr (float): Hedge ratio to calculate the quantity of the second stock.
+        fill_timeout (float): Seconds to wait for both legs to fill, 0 returns once both are acknowledged.
+
+        Returns:
+        dict: 'status' ('filled', 'acknowledged', 'compensated' or 'compensation_failed') and 'legs', one dict per
+            leg with its order, status, error code, 'ack_latency' and 'fill_latency' in seconds.
         """
         stock_2_side = None
         if side == "buy":
@@ -155,16 +231,173 @@ class Alpaca:
         elif side == "sell":
             stock_2_side = OrderSide.BUY
 
-        try:
-            self.send_market_order(stock_1, leverage, side)
-            self.send_market_order(stock_2, round(hr * leverage, 2), stock_2_side)
+        legs = [{'symbol': stock_1.upper(), 'qty': leverage, 'side': OrderSide(side)},
+                {'symbol': stock_2.upper(), 'qty': round(hr * leverage, 2), 'side': stock_2_side}]
+        list(self._order_executor.map(self._submit_leg, legs))
+        self.invalidate_positions()
+        if all(leg['order'] is not None for leg in legs) and fill_timeout > 0:
+            list(self._order_executor.map(lambda leg: self._wait_for_fill(leg, fill_timeout), legs))
+
+        for leg in legs:
+            logging.info("{} {} {}: {}, acknowledged in {} ms{}".format(
+                leg['side'].value, leg['qty'], leg['symbol'], leg['status'], round(leg['ack_latency'] * 1000, 1),
+                '' if leg['fill_latency'] is None else f", filled in {round(leg['fill_latency'] * 1000, 1)} ms"))
+
+        failed = [leg for leg in legs if leg['status'] in FAILED_ORDER_STATUSES]
+        if failed:
+            for leg in failed:
+                red_bold_print(f"{leg['symbol']} leg failed: {leg['error'] or leg['status']}")
+            compensated = [self._compensate_leg(leg) for leg in legs if leg not in failed]
+            self.invalidate_positions()
+            return {'status': 'compensated' if all(compensated) else 'compensation_failed', 'legs': legs}
+
+        if all(leg['status'] == OrderStatus.FILLED for leg in legs):
             red_bold_print("Hedge position filled!")
+            return {'status': 'filled', 'legs': legs}
+        return {'status': 'acknowledged', 'legs': legs}
+
+    def _submit_leg(self, leg: dict) -> dict:
+        """ Submits one hedge leg as a market order, recording its order, status and acknowledgement latency. """
+        self._start_leg(leg)
+        try:
+            self._record_ack(leg, order=self.client.submit_order(order_data=self._leg_request(leg)))
         except Exception as e:
-            print(e)
+            self._record_ack(leg, error=e)
+        return leg
+
+    @staticmethod
+    def _leg_request(leg: dict) -> MarketOrderRequest:
+        return MarketOrderRequest(symbol=leg['symbol'], qty=leg['qty'], side=leg['side'],
+                                  time_in_force=TimeInForce.DAY)
+
+    @staticmethod
+    def _start_leg(leg: dict):
+        leg.update(order=None, status=None, error=None, fill_latency=None)
+        leg['submitted_at'] = time.perf_counter()
+
+    @staticmethod
+    def _record_ack(leg: dict, order=None, error: Exception = None, acknowledged_at: float = None):
+        leg['ack_latency'] = (acknowledged_at or time.perf_counter()) - leg['submitted_at']
+        if error is None:
+            leg['order'] = order
+            leg['status'] = OrderStatus(order.status)
+        else:
+            leg['status'] = OrderStatus.REJECTED
+            leg['error'] = api_error_code(error)
+
+    def _wait_for_fill(self, leg: dict, timeout: float, poll_interval: float = 0.05) -> dict:
+        """ Polls an acknowledged leg until it fills, fails or timeout seconds have passed. A failed poll stops
+        polling and is recorded as the leg's error, its status stays the last one seen. """
+        deadline = leg['submitted_at'] + timeout
+        while leg['status'] not in FINAL_ORDER_STATUSES and time.perf_counter() < deadline:
+            time.sleep(poll_interval)
+            try:
+                leg['order'] = self.client.get_order_by_id(leg['order'].id)
+            except Exception as e:
+                logging.error(f"Could not poll the {leg['symbol']} leg: {e}")
+                leg['error'] = api_error_code(e)
+                break
+            leg['status'] = OrderStatus(leg['order'].status)
+        if leg['status'] == OrderStatus.FILLED:
+            leg['fill_latency'] = time.perf_counter() - leg['submitted_at']
+        return leg
+
+    def _compensate_leg(self, leg: dict) -> bool:
+        """
+        Undoes a hedge leg whose other leg failed: cancels what is still working and closes what has filled.
+
+        Returns:
+        bool: Whether the leg was undone, if not its 'compensation_error' holds the error and its position is left
+            for the caller to close.
+        """
+        order = leg['order']
+        if order is None:
+            return True
+        try:
+            if leg['status'] not in FINAL_ORDER_STATUSES:
+                try:
+                    self.client.cancel_order_by_id(order.id)
+                except Exception as e:
+                    logging.error(e)
+                order = self.client.get_order_by_id(order.id)
+            filled_qty = float(order.filled_qty or 0)
+            if filled_qty > 0:
+                opposite = OrderSide.SELL if leg['side'] == OrderSide.BUY else OrderSide.BUY
+                self.client.submit_order(order_data=MarketOrderRequest(
+                    symbol=leg['symbol'], qty=filled_qty, side=opposite, time_in_force=TimeInForce.DAY))
+        except Exception as e:
+            logging.error(f"Could not compensate the {leg['symbol']} leg: {e}")
+            leg['compensation_error'] = api_error_code(e)
+            red_bold_print(f"Compensating {leg['symbol']} leg failed, its position must be closed by hand")
+            return False
+        leg['status'] = 'compensated'
+        red_bold_print(f"Compensated {leg['symbol']} leg, {filled_qty} filled shares closed")
+        return True
+
+    def enter_basket(self, pairs: list, leverage: float, side: str = "buy", scheduler: OrderScheduler = None) -> list:
+        """
+        Enters a hedge position in every pair of a basket, e.g. the top ranked pairs of StockData.adf_tested_df.
+        All legs go through an OrderScheduler, which keeps within the broker's rate limit and retries transient
+        failures, with the pairs prioritised in the order given and both legs of a pair queued back to back.
+        Fills are not awaited, a pair with a rejected leg has its other leg compensated as in
+        enter_hedge_position.
+
+        Args:
+        pairs (list): (stock_1, stock_2, hedge ratio) of each pair, best first.
+        leverage (float): Leverage factor applied to the quantity of every pair.
+        side (str): 'buy' or 'sell', the direction of every hedge.
+        scheduler (OrderScheduler): Scheduler to submit with, a default one is created and closed if None.
+
+        Returns:
+        list: One dict per pair, as returned by enter_hedge_position, with its 'pair'. A pair whose settling raised
+            has the status 'failed' and its 'error'.
+        """
+        stock_2_side = OrderSide.SELL if side == "buy" else OrderSide.BUY
+        own_scheduler = scheduler is None
+        if own_scheduler:
+            scheduler = OrderScheduler(self.client)
+        try:
+            baskets = []
+            for priority, (stock_1, stock_2, hr) in enumerate(pairs):
+                legs = [{'symbol': stock_1.upper(), 'qty': leverage, 'side': OrderSide(side)},
+                        {'symbol': stock_2.upper(), 'qty': round(hr * leverage, 2), 'side': stock_2_side}]
+                for leg in legs:
+                    self._start_leg(leg)
+                futures = scheduler.submit_batch([self._leg_request(leg) for leg in legs], priority=priority)
+                baskets.append({'pair': (stock_1, stock_2), 'legs': legs, 'futures': futures})
+
+            results = []
+            for basket in baskets:
+                legs, futures = basket['legs'], basket.pop('futures')
+                # A pair that cannot be settled is reported, the pairs after it are still acknowledged
+                try:
+                    for leg, future in zip(legs, futures):
+                        error = future.exception()
+                        self._record_ack(leg, order=None if error else future.result(), error=error,
+                                         acknowledged_at=future.completed_at)
+                    failed = [leg for leg in legs if leg['status'] in FAILED_ORDER_STATUSES]
+                    compensated = [self._compensate_leg(leg) for leg in legs if failed and leg not in failed]
+                    if not failed:
+                        basket['status'] = 'acknowledged'
+                    else:
+                        basket['status'] = 'compensated' if all(compensated) else 'compensation_failed'
+                except Exception as e:
+                    logging.error(f"Could not enter the {basket['pair'][0]}-{basket['pair'][1]} pair: {e}")
+                    basket['status'] = 'failed'
+                    basket['error'] = api_error_code(e)
+                results.append(basket)
+        finally:
+            if own_scheduler:
+                scheduler.close()
+            self.invalidate_positions()
+
+        entered = sum(basket['status'] == 'acknowledged' for basket in results)
+        green_bold_print(f"Entered {entered} of {len(results)} pairs")
+        return results
 
     def get_positions_dict(self):
         if self.in_position:
-            return self.client.get_all_positions()
+            return self.get_all_positions()
 
     def get_open_position_for_symbol(self, symbol_or_asset_id) -> Position:
         """
@@ -188,7 +421,9 @@ class Alpaca:
         Returns:
             The closed position for the symbol or asset ID.
         """
-        return self.client.close_position(symbol_or_asset_id=symbol_or_asset_id)
+        order = self.client.close_position(symbol_or_asset_id=symbol_or_asset_id)
+        self.invalidate_positions()
+        return order
 
     def get_positions_df(self):
         """
@@ -199,18 +434,15 @@ class Alpaca:
         Returns:
         pandas.DataFrame: DataFrame containing details of current positions.
         """
-        assets = pd.DataFrame()
-        if self.in_position:
-            for n in range(len(self.client.get_all_positions())):
-                pos = dict(self.client.get_all_positions()[n])
-                pos = pd.DataFrame.from_dict(pos, orient='index').T
-                assets = pd.concat([assets, pos])
-
-                # Changing columns from str to float type
-                columns_to_convert = ['unrealized_pl', 'cost_basis', 'market_value',
-                                      'avg_entry_price', 'qty', 'unrealized_plpc']
-                for column in columns_to_convert:
-                    assets[column] = assets[column].astype(float)
+        portfolio = self.get_all_positions()
+        if not portfolio:
+            return pd.DataFrame()
+        assets = pd.DataFrame([dict(position) for position in portfolio])
+
+        # Changing columns from str to float type
+        columns_to_convert = ['unrealized_pl', 'cost_basis', 'market_value',
+                              'avg_entry_price', 'qty', 'unrealized_plpc']
+        assets[columns_to_convert] = assets[columns_to_convert].astype(float)
         return assets
 
     def print_positions(self):
@@ -218,40 +450,42 @@ class Alpaca:
         Prints the details of the current positions held.
         Includes the side (Long/Short), quantity, purchase price, and unrealized profit percentage.
         """
-        portfolio = self.client.get_all_positions()
+        portfolio = self.get_all_positions()
         side_map = {PositionSide.SHORT: "Short", PositionSide.LONG: "Long"}
         print("Current Positions:")
         if portfolio:
+            profit_pc = self.get_unrealised_profit_pc()
             for position in portfolio:
                 print("{} {} shares of {} purchased for {} current unrealised profit_pc is {}%"
                       .format(side_map[position.side],
                               position.qty.replace("-", ""),
                               position.symbol,
                               abs(float(position.cost_basis)),
-                              self.get_unrealised_profit_pc()))
+                              profit_pc))
         else:
             print("No positions")
 
     def get_unrealised_profit_pc(self):
         """
-        Calculates the percentage of unrealized profit or loss across all positions.
+        Calculates the percentage of unrealized profit or loss across all positions,
+        relative to their gross cost basis so the legs of a hedge do not net each other out.
         Returns the percentage value rounded to three decimal places.
 
         Returns:
         float: The percentage of unrealized profit or loss.
         """
         try:
-            portfolio = self.client.get_all_positions()
-            profit = sum([position.unrealized_pl for position in portfolio])
-            cost_basis = sum([position.cost_basis for position in portfolio])
+            portfolio = self.get_all_positions()
+            profit = sum(float(position.unrealized_pl or 0) for position in portfolio)
+            cost_basis = sum(abs(float(position.cost_basis)) for position in portfolio)
 
             if cost_basis == 0:
                 return 0
 
             return round((profit * 100 / cost_basis), 3)
 
-        except Exception:
-            pass
+        except Exception as e:
+            logging.error(e)
 
     def check_and_take_profit(self, tp):
         """
@@ -292,6 +526,7 @@ class Alpaca:
         bool: True if all positions are closed successfully, False otherwise.
         """
         close_info = self.client.close_all_positions(cancel_orders=True)
+        self.invalidate_positions()
         for order in close_info:
             order = order.body
             side_map = {OrderSide.BUY: "buy", OrderSide.SELL: "sell"}
@@ -345,25 +580,24 @@ class Alpaca:
                 print(f"An error occurred: {e}")
                 break
 
-    def use_live_tp_sl(self, tp: int | float, sl: int | float):
+    def use_live_tp_sl(self, tp: int | float, sl: int | float, stream=None, poll_interval: float = 5.0):
         """
-        Continuously monitors the portfolio for take profit (tp)
-         or stop loss (sl) conditions.
-        Prints the current unrealized profit percentage and executes orders if conditions are met.
+        Monitors the portfolio for take profit (tp) or stop loss (sl) conditions until one is hit and the
+        positions are closed.
+        Trade updates from the trading stream are checked the moment they arrive, with the positions polled every
+        poll_interval seconds in between, see TpSlMonitor. Falls back to polling alone if the stream cannot connect.
 
         Args:
         tp (float): Take profit threshold percentage.
         sl (float): Stop loss threshold percentage.
+        stream: Trading stream to listen to, defaults to connect_to_trading_stream().
+
+        Returns:
+        str: 'take_profit' or 'stop_loss'.
         """
 
         self.print_positions()
-        count = 0
-        while True:
-            # Continue while the pause thread is running
-            output = f'{count} Current Profit: {self.get_unrealised_profit_pc()} %'
-            self.check_and_stop_loss(sl)
-            self.check_and_take_profit(tp)
-            sys.stdout.write("\r" + output)  # Overwrite the line with padding
-            time.sleep(5)
-            sys.stdout.flush()
-            count += 1
+        if stream is None:
+            stream = connect_to_trading_stream()
+        monitor = TpSlMonitor(self, tp, sl, stream=stream, poll_interval=poll_interval)
+        return asyncio.run(monitor.run())
@@ -0,0 +1,299 @@
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from alpaca.common.exceptions import APIError
+from alpaca.trading import (Order, Position, TradeAccount, TradeUpdate, MarketOrderRequest, OrderSide, OrderStatus,
+                            OrderType, OrderClass, PositionSide, TimeInForce, TradeEvent)
+from alpaca.trading.enums import AccountStatus, AssetClass, AssetExchange
+from alpaca.trading.models import ClosePositionResponse
+
+# Order statuses under which an order can still fill
+OPEN_ORDER_STATUSES = {OrderStatus.NEW, OrderStatus.ACCEPTED, OrderStatus.PARTIALLY_FILLED}
+
+
+def api_error(code: int, message: str, status_code: int) -> APIError:
+    """ An APIError as raised by alpaca-py for the given Alpaca error code and HTTP status. """
+    response = type('Response', (), {'status_code': status_code})()
+    return APIError(json.dumps({'code': code, 'message': message}),
+                    http_error=type('HTTPError', (), {'response': response, 'request': None})())
+
+
+class FakeTradingStream:
+    """
+    In-process stand-in for alpaca's TradingStream, fed trade updates by a FakeTradingClient.
+    Updates published before _run_forever starts, or after stop_ws, are buffered and delivered on the next run.
+    """
+
+    def __init__(self):
+        self.handler = None
+        self.delivered = 0
+        self._loop = None
+        self._queue = None
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def subscribe_trade_updates(self, handler):
+        self.handler = handler
+
+    def publish(self, trade_update: TradeUpdate):
+        """ Queues a trade update for the handler, safe to call from any thread. """
+        with self._lock:
+            if self._loop is not None:
+                try:
+                    self._loop.call_soon_threadsafe(self._queue.put_nowait, trade_update)
+                    return
+                except RuntimeError:
+                    # The loop was closed without stop_ws
+                    self._loop = None
+            self._pending.append(trade_update)
+
+    async def _run_forever(self):
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._queue = asyncio.Queue()
+            for trade_update in self._pending:
+                self._queue.put_nowait(trade_update)
+            self._pending = []
+        while True:
+            trade_update = await self._queue.get()
+            self.delivered += 1
+            if self.handler is not None:
+                await self.handler(trade_update)
+
+    def run(self):
+        asyncio.run(self._run_forever())
+
+    async def stop_ws(self):
+        with self._lock:
+            self._loop = None
+
+
+class FakeTradingClient:
+    """
+    In-process stand-in for alpaca's TradingClient covering the account, position and order endpoints used by
+    trading.alpaca_functions, for offline tests and benchmarks of the order path.
+    Every request sleeps latency seconds, plus up to jitter more, like a REST round trip. Market orders fill at the
+    symbol's price set with set_price, straight away or fill_delay seconds after they are accepted, and limit
+    orders fill when marketable. Fills update the positions and are published as trade updates to every stream
+    from stream(). Orders for a symbol in reject fail with its Alpaca error code, and the first
+    transient_failures orders fail with HTTP 429 so retry logic can be exercised. The first lost_responses orders
+    are accepted but the request then fails with HTTP 503, as when the response is lost on the way back. Like
+    Alpaca, an order reusing the client_order_id of an earlier order is rejected with HTTP 422.
+
+    Args:
+    latency (float): Seconds every request takes.
+    fill_delay (float): Seconds from acceptance to fill, 0 fills market orders before submit_order returns.
+    prices (dict): Symbol -> price, other symbols trade at default_price.
+    reject (dict): Symbol -> Alpaca error code its orders are rejected with, e.g. 40310000.
+    transient_failures (int): Orders rejected with 429 before any is accepted.
+    lost_responses (int): Orders accepted whose request still fails with 503.
+    """
+
+    def __init__(self, latency: float = 0.0, fill_delay: float = 0.0, jitter: float = 0.0, prices: dict = None,
+                 default_price: float = 100.0, buying_power: float = 100000.0, reject: dict = None,
+                 transient_failures: int = 0, lost_responses: int = 0, seed: int = None):
+        self.latency = latency
+        self.fill_delay = fill_delay
+        self.jitter = jitter
+        self.prices = dict(prices or {})
+        self.default_price = default_price
+        self.buying_power = buying_power
+        self.reject = dict(reject or {})
+        self.transient_failures = transient_failures
+        self.lost_responses = lost_responses
+        self.positions = {}
+        self.orders = {}
+        self.requests = Counter()
+        self.streams = []
+        self._rng = random.Random(seed)
+        self._lock = threading.RLock()
+        self._client_order_ids = itertools.count()
+
+    def _request(self, endpoint: str):
+        with self._lock:
+            self.requests[endpoint] += 1
+            delay = self.latency + (self.jitter * self._rng.random() if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+    def stream(self) -> FakeTradingStream:
+        """ A new trade update stream for this account. """
+        stream = FakeTradingStream()
+        self.streams.append(stream)
+        return stream
+
+    def set_price(self, symbol: str, price: float):
+        self.prices[symbol] = price
+
+    def set_position(self, symbol: str, qty: float, avg_entry_price: float):
+        """ Opens a position directly, without an order, negative qty for a short. """
+        with self._lock:
+            self.positions[symbol] = {'qty': qty, 'avg_entry_price': avg_entry_price, 'asset_id': uuid.uuid4()}
+
+    def price(self, symbol: str) -> float:
+        return self.prices.get(symbol, self.default_price)
+
+    def get_account(self) -> TradeAccount:
+        self._request('get_account')
+        return TradeAccount(id=uuid.uuid4(), account_number='FAKE', status=AccountStatus.ACTIVE,
+                            buying_power=str(self.buying_power), cash=str(self.buying_power))
+
+    def _position(self, symbol: str) -> Position:
+        position = self.positions[symbol]
+        qty, price = position['qty'], self.price(symbol)
+        cost_basis = qty * position['avg_entry_price']
+        return Position(asset_id=position['asset_id'], symbol=symbol, exchange=AssetExchange.NASDAQ,
+                        asset_class=AssetClass.US_EQUITY, avg_entry_price=str(position['avg_entry_price']),
+                        qty=str(qty), side=PositionSide.LONG if qty > 0 else PositionSide.SHORT,
+                        cost_basis=str(cost_basis), market_value=str(qty * price), current_price=str(price),
+                        unrealized_pl=str(qty * price - cost_basis),
+                        unrealized_plpc=str((qty * price - cost_basis) / abs(cost_basis)))
+
+    def get_all_positions(self) -> list:
+        self._request('get_all_positions')
+        with self._lock:
+            return [self._position(symbol) for symbol in self.positions]
+
+    def get_open_position(self, symbol_or_asset_id) -> Position:
+        self._request('get_open_position')
+        with self._lock:
+            if symbol_or_asset_id not in self.positions:
+                raise api_error(40410000, 'position does not exist', 404)
+            return self._position(symbol_or_asset_id)
+
+    def submit_order(self, order_data) -> Order:
+        self._request('submit_order')
+        with self._lock:
+            if self.transient_failures > 0:
+                self.transient_failures -= 1
+                raise api_error(42910000, 'rate limit exceeded', 429)
+            if order_data.symbol in self.reject:
+                raise api_error(self.reject[order_data.symbol], f'order for {order_data.symbol} rejected', 403)
+            if order_data.client_order_id is not None and any(order.client_order_id == order_data.client_order_id
+                                                              for order in self.orders.values()):
+                raise api_error(40010001, 'client_order_id must be unique', 422)
+            order = self._accept(order_data)
+            if self.lost_responses > 0:
+                self.lost_responses -= 1
+                raise api_error(50010000, 'internal server error', 503)
+            return order
+
+    def get_order_by_client_id(self, client_id) -> Order:
+        self._request('get_order_by_client_id')
+        with self._lock:
+            for order in self.orders.values():
+                if order.client_order_id == client_id:
+                    return order
+            raise api_error(40410000, 'order not found', 404)
+
+    def _accept(self, order_data) -> Order:
+        with self._lock:
+            now = datetime.now(timezone.utc)
+            client_order_id = getattr(order_data, 'client_order_id', None) or f'fake-{next(self._client_order_ids)}'
+            order = Order(id=uuid.uuid4(), client_order_id=client_order_id, created_at=now,
+                          updated_at=now, submitted_at=now, symbol=order_data.symbol, qty=str(order_data.qty),
+                          filled_qty='0', side=order_data.side, type=order_data.type,
+                          order_type=order_data.type, order_class=OrderClass.SIMPLE,
+                          time_in_force=order_data.time_in_force, status=OrderStatus.ACCEPTED,
+                          limit_price=str(getattr(order_data, 'limit_price', None) or '') or None,
+                          extended_hours=False)
+            self.orders[order.id] = order
+            self._publish(TradeEvent.NEW, order)
+            if self.fill_delay == 0:
+                self._fill(order.id)
+            else:
+                timer = threading.Timer(self.fill_delay, self._fill, [order.id])
+                timer.daemon = True
+                timer.start()
+            return self.orders[order.id]
+
+    def _fill(self, order_id):
+        """ Fills an open order in full at the current price, if it is a market order or a marketable limit. """
+        with self._lock:
+            order = self.orders[order_id]
+            if order.status not in OPEN_ORDER_STATUSES:
+                return
+            price = self.price(order.symbol)
+            if order.type == OrderType.LIMIT:
+                limit_price = float(order.limit_price)
+                if (order.side == OrderSide.BUY and price > limit_price) or \
+                        (order.side == OrderSide.SELL and price < limit_price):
+                    return
+            fill_qty = float(order.qty) * (1 if order.side == OrderSide.BUY else -1)
+            position_qty = self._apply_fill(order.symbol, fill_qty, price)
+            now = datetime.now(timezone.utc)
+            order = order.model_copy(update={'status': OrderStatus.FILLED, 'filled_qty': order.qty,
+                                             'filled_avg_price': str(price), 'filled_at': now, 'updated_at': now})
+            self.orders[order_id] = order
+            self._publish(TradeEvent.FILL, order, position_qty=position_qty, price=price, qty=float(order.qty))
+
+    def _apply_fill(self, symbol: str, fill_qty: float, price: float) -> float:
+        position = self.positions.get(symbol)
+        qty, avg_entry_price = (position['qty'], position['avg_entry_price']) if position else (0.0, price)
+        new_qty = round(qty + fill_qty, 9)
+        if qty == 0 or (qty > 0) == (fill_qty > 0):
+            avg_entry_price = (qty * avg_entry_price + fill_qty * price) / new_qty
+        elif abs(fill_qty) > abs(qty):
+            # The fill closed the position and opened one on the other side
+            avg_entry_price = price
+        if new_qty == 0:
+            self.positions.pop(symbol, None)
+        else:
+            self.positions[symbol] = {'qty': new_qty, 'avg_entry_price': avg_entry_price,
+                                      'asset_id': position['asset_id'] if position else uuid.uuid4()}
+        return new_qty
+
+    def _publish(self, event: TradeEvent, order: Order, **fields):
+        trade_update = TradeUpdate(event=event, order=order, timestamp=datetime.now(timezone.utc), **fields)
+        for stream in self.streams:
+            stream.publish(trade_update)
+
+    def get_order_by_id(self, order_id) -> Order:
+        self._request('get_order_by_id')
+        with self._lock:
+            if order_id not in self.orders:
+                raise api_error(40410000, 'order not found', 404)
+            return self.orders[order_id]
+
+    def cancel_order_by_id(self, order_id):
+        self._request('cancel_order_by_id')
+        with self._lock:
+            order = self.orders.get(order_id)
+            if order is None or order.status not in OPEN_ORDER_STATUSES:
+                raise api_error(42210000, 'order is not cancelable', 422)
+            self.orders[order_id] = order.model_copy(update={'status': OrderStatus.CANCELED,
+                                                             'canceled_at': datetime.now(timezone.utc)})
+            self._publish(TradeEvent.CANCELED, self.orders[order_id])
+
+    def _close_order(self, symbol: str) -> Order:
+        qty = self.positions[symbol]['qty']
+        return self._accept(MarketOrderRequest(symbol=symbol, qty=abs(qty), time_in_force=TimeInForce.DAY,
+                                               side=OrderSide.SELL if qty > 0 else OrderSide.BUY))
+
+    def close_position(self, symbol_or_asset_id) -> Order:
+        self._request('close_position')
+        with self._lock:
+            if symbol_or_asset_id not in self.positions:
+                raise api_error(40410000, 'position does not exist', 404)
+            return self._close_order(symbol_or_asset_id)
+
+    def close_all_positions(self, cancel_orders: bool = None) -> list:
+        self._request('close_all_positions')
+        with self._lock:
+            if cancel_orders:
+                for order_id, order in list(self.orders.items()):
+                    if order.status in OPEN_ORDER_STATUSES:
+                        self.orders[order_id] = order.model_copy(update={'status': OrderStatus.CANCELED})
+                        self._publish(TradeEvent.CANCELED, self.orders[order_id])
+            responses = []
+            for symbol in list(self.positions):
+                order = self._close_order(symbol)
+                responses.append(ClosePositionResponse(order_id=order.id, status=200, symbol=symbol, body=order))
+            return responses
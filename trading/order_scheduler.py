@@ -0,0 +1,158 @@
+import itertools
+import logging
+import queue
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from alpaca.common.exceptions import APIError
+
+# HTTP statuses worth retrying: rate limited or a server side failure
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def is_transient(error: Exception) -> bool:
+    """ Whether a failed request may succeed if retried, i.e. it was rate limited, timed out or hit a server error. """
+    if isinstance(error, APIError):
+        return error.status_code in TRANSIENT_STATUS_CODES
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket rate limiter.
+    Holds up to capacity tokens and refills at rate tokens per second, acquire blocks until a token is available.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class OrderScheduler:
+    """
+    Submits orders to the broker from a pool of worker threads without exceeding its request rate limit.
+    Orders wait in a priority queue, lowest priority value first and in submission order within a priority, so
+    a batch submitted together with one priority goes out back to back. Every request, retries included, takes a
+    token from a token bucket of burst tokens refilled at rate per second. Transient failures (rate limiting,
+    server errors, timeouts) are retried up to max_retries times with jittered exponential backoff, any other
+    error fails the order's future straight away. A request that failed may still have placed the order, so each
+    order is given a client_order_id once, before its first attempt, and every retry resends it: the broker
+    rejects the duplicate, and the order already placed under that id is looked up and returned instead of a
+    second position being opened. The same lookup runs before an order is failed after a retry, a server error or
+    a timeout, so the future only fails when the broker holds no order under its id.
+
+    Args:
+    client (TradingClient): Client the orders are submitted with.
+    rate (float): Sustained requests per second, Alpaca allows 200 per minute.
+    burst (int): Requests that may be sent at once before the rate applies.
+    n_workers (int): Orders in flight at the same time.
+    max_retries (int): Retries of a transiently failed order.
+    backoff (float): Seconds before the first retry, doubled on each retry after.
+    """
+
+    def __init__(self, client, rate: float = 3.0, burst: int = 10, n_workers: int = 8, max_retries: int = 3,
+                 backoff: float = 0.5):
+        self.client = client
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.requests = 0
+        self.retries = 0
+        self._counter_lock = threading.Lock()
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._workers = [threading.Thread(target=self._work, daemon=True, name=f'order-scheduler-{n}')
+                         for n in range(n_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, order_data, priority: int = 0) -> Future:
+        """ Queues an order request, the future resolves to the broker's order or the error it failed with, and
+        its completed_at holds the time.perf_counter() of the broker's final response. """
+        future = Future()
+        self._queue.put((priority, next(self._sequence), order_data, future))
+        return future
+
+    def submit_batch(self, orders: list, priority: int = 0) -> list:
+        """ Queues a batch of order requests with one priority, returns their futures in the same order. """
+        return [self.submit(order_data, priority) for order_data in orders]
+
+    def _work(self):
+        while True:
+            priority, sequence, order_data, future = self._queue.get()
+            if order_data is None:
+                return
+            if future.set_running_or_notify_cancel():
+                self._execute(order_data, future)
+
+    def _placed_order(self, client_order_id: str):
+        """ The order the broker holds under client_order_id, or None. """
+        self.bucket.acquire()
+        with self._counter_lock:
+            self.requests += 1
+        try:
+            return self.client.get_order_by_client_id(client_order_id)
+        except Exception:
+            return None
+
+    def _execute(self, order_data, future: Future):
+        if order_data.client_order_id is None:
+            order_data = order_data.model_copy(update={'client_order_id': str(uuid.uuid4())})
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            with self._counter_lock:
+                self.requests += 1
+            try:
+                order = self.client.submit_order(order_data=order_data)
+                future.completed_at = time.perf_counter()
+                future.set_result(order)
+                return
+            except Exception as e:
+                if attempt == self.max_retries or not is_transient(e):
+                    # Any attempt but a first one rejected outright may have placed the order: a later attempt then
+                    # fails as a duplicate, and a server error or timeout may have lost the broker's response
+                    if attempt > 0 or is_transient(e):
+                        order = self._placed_order(order_data.client_order_id)
+                        if order is not None:
+                            future.completed_at = time.perf_counter()
+                            future.set_result(order)
+                            return
+                    future.completed_at = time.perf_counter()
+                    future.set_exception(e)
+                    return
+                with self._counter_lock:
+                    self.retries += 1
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                logging.warning(f"Retrying {order_data.symbol} order in {delay:.2f}s after: {e}")
+                time.sleep(delay)
+
+    def close(self):
+        """ Stops the workers once the orders already queued have been submitted. """
+        for _ in self._workers:
+            self._queue.put((float('inf'), next(self._sequence), None, None))
+        for worker in self._workers:
+            worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import sys
+import time
+
+from alpaca.trading import TradeEvent
+
+# Order events after which the order is no longer working
+CLOSED_ORDER_EVENTS = {TradeEvent.FILL, TradeEvent.CANCELED, TradeEvent.EXPIRED, TradeEvent.REJECTED,
+                       TradeEvent.REPLACED}
+# Order events that change a position
+FILL_EVENTS = {TradeEvent.FILL, TradeEvent.PARTIAL_FILL}
+
+
+class PositionBook:
+    """
+    In-memory view of the account's positions and working orders.
+    Orders and position quantities are kept current from trade update events. Prices and unrealised profit only
+    change on the broker's side, so they are taken from position snapshots loaded with load_positions.
+    """
+
+    def __init__(self):
+        self.positions = {}
+        self.orders = {}
+        self.updated_at = None
+
+    def load_positions(self, positions: list):
+        """ Replaces the positions with a snapshot from TradingClient.get_all_positions. """
+        self.positions = {position.symbol: {'qty': float(position.qty),
+                                            'cost_basis': float(position.cost_basis),
+                                            'unrealized_pl': float(position.unrealized_pl or 0)}
+                          for position in positions}
+        self.updated_at = time.monotonic()
+
+    def apply_trade_update(self, trade_update) -> bool:
+        """
+        Applies a trade update event to the order book and, for fills, to the position quantity.
+        Returns True if a position changed, in which case the snapshot is stale until reloaded.
+        """
+        event, order = TradeEvent(trade_update.event), trade_update.order
+        if event in CLOSED_ORDER_EVENTS:
+            self.orders.pop(str(order.id), None)
+        else:
+            self.orders[str(order.id)] = order
+        self.updated_at = time.monotonic()
+
+        if event not in FILL_EVENTS:
+            return False
+        position_qty = float(trade_update.position_qty or 0)
+        if position_qty == 0:
+            self.positions.pop(order.symbol, None)
+        else:
+            self.positions.setdefault(order.symbol, {'qty': 0.0, 'cost_basis': 0.0, 'unrealized_pl': 0.0})
+            self.positions[order.symbol]['qty'] = position_qty
+        return True
+
+    def unrealised_profit_pc(self) -> float:
+        """ Unrealised profit across all positions as a percentage of their gross cost basis, so the long and short
+        legs of a hedge do not net each other out. """
+        cost_basis = sum(abs(position['cost_basis']) for position in self.positions.values())
+        if cost_basis == 0:
+            return 0
+        profit = sum(position['unrealized_pl'] for position in self.positions.values())
+        return round(profit * 100 / cost_basis, 3)
+
+
+class TpSlMonitor:
+    """
+    Event driven take profit / stop loss monitor.
+    Trade updates from the trading stream keep a PositionBook current and every fill triggers a tp/sl check
+    straight away. Without events the positions are re-polled every poll_interval seconds, and bursts of events
+    never reload them more than once per min_refresh_interval seconds. Runs on polling alone when no stream is
+    given. REST calls run in a worker thread so they never block the event loop. A failed poll or trade update is
+    logged and the next poll tries again, so a transient API error never leaves the positions unwatched; should
+    the stream itself die, run raises its error.
+
+    The stream is run through its _run_forever coroutine on the monitor's event loop, so the handler shares the
+    monitor's lock and events. The public TradingStream.run starts a loop of its own with asyncio.run and cannot
+    be used, so only stream objects with _run_forever, alpaca's TradingStream and FakeTradingStream, are supported.
+
+    Args:
+    alpaca (Alpaca): Account to monitor, its positions are closed when tp or sl is hit.
+    tp (float): Take profit threshold percentage.
+    sl (float): Stop loss threshold percentage.
+    stream: TradingStream, or any object with subscribe_trade_updates(handler) and an async _run_forever().
+    """
+
+    def __init__(self, alpaca, tp: float, sl: float, stream=None, poll_interval: float = 5.0,
+                 min_refresh_interval: float = 1.0):
+        assert tp > 0, "Take profit must be a positive value"
+        if stream is not None and not asyncio.iscoroutinefunction(getattr(stream, '_run_forever', None)):
+            raise TypeError("stream must have subscribe_trade_updates and an async _run_forever, like TradingStream")
+        self.alpaca = alpaca
+        self.tp = tp
+        self.sl = abs(sl) * -1
+        self.stream = stream
+        self.poll_interval = poll_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.book = PositionBook()
+        self.triggered = None
+        self.refreshes = 0
+        self._last_refresh = None
+        self._refresh_lock = asyncio.Lock()
+        self._done = None
+
+    async def refresh(self, force: bool = False):
+        """ Reloads the positions snapshot, at most once per min_refresh_interval unless forced. The reload also
+        refreshes the Alpaca snapshot, so everything else reading positions shares it. """
+        async with self._refresh_lock:
+            now = time.monotonic()
+            if not force and self._last_refresh is not None and now - self._last_refresh < self.min_refresh_interval:
+                return
+            positions = await asyncio.to_thread(self.alpaca.get_all_positions, True)
+            self.book.load_positions(positions)
+            self._last_refresh = time.monotonic()
+            self.refreshes += 1
+
+    async def check(self):
+        """ Closes all positions if the unrealised profit has crossed tp or sl. """
+        if self.triggered is not None or not self.book.positions:
+            return
+        profit_pc = self.book.unrealised_profit_pc()
+        sys.stdout.write("\r" + f'Current Profit: {profit_pc} %')
+        sys.stdout.flush()
+        if profit_pc > self.tp:
+            self.triggered = 'take_profit'
+            print("\nExecuting orders to take profit...")
+        elif profit_pc < self.sl:
+            self.triggered = 'stop_loss'
+            print("\nExecuting orders to stop loss")
+        else:
+            return
+        try:
+            await asyncio.to_thread(self.alpaca.close_all_positions)
+        except Exception:
+            # Not closed, the next check tries again
+            self.triggered = None
+            raise
+        self._done.set()
+
+    async def on_trade_update(self, trade_update):
+        """ Trade update handler registered with the stream. """
+        try:
+            if self.book.apply_trade_update(trade_update):
+                await self.refresh()
+                await self.check()
+        except Exception as e:
+            logging.error(f"Trade update failed, positions are checked again on the next poll: {e}")
+
+    async def _poll(self):
+        while not self._done.is_set():
+            try:
+                await self.refresh()
+                await self.check()
+            except Exception as e:
+                logging.error(f"Position check failed, retrying in {self.poll_interval}s: {e}")
+            try:
+                await asyncio.wait_for(self._done.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self) -> str:
+        """ Monitors until tp or sl is hit and the positions are closed, returns 'take_profit' or 'stop_loss'. """
+        self._done = asyncio.Event()
+        await self.refresh(force=True)
+        tasks = [asyncio.create_task(self._poll())]
+        if self.stream is not None:
+            self.stream.subscribe_trade_updates(self.on_trade_update)
+            tasks.append(asyncio.create_task(self.stream._run_forever()))
+        done = asyncio.create_task(self._done.wait())
+        try:
+            await asyncio.wait([done, *tasks], return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                if task.done() and not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+        finally:
+            tasks.append(done)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self.stream is not None:
+                try:
+                    await self.stream.stop_ws()
+                except Exception as e:
+                    logging.error(e)
+        return self.triggered
+
+    def stop(self):
+        """ Stops the monitor without closing any positions. """
+        if self._done is not None:
+            self._done.set()
@@ -2,11 +2,17 @@ import time
 from functools import wraps
 import logging
 
+from utils.profiling import profiled
+
 # Configure the logging; you can adjust the level and format as needed
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
 def timeit(func):
+    """ Logs how long each call of func took. While utils.profiling is enabled the calls are also recorded as
+    spans, so repeated and nested calls are aggregated there. """
+    func = profiled(func)
+
     @wraps(func)
     def timeit_wrapper(*args, **kwargs):
         start_time = time.perf_counter()
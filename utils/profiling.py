@@ -0,0 +1,254 @@
+import atexit
+import cProfile
+import json
+import os
+import random
+import threading
+import time
+import tracemalloc
+from functools import wraps
+
+# Durations kept per span for its percentiles, sampled uniformly once a span has been entered more often
+RESERVOIR_SIZE = 1024
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+class SpanStats:
+    """ Aggregated timings of every call of one span path. """
+
+    __slots__ = ('count', 'total', 'min', 'max', 'memory_delta', 'samples', '_rng')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+        self.memory_delta = 0
+        self.samples = []
+        self._rng = random.Random(0)
+
+    def add(self, seconds: float, memory_delta: int = 0):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.memory_delta += memory_delta
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(seconds)
+        else:
+            n = self._rng.randrange(self.count)
+            if n < RESERVOIR_SIZE:
+                self.samples[n] = seconds
+
+    def percentile(self, q: float) -> float:
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+
+    def to_dict(self) -> dict:
+        stats = {'count': self.count, 'total_seconds': self.total, 'mean_seconds': self.total / self.count,
+                 'min_seconds': self.min, 'max_seconds': self.max, 'memory_delta_bytes': self.memory_delta}
+        for q in PERCENTILES:
+            stats[f'p{round(q * 100)}_seconds'] = self.percentile(q)
+        return stats
+
+
+class _Span:
+    """ Context manager timing one entry of a span, nested inside whatever span this thread is already in. """
+
+    __slots__ = ('profiler', 'name', 'path', 'start_time', 'start_memory')
+
+    def __init__(self, profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        stack = self.profiler._stack()
+        self.path = f'{stack[-1]}/{self.name}' if stack else self.name
+        stack.append(self.path)
+        self.start_memory = tracemalloc.get_traced_memory()[0] if self.profiler.memory else 0
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start_time
+        memory_delta = tracemalloc.get_traced_memory()[0] - self.start_memory if self.profiler.memory else 0
+        self.profiler._stack().pop()
+        self.profiler._record(self.path, seconds, memory_delta)
+        return False
+
+
+class _NullSpan:
+    """ What span returns while profiling is disabled. """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Profiler:
+    """
+    Collects nested spans: each span is keyed by its path of enclosing spans on the same thread, e.g.
+    'screen.adf/run_adf_on_best_pairs/adf_test', and aggregates the call count, total, min, max and percentile
+    durations of every entry. Optionally tracks the traced memory delta of each span with tracemalloc and runs
+    cProfile alongside. Disabled, span returns a shared no-op context manager and profiled functions are called
+    straight through after one attribute check.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.stats = {}
+        self.cprofile = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started_tracemalloc = False
+
+    def enable(self, memory: bool = False, cprofile: bool = False):
+        """
+        Starts collecting spans.
+
+        Args:
+        memory (bool): Also record each span's change in memory traced by tracemalloc, started if need be.
+        cprofile (bool): Also run cProfile over the same period, see dump_cprofile.
+        """
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self.memory = memory
+        if cprofile and self.cprofile is None:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        self.enabled = True
+
+    def disable(self):
+        """ Stops collecting spans, the stats collected so far are kept. """
+        self.enabled = False
+        self.memory = False
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+        self.cprofile = None
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, path: str, seconds: float, memory_delta: int):
+        with self._lock:
+            stats = self.stats.get(path)
+            if stats is None:
+                stats = self.stats[path] = SpanStats()
+            stats.add(seconds, memory_delta)
+
+    def span(self, name: str):
+        """ Context manager timing its block as a span called name. """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def to_dict(self) -> dict:
+        """ Span path -> its aggregated stats. """
+        with self._lock:
+            return {path: stats.to_dict() for path, stats in sorted(self.stats.items())}
+
+    def summary(self) -> str:
+        """ The spans as a text table, slowest total first. """
+        rows = sorted(self.to_dict().items(), key=lambda item: item[1]['total_seconds'], reverse=True)
+        width = max([len(path) for path, _ in rows] + [4])
+        lines = [f"{'span':<{width}} {'calls':>8} {'total s':>10} {'mean ms':>10} {'p50 ms':>9} {'p99 ms':>9}"]
+        for path, stats in rows:
+            lines.append(f"{path:<{width}} {stats['count']:>8} {stats['total_seconds']:>10.4f} "
+                         f"{stats['mean_seconds'] * 1000:>10.3f} {stats['p50_seconds'] * 1000:>9.3f} "
+                         f"{stats['p99_seconds'] * 1000:>9.3f}")
+        return '\n'.join(lines)
+
+    def export_json(self, path: str):
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def export_prometheus(self, path: str, prefix: str = 'pairs'):
+        """ Writes the spans in the Prometheus text exposition format, as a summary per span. """
+        spans = [(span_path.replace('\\', '\\\\').replace('"', '\\"'), stats)
+                 for span_path, stats in self.to_dict().items()]
+        # Samples of a metric family must be contiguous
+        lines = [f'# TYPE {prefix}_span_seconds summary']
+        for label, stats in spans:
+            for q in PERCENTILES:
+                lines.append(f'{prefix}_span_seconds{{span="{label}",quantile="{q}"}} '
+                             f'{stats[f"p{round(q * 100)}_seconds"]}')
+            lines.append(f'{prefix}_span_seconds_sum{{span="{label}"}} {stats["total_seconds"]}')
+            lines.append(f'{prefix}_span_seconds_count{{span="{label}"}} {stats["count"]}')
+        lines.append(f'# TYPE {prefix}_span_memory_delta_bytes gauge')
+        for label, stats in spans:
+            lines.append(f'{prefix}_span_memory_delta_bytes{{span="{label}"}} {stats["memory_delta_bytes"]}')
+        with open(path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+
+    def export(self, path: str):
+        """ Exports in the Prometheus format if path ends in .prom, otherwise as JSON. """
+        if path.endswith('.prom'):
+            self.export_prometheus(path)
+        else:
+            self.export_json(path)
+
+    def dump_cprofile(self, path: str):
+        """ Writes the cProfile stats collected since enable(cprofile=True), for pstats or snakeviz. """
+        if self.cprofile is None:
+            raise RuntimeError("cProfile was not enabled, use enable(cprofile=True)")
+        self.cprofile.dump_stats(path)
+
+
+profiler = Profiler()
+
+
+def enable(memory: bool = False, cprofile: bool = False):
+    profiler.enable(memory=memory, cprofile=cprofile)
+
+
+def disable():
+    profiler.disable()
+
+
+def span(name: str):
+    """ Times a block as a span of the module profiler: with span('download'): ... """
+    return profiler.span(name)
+
+
+def profiled(func=None, name: str = None):
+    """ Decorator timing every call of a function as a span of the module profiler, named after the function
+    unless name is given. Usable bare, @profiled, or with arguments, @profiled(name='adf'). """
+    if func is None:
+        return lambda inner: profiled(inner, name=name)
+    span_name = name or func.__qualname__
+
+    @wraps(func)
+    def profiled_wrapper(*args, **kwargs):
+        if not profiler.enabled:
+            return func(*args, **kwargs)
+        with _Span(profiler, span_name):
+            return func(*args, **kwargs)
+
+    return profiled_wrapper
+
+
+# PAIRS_PROFILE=1 turns profiling on for the whole run, PAIRS_PROFILE=memory adds memory deltas, and
+# PAIRS_PROFILE_EXPORT=<path>.json|.prom writes the spans when the interpreter exits
+if os.environ.get('PAIRS_PROFILE'):
+    enable(memory=os.environ['PAIRS_PROFILE'] == 'memory')
+    if os.environ.get('PAIRS_PROFILE_EXPORT'):
+        atexit.register(profiler.export, os.environ['PAIRS_PROFILE_EXPORT'])